@@ -0,0 +1,242 @@
+"""End-to-end throughput benchmark of FreelancerSpider and GigFinderPipeline.
+
+Replays a directory of recorded category and listing pages (mapped to their
+URLs by a manifest.json) through a full Scrapy crawl, storing items in an
+in-process moto DynamoDB, so no network is used. Reports pages/sec,
+items/sec, DynamoDB calls per item, peak RSS and p50/p99 per-item pipeline
+latency, and writes them as JSON so runs can be compared over time.
+
+    python benchmarks/e2e.py [--pages benchmarks/fixtures/pages] [--runs 2] [-a incremental=true] [--output results.json]
+
+Per-item latency is measured from process_item until the batch holding the
+item has been written (or until the item is dropped).
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "gig_finder"))
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "gig_finder.settings")
+for variable in ("AWS_ACCESS_KEY", "AWS_SECRET_KEY"):
+    os.environ[variable] = "testing"  # Never reach a real account from the benchmark
+os.environ["AWS_REGION"] = "us-east-1"
+
+import botocore.client  # noqa: E402
+from moto import mock_aws  # noqa: E402
+from scrapy.crawler import CrawlerRunner  # noqa: E402
+from scrapy.http import HtmlResponse  # noqa: E402
+from scrapy.utils.log import configure_logging  # noqa: E402
+from scrapy.utils.project import get_project_settings  # noqa: E402
+from scrapy.utils.reactor import install_reactor  # noqa: E402
+from twisted.internet import defer  # noqa: E402
+
+from gig_finder.exporters import ParquetExportPipeline  # noqa: E402
+from gig_finder.normalizer import BASE_URL  # noqa: E402
+from gig_finder.pipelines import GigFinderPipeline  # noqa: E402
+from gig_finder.spiders.freelancer import FreelancerSpider  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class ReplayDownloadHandler:
+    """Download handler answering from the recorded pages, with a 404 for unknown URLs.
+
+    Requests still go through the downloader middlewares and download slots,
+    only the network round trip is replaced.
+    """
+
+    lazy = False
+
+    def __init__(self, pages_dir):
+        self.pages_dir = pages_dir
+        with open(os.path.join(pages_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.bodies = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get("REPLAY_PAGES_DIR"))
+
+    def download_request(self, request, spider):
+        filename = self.manifest.get(request.url)
+        if filename is None:
+            return defer.succeed(HtmlResponse(url=request.url, status=404, body=b"", request=request))
+        if filename not in self.bodies:
+            with open(os.path.join(self.pages_dir, filename), "rb") as f:
+                self.bodies[filename] = f.read()
+        return defer.succeed(HtmlResponse(url=request.url, body=self.bodies[filename], encoding="utf-8", request=request))
+
+
+class TimedPipeline(GigFinderPipeline):
+    """GigFinderPipeline recording how long each item takes to be stored."""
+
+    latencies = []
+    lock = threading.Lock()
+
+    def open_spider(self, spider):
+        self.enqueued = {}
+        return super().open_spider(spider)
+
+    def process_item(self, item, spider):
+        start = time.perf_counter()
+        item_id = f"{BASE_URL}{item.get('_id', '')}"
+        with self.lock:
+            self.enqueued.setdefault(item_id, []).append(start)
+        result = super().process_item(item, spider)
+        if result is None:
+            self.record([item_id])
+        return result
+
+    def write_batch(self, items, spider):
+        super().write_batch(items, spider)
+        self.record([item['_id'] for item in items])
+
+    def record(self, item_ids):
+        end = time.perf_counter()
+        with self.lock:
+            for item_id in item_ids:
+                self.latencies.extend(end - start for start in self.enqueued.pop(item_id, []))
+
+
+DYNAMODB_CALLS = Counter()
+
+
+def count_dynamodb_calls():
+    """Count every DynamoDB API call made through botocore in DYNAMODB_CALLS, by operation name."""
+    make_api_call = botocore.client.BaseClient._make_api_call
+    lock = threading.Lock()
+
+    def counting_make_api_call(client, operation_name, api_params):
+        if client.meta.service_model.service_name == "dynamodb":
+            with lock:
+                DYNAMODB_CALLS[operation_name] += 1
+        return make_api_call(client, operation_name, api_params)
+
+    botocore.client.BaseClient._make_api_call = counting_make_api_call
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of the sorted values fall."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def git_revision():
+    """Return the current commit, so results can be matched to the code they measured."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@defer.inlineCallbacks
+def crawl(settings, runs, results, spider_args):
+    """Run the crawls one after the other on the same reactor and table."""
+    from twisted.internet import reactor
+    runner = CrawlerRunner(settings)
+    for run in range(runs):
+        DYNAMODB_CALLS.clear()
+        TimedPipeline.latencies = []
+
+        crawler = runner.create_crawler(FreelancerSpider)
+        start = time.perf_counter()
+        yield runner.crawl(crawler, **spider_args)
+        elapsed = time.perf_counter() - start
+        calls = dict(DYNAMODB_CALLS)
+
+        stats = crawler.stats.get_stats()
+        pages = stats.get("downloader/response_status_count/200", 0)
+        items = stats.get("item_scraped_count", 0)
+        results.append({
+            "run": run + 1,
+            "elapsed_sec": elapsed,
+            "pages": pages,
+            "items": items,
+            "pages_per_sec": pages / elapsed,
+            "items_per_sec": items / elapsed,
+            "dynamodb_calls": calls,
+            "dynamodb_calls_per_item": sum(calls.values()) / items if items else None,
+            "pipeline_latency_p50_ms": (percentile(TimedPipeline.latencies, 0.50) or 0) * 1000,
+            "pipeline_latency_p99_ms": (percentile(TimedPipeline.latencies, 0.99) or 0) * 1000,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "stats": {key: value for key, value in stats.items() if key.startswith("gig_finder/")},
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default=os.path.join(FIXTURES_DIR, "pages"), help="directory of recorded pages")
+    parser.add_argument("--runs", type=int, default=2, help="consecutive crawls against the same table")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/e2e-<timestamp>.json)")
+    parser.add_argument("-a", dest="spider_args", action="append", default=[], metavar="NAME=VALUE",
+                        help="spider argument, as for scrapy crawl")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        settings = get_project_settings()
+        settings.setdict({
+            "REPLAY_PAGES_DIR": os.path.abspath(args.pages),
+            "DOWNLOAD_HANDLERS": {"http": ReplayDownloadHandler, "https": ReplayDownloadHandler},
+            "ITEM_PIPELINES": {TimedPipeline: 300, ParquetExportPipeline: 400},
+            "ROBOTSTXT_OBEY": False,
+            "DOWNLOAD_DELAY": 0,
+            "AUTOTHROTTLE_ENABLED": False,
+            "LOCAL_INDEX_DIR": os.path.join(state_dir, "local_index"),
+            "TAG_YIELDS_FILE": os.path.join(state_dir, "tag_yields.json"),
+            "CHECKPOINT_DIR": os.path.join(state_dir, "checkpoints"),
+            "CATEGORY_CACHE_FILE": os.path.join(state_dir, "categories.json"),
+            "FULL_CRAWL_LOG_FILE": os.path.join(state_dir, "full_crawls.json"),
+            "PARQUET_EXPORT_DIR": os.path.join(state_dir, "exports"),
+            "RELEVANCE_STORE_FILE": os.path.join(state_dir, "relevance.sqlite"),
+            "LOG_LEVEL": args.log_level,
+        }, priority="cmdline")
+        configure_logging(settings)
+        install_reactor(settings["TWISTED_REACTOR"])
+        from twisted.internet import reactor
+
+        results = []
+        count_dynamodb_calls()
+        with mock_aws():
+            def run():
+                spider_args = dict(argument.split("=", 1) for argument in args.spider_args)
+                crawl(settings, args.runs, results, spider_args).addErrback(
+                    lambda failure: print(failure.getTraceback(), file=sys.stderr)
+                ).addBoth(lambda _: reactor.stop())
+
+            reactor.callWhenRunning(run)
+            reactor.run()
+        if not results:
+            sys.exit("The benchmark crawl failed")
+
+    report = {
+        "benchmark": "e2e",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "pages_dir": os.path.abspath(args.pages),
+        "runs": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"e2e-{datetime.datetime.now(datetime.timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark and parity check of the job card extraction in FreelancerSpider.parse_job_tag.
+
+Runs the previous per-field relative XPath queries and extract_job_cards
+over every cached listing page in a directory, fails if their outputs
+differ and reports cards/sec for each.
+
+    python benchmarks/extraction.py [--pages benchmarks/fixtures/pages] [--rounds 20]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from scrapy.http import HtmlResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "gig_finder"))
+
+from gig_finder.extractors import extract_job_cards  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def legacy_extract_job_cards(response):
+    """Extraction as it was done in FreelancerSpider.parse_job_tag."""
+    job_cards = response.xpath('//div[contains(@class, "JobSearchCard-item-inner")]')
+    return [
+        {
+            "_id": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-heading-link")]/@href').get(),
+            "title": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-heading-link")]/text()').get(),
+            "description": job_card.xpath('.//p[contains(@class, "JobSearchCard-primary-description")]/text()').get(),
+            "status": job_card.xpath('.//span[contains(@class, "JobSearchCard-primary-heading-days")]/text()').get(),
+            "tag_links": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-tagsLink")]/@href').getall(),
+            "tags": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-tagsLink")]/text()').getall(),
+            "price": job_card.xpath('.//div[contains(@class, "JobSearchCard-primary-price")]/text()').get(),
+            "offers": job_card.xpath('.//div[contains(@class, "JobSearchCard-secondary-entry")]/text()').get(),
+            "types": job_card.xpath('.//span[contains(@class, "promotion-tag")]/text()').getall(),
+            "verified_payment": bool(job_card.xpath('.//div[contains(@class, "JobSearchCard-primary-heading-status")]')),
+        }
+        for job_card in job_cards
+    ]
+
+
+def load_responses(pages_dir):
+    """Build a response for every cached HTML page in the directory."""
+    responses = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        with open(path, "rb") as f:
+            body = f.read()
+        url = f"https://www.freelancer.com/jobs/{os.path.splitext(os.path.basename(path))[0]}/"
+        responses.append(HtmlResponse(url=url, body=body, encoding="utf-8"))
+    return responses
+
+
+def bench(extract, responses, rounds):
+    """Return cards/sec of an extraction function, parsing every page again each round."""
+    cards = 0
+    elapsed = 0.0
+    for _ in range(rounds):
+        # Fresh responses so each round pays for building the lxml tree, as a crawl does
+        fresh = [response.replace(body=response.body) for response in responses]
+        start = time.perf_counter()
+        for response in fresh:
+            cards += len(extract(response))
+        elapsed += time.perf_counter() - start
+    return cards / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default=os.path.join(FIXTURES_DIR, "pages"), help="directory of cached listing pages")
+    parser.add_argument("--rounds", type=int, default=20, help="passes over the pages per extractor")
+    args = parser.parse_args()
+
+    responses = load_responses(args.pages)
+    if not responses:
+        sys.exit(f"No .html pages found in {args.pages}")
+
+    mismatches = 0
+    for response in responses:
+        legacy = legacy_extract_job_cards(response)
+        current = extract_job_cards(response.selector.root)
+        if legacy != current:
+            mismatches += 1
+            print(f"Extraction differs on {response.url}", file=sys.stderr)
+    if mismatches:
+        sys.exit(f"{mismatches} page(s) extracted differently")
+
+    results = {
+        "pages": len(responses),
+        "legacy_cards_per_sec": bench(legacy_extract_job_cards, responses, args.rounds),
+        "extractor_cards_per_sec": bench(lambda response: extract_job_cards(response.selector.root),
+                                         responses, args.rounds),
+    }
+    results["speedup"] = results["extractor_cards_per_sec"] / results["legacy_cards_per_sec"]
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Generate the category and job listing pages used by the benchmarks.
+
+The pages reproduce the markup of freelancer.com job search cards (heading
+link, days left, verified badge, description, tags, promotion tags, price
+and bids/entries) with seeded random content, so the fixtures are stable
+and contain no real project data. About a quarter of the cards are
+repeated across pages, as projects listed under several tags are.
+
+    python benchmarks/fixtures/make_pages.py
+"""
+import html
+import json
+import os
+import random
+
+random.seed(7)
+OUT = os.path.join(os.path.dirname(__file__), "pages")
+WORDS = "python scraper data website api django react dashboard machine learning model dataset cleaning excel automation bot wordpress shopify landing page design backend database mysql postgres aws lambda deploy fix bug mobile app flutter chatbot openai integration pipeline etl tableau power bi report analysis".split()
+TAGS = [("Python", "/jobs/python/"), ("Web Scraping", "/jobs/web-scraping/"), ("Data Entry", "/jobs/data-entry/"),
+        ("PHP", "/jobs/php/"), ("JavaScript", "/jobs/javascript/"), ("Machine Learning (ML)", "/jobs/machine-learning/"),
+        ("Excel", "/jobs/excel/"), ("WordPress", "/jobs/wordpress/"), ("HTML", "/jobs/html/"), ("MySQL", "/jobs/mysql/"),
+        ("Artificial Intelligence", "/jobs/artificial-intelligence/"), ("Data Processing", "/jobs/data-processing/"),
+        ("Website Design", "/jobs/website-design/"), ("React.js", "/jobs/reactjs/"), ("Django", "/jobs/django/")]
+PRICES = ["$250 - $750 USD", "$10 - $30 USD", "$30 - $250 USD", "$750 - $1500 USD", "$15 - $25 USD / hr",
+          "$8 - $15 USD / hr", "$30 - $250 AUD", "€30 - €250 EUR", "£20 - £250 GBP", "₹1500 - ₹12500 INR",
+          "₹100 - ₹400 INR / hr", "$1500 - $3000 USD", "$25 - $50 USD / hr", "$30 - $250 CAD", "N/A"]
+STATUSES = ["6 days left", "5 days left", "4 days left", "3 days left", "2 days left", "1 day left", "23 hours left", "Ended"]
+PROMOS = [["Urgent"], ["Featured"], ["Sealed"], ["NDA"], ["Urgent", "Sealed"], ["Full Time"]]
+
+def sentence(n):
+    return " ".join(random.choice(WORDS) for _ in range(n))
+
+pid = [0]
+def card(tag):
+    pid[0] += 1
+    title = sentence(random.randint(3, 7)).capitalize()
+    slug = "-".join(title.lower().split()) + f"-{38000000 + pid[0]}"
+    tag_path = tag[1].strip('/').split('/')[-1]
+    tags = random.sample(TAGS, random.randint(1, 5))
+    if tag not in tags:
+        tags[0] = tag
+    price = random.choice(PRICES)
+    contest = random.random() < 0.08
+    private = random.random() < 0.03
+    offers = f"{random.randint(1, 60)} {'entries' if contest else 'bids'}" if random.random() > 0.05 else None
+    if random.random() < 0.03:
+        offers = "1 bid"
+    verified = random.random() < 0.6
+    promos = random.choice(PROMOS) if random.random() < 0.2 else []
+    desc = sentence(random.randint(15, 40)).capitalize() + "."
+    if random.random() < 0.2:
+        desc_html = f"\n            {html.escape(desc[:40])} <br>{html.escape(desc[40:])}\n        "
+    else:
+        desc_html = f"\n            {html.escape(desc)}\n        "
+    parts = []
+    parts.append('<div class="JobSearchCard-item ">\n  <div class="JobSearchCard-item-inner" data-project-card="true">\n')
+    parts.append('    <div class="JobSearchCard-primary">\n      <div class="JobSearchCard-primary-heading">\n')
+    parts.append(f'        <a href="/projects/{tag_path}/{slug}" class="JobSearchCard-primary-heading-link" data-qtsb-section="page-job-search-new" data-qtsb-subsection="card-job" data-qtsb-label="link-project-title" data-heading-link="true">\n            {html.escape(title)}\n        </a>\n')
+    parts.append(f'        <span class="JobSearchCard-primary-heading-days" data-cy="job-card-days-left">{random.choice(STATUSES)}</span>\n')
+    if verified:
+        parts.append('        <div class="JobSearchCard-primary-heading-status Tooltip--top" data-tooltip="This employer\'s payment method has been verified."><span class="Icon Icon--small"><!-- verified icon --></span> Verified</div>\n')
+    parts.append('      </div>\n')
+    parts.append(f'      <p class="JobSearchCard-primary-description">{desc_html}</p>\n')
+    parts.append('      <div class="JobSearchCard-primary-tags">\n')
+    for name, link in tags:
+        parts.append(f'        <a href="{link}" class="JobSearchCard-primary-tagsLink">{html.escape(name)}</a>\n')
+    parts.append('      </div>\n')
+    if promos:
+        parts.append('      <div class="JobSearchCard-primary-promotion">\n')
+        for p in promos:
+            parts.append(f'        <span class="promotion-tag promotion-tag-{p.lower().replace(" ", "-")}">{p}</span>\n')
+        parts.append('      </div>\n')
+    if not private:
+        parts.append(f'      <div class="JobSearchCard-primary-price{" JobSearchCard-primary-price--contest" if contest else ""}">\n          {html.escape(price)}\n          <span class="JobSearchCard-primary-avgBit">Avg Bid</span>\n      </div>\n')
+    parts.append('    </div>\n    <div class="JobSearchCard-secondary">\n')
+    if offers:
+        parts.append(f'      <div class="JobSearchCard-secondary-entry">{offers}</div>\n')
+    parts.append('    </div>\n  </div>\n</div>\n')
+    return "".join(parts)
+
+generated = []
+def listed_card(tag):
+    # The same project is listed under every one of its tags
+    if generated and random.random() < 0.25:
+        return random.choice(generated)
+    generated.append(card(tag))
+    return generated[-1]
+
+def page(tag, n, last, cards=50):
+    base = tag[1].rstrip('/')
+    head = f'<!DOCTYPE html>\n<html lang="en">\n<head><meta charset="utf-8"><title>{html.escape(tag[0])} Jobs | Freelancer</title></head>\n<body>\n<main class="PageJob">\n<h1 class="PageProjectSearch-title">{html.escape(tag[0])} Jobs</h1>\n<div id="project-list" class="JobSearchCard-list">\n'
+    body = "".join(listed_card(tag) for _ in range(cards))
+    pag = ['<ul class="Pagination">\n']
+    if n > 1:
+        pag.append(f'  <li><a class="Pagination-item" href="{base}/">First</a></li>\n')
+        pag.append(f'  <li><a class="Pagination-item" href="{base}/{n - 1}/" rel="prev">Prev</a></li>\n')
+    for k in range(max(1, n - 2), min(last, n + 2) + 1):
+        cls = "Pagination-item" + (" Pagination-item--active" if k == n else "")
+        pag.append(f'  <li><a class="{cls}" href="{base}/{k}/">{k}</a></li>\n')
+    if n < last:
+        pag.append(f'  <li><a class="Pagination-item" href="{base}/{n + 1}/" rel="next">Next</a></li>\n')
+        pag.append(f'  <li><a class="Pagination-item" href="{base}/{last}/">Last</a></li>\n')
+    pag.append('</ul>\n')
+    return head + body + "</div>\n" + "".join(pag) + "</main>\n</body>\n</html>\n"
+
+CATEGORIES = [
+    ("Websites, IT &amp; Software", [TAGS[0], TAGS[1]]),
+    ("Data Entry &amp; Admin", [TAGS[2]]),
+]
+
+def category_page():
+    sections = []
+    for title, tags in CATEGORIES:
+        links = "".join(
+            f'        <li><a class="PageJob-category-link" href="{link}" title="{html.escape(name)}">{html.escape(name)}</a></li>\n'
+            for name, link in tags
+        )
+        # Contest links are skipped by the spider
+        links += f'        <li><a class="PageJob-category-link" href="/contest/{tags[0][1].strip("/").split("/")[-1]}-contests/" title="{html.escape(tags[0][0])} Contests">{html.escape(tags[0][0])} Contests</a></li>\n'
+        sections.append(
+            f'  <section class="PageJob-category">\n    <header class="PageJob-category-header"><h3 class="PageJob-category-title">{title} ({random.randint(1000, 90000)})</h3></header>\n'
+            f'    <ul class="PageJob-category-list">\n{links}    </ul>\n  </section>\n'
+        )
+    return ('<!DOCTYPE html>\n<html lang="en">\n<head><meta charset="utf-8"><title>Browse Jobs | Freelancer</title></head>\n'
+            '<body>\n<main class="PageJob">\n' + "".join(sections) + '</main>\n</body>\n</html>\n')
+
+if __name__ == '__main__':
+    os.makedirs(OUT, exist_ok=True)
+    manifest = {"https://www.freelancer.com/job/": "job.html"}
+    for tag in TAGS[:3]:
+        for n in range(1, 3):
+            name = tag[1].strip('/').split('/')[-1]
+            with open(os.path.join(OUT, f"{name}-{n}.html"), "w", encoding="utf-8") as f:
+                f.write(page(tag, n, 2))
+            url = f"https://www.freelancer.com{tag[1]}" + (f"{n}/" if n > 1 else "")
+            manifest[url] = f"{name}-{n}.html"
+    with open(os.path.join(OUT, "job.html"), "w", encoding="utf-8") as f:
+        f.write(category_page())
+    # URL -> file map used to replay the pages without network access
+    with open(os.path.join(OUT, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
@@ -0,0 +1,113 @@
+"""Benchmark of PackedCacheStorage against Scrapy's FilesystemCacheStorage.
+
+Stores the cached listing pages of a directory, under distinct URLs, in both
+HTTP cache storages, then reads every response back in random order, and
+reports for each the bytes, allocated bytes and files on disk and the
+responses stored and retrieved per second.
+
+    python benchmarks/httpcache.py [--pages benchmarks/fixtures/pages] [--responses 5000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+from scrapy.utils.request import RequestFingerprinter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "gig_finder"))
+
+from gig_finder.httpcache import PackedCacheStorage  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class BenchmarkCrawler:
+    request_fingerprinter = RequestFingerprinter()
+
+
+class BenchmarkSpider:
+    name = "freelancer"
+    today = "2024-01-01"
+    crawler = BenchmarkCrawler()
+
+
+def load_pages(pages_dir):
+    pages = []
+    for name in sorted(os.listdir(pages_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(pages_dir, name), "rb") as f:
+                pages.append(f.read())
+    return pages
+
+
+def disk_usage(directory):
+    """Return the bytes, the bytes allocated on disk and the number of files under a directory."""
+    size = allocated = files = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            size += stat.st_size
+            allocated += stat.st_blocks * 512  # Each small file takes at least a whole block
+            files += 1
+    return size, allocated, files
+
+
+def measure(storage_class, pages, count):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        settings = Settings({"HTTPCACHE_DIR": cache_dir, "HTTPCACHE_EXPIRATION_SECS": 0, "HTTPCACHE_GZIP": True})
+        storage = storage_class(settings)
+        spider = BenchmarkSpider()
+        storage.open_spider(spider)
+        requests = [
+            Request(f"https://www.freelancer.com/jobs/tag-{index}/{index % 50 + 1}/", meta={"tag": f"tag-{index}"})
+            for index in range(count)
+        ]
+        start = time.perf_counter()
+        for index, request in enumerate(requests):
+            response = HtmlResponse(request.url, body=pages[index % len(pages)], headers={"Content-Type": "text/html"})
+            storage.store_response(spider, request, response)
+        stored = count / (time.perf_counter() - start)
+        storage.close_spider(spider)
+        size, allocated, files = disk_usage(cache_dir)
+
+        storage.open_spider(spider)
+        random.Random(0).shuffle(requests)
+        start = time.perf_counter()
+        for request in requests:
+            if storage.retrieve_response(spider, request) is None:
+                sys.exit(f"{storage_class.__name__} lost {request.url}")
+        retrieved = count / (time.perf_counter() - start)
+        storage.close_spider(spider)
+    return {"bytes": size, "allocated_bytes": allocated, "files": files,
+            "stored_per_sec": stored, "retrieved_per_sec": retrieved}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default=os.path.join(FIXTURES_DIR, "pages"), help="directory of cached listing pages")
+    parser.add_argument("--responses", type=int, default=5000, help="responses stored in each storage")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        sys.exit(f"No pages found in {args.pages}")
+    results = {
+        "filesystem_gzip": measure(FilesystemCacheStorage, pages, args.responses),
+        "packed_zstd": measure(PackedCacheStorage, pages, args.responses),
+    }
+    results["bytes_ratio"] = results["packed_zstd"]["bytes"] / results["filesystem_gzip"]["bytes"]
+    results["allocated_bytes_ratio"] = (results["packed_zstd"]["allocated_bytes"]
+                                        / results["filesystem_gzip"]["allocated_bytes"])
+    results["retrieve_speedup"] = (results["packed_zstd"]["retrieved_per_sec"]
+                                   / results["filesystem_gzip"]["retrieved_per_sec"])
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark of the JobItem model against the plain dicts the spider used to yield.
+
+Extracts the job cards of every cached listing page in a directory, again
+and again as a deep crawl would, once as dicts and once as JobItems, and
+reports for each:
+
+- the memory per item while it waits in the scraper (after extraction) and
+  in a pipeline batch (after normalization), measured with tracemalloc;
+- items/sec of the extraction, and of the normalization followed by the
+  conversion to the DynamoDB wire format (boto3's TypeSerializer for the
+  dicts, as the resource batch writer did, and JobItem.to_dynamodb).
+
+Timings vary a lot from one run to the next, so each is the median of
+--repeat runs alternating between dicts and JobItems. Fails if the two wire
+formats differ.
+
+    python benchmarks/items.py [--pages benchmarks/fixtures/pages] [--items 20000] [--repeat 5]
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from boto3.dynamodb.types import TypeSerializer
+from lxml import html
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "gig_finder"))
+
+from gig_finder.extractors import extract_job_cards  # noqa: E402
+from gig_finder.items import JobItem  # noqa: E402
+from gig_finder.normalizer import ItemNormalizer  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+SERIALIZER = TypeSerializer()
+
+
+def legacy_wire_format(item):
+    return {field: SERIALIZER.serialize(value) for field, value in item.items()}
+
+
+def wire_format(item):
+    return item.to_dynamodb()
+
+
+def load_pages(pages_dir):
+    pages = []
+    for name in sorted(os.listdir(pages_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(pages_dir, name), "rb") as f:
+                pages.append(f.read())
+    return pages
+
+
+def extract(pages, item_class, count):
+    """Extract `count` cards, parsing the pages again in turn so no string is shared between rounds."""
+    items = []
+    while len(items) < count:
+        extracted = len(items)
+        for body in pages:
+            items.extend(extract_job_cards(html.fromstring(body), item_class))
+        if len(items) == extracted:
+            break  # The pages hold no job card
+    return items[:count]
+
+
+def memory_per_item(pages, item_class, count, today="2024-01-01"):
+    """Return the bytes held per item after extraction and after normalization."""
+    normalizer = ItemNormalizer()
+    gc.collect()
+    tracemalloc.start()
+    items = extract(pages, item_class, count)
+    gc.collect()  # Drops the lxml trees, only the items remain
+    extracted = tracemalloc.get_traced_memory()[0]
+    for item in items:
+        normalizer.normalize(item, today)
+    gc.collect()
+    normalized = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return extracted / len(items), normalized / len(items)
+
+
+def items_per_sec(pages, item_class, convert, count, today="2024-01-01"):
+    """Return items/sec of the extraction, and of the normalization and wire format conversion."""
+    normalizer = ItemNormalizer()
+    start = time.perf_counter()
+    items = extract(pages, item_class, count)
+    extraction = len(items) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for item in items:
+        convert(normalizer.normalize(item, today))
+    return extraction, len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default=os.path.join(FIXTURES_DIR, "pages"), help="directory of cached listing pages")
+    parser.add_argument("--items", type=int, default=20000, help="job cards per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each measurement, the median is reported")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    normalizer = ItemNormalizer()
+    legacy_items = [normalizer.normalize(item, "2024-01-01") for item in extract(pages, dict, 1000)]
+    items = [normalizer.normalize(item, "2024-01-01") for item in extract(pages, JobItem, 1000)]
+    if not items:
+        sys.exit(f"No job cards found in the pages of {args.pages}")
+    if [legacy_wire_format(item) for item in legacy_items] != [wire_format(item) for item in items]:
+        sys.exit("JobItem.to_dynamodb differs from the boto3 serialization of the dicts")
+
+    variants = (("dict", dict, legacy_wire_format), ("job_item", JobItem, wire_format))
+    results = {}
+    for name, item_class, _ in variants:
+        extracted, normalized = memory_per_item(pages, item_class, args.items)
+        results[f"{name}_bytes_per_item_extracted"] = round(extracted)
+        results[f"{name}_bytes_per_item_normalized"] = round(normalized)
+    timings = {name: [] for name, _, _ in variants}
+    for _ in range(args.repeat):
+        for name, item_class, convert in variants:
+            timings[name].append(items_per_sec(pages, item_class, convert, args.items))
+    for name, runs in timings.items():
+        results[f"{name}_extraction_items_per_sec"] = statistics.median(extraction for extraction, _ in runs)
+        results[f"{name}_normalize_convert_items_per_sec"] = statistics.median(storage for _, storage in runs)
+    results["memory_saving_normalized"] = 1 - (results["job_item_bytes_per_item_normalized"]
+                                               / results["dict_bytes_per_item_normalized"])
+    results["extraction_speedup"] = (results["job_item_extraction_items_per_sec"]
+                                     / results["dict_extraction_items_per_sec"])
+    results["normalize_convert_speedup"] = (results["job_item_normalize_convert_items_per_sec"]
+                                            / results["dict_normalize_convert_items_per_sec"])
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Micro-benchmark of the item normalization done by GigFinderPipeline.
+
+Runs the previous inline regex normalization and ItemNormalizer over job
+cards built from the price/offers corpus in fixtures/price_offers.json and
+reports items/sec for each.
+
+    python benchmarks/normalizer.py [--items 200000]
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import time
+
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "gig_finder"))
+
+from gig_finder.normalizer import ItemNormalizer  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def legacy_normalize(item, today):
+    """Normalization as it was done inline in GigFinderPipeline.process_item."""
+    def clean_string(text):
+        text = text.strip()
+        text = re.sub(r'\s+', ' ', text)
+        return text
+
+    for field in item:
+        if isinstance(item[field], str):
+            item[field] = clean_string(item[field])
+        elif isinstance(item[field], list):
+            item[field] = [clean_string(element) for element in item[field] if isinstance(element, str)]
+
+    item['is_competition'] = bool(re.search(r'entries', str(item.get('offers', ''))))
+
+    offers_match = re.search(r'(\d+)', str(item.get('offers', '')))
+    item['offers'] = int(offers_match.group(1)) if offers_match else None
+
+    hourly_suffix = r'\s*/\s*hr'
+    item['is_hourly'] = bool(re.search(hourly_suffix, str(item.get('price', ''))))
+
+    extraction_pattern = r'\$(\d+)(?:\s*-\s*\$(\d+))?'
+    extracted = re.search(extraction_pattern, item.get("price"))
+    item['price_min'] = Decimal(extracted.group(1)) if extracted else None
+    item['price_max'] = Decimal(extracted.group(2)) if extracted and extracted.group(2) else item['price_min']
+    item.pop('price', None)
+
+    item['_id'] = f"https://www.freelancer.com{item.get('_id', '')}"
+    item['last_seen_at'] = today
+    return item
+
+
+def load_cards(count):
+    """Build job cards cycling through the corpus of price and offers strings."""
+    with open(os.path.join(FIXTURES_DIR, "price_offers.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    pairs = itertools.cycle(itertools.product(corpus["prices"], corpus["offers"]))
+    return [
+        {
+            "_id": f"/projects/python/project-{i}",
+            "title": "\n   Build a   web scraper \n",
+            "description": "  Need a scraper\n for job boards   with   DynamoDB storage. ",
+            "status": "\n 6 days left ",
+            "tag_links": ["/jobs/python", "/jobs/web-scraping"],
+            "tags": [" Python ", "Web Scraping"],
+            "price": price,
+            "offers": offers,
+            "types": [],
+            "verified_payment": True,
+        }
+        for i, (price, offers) in zip(range(count), pairs)
+    ]
+
+
+def bench(normalize, cards, today="2024-01-01"):
+    """Return items/sec of a normalize function over fresh copies of the cards."""
+    items = [dict(card) for card in cards]
+    start = time.perf_counter()
+    for item in items:
+        normalize(item, today)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=200000, help="number of job cards to normalize")
+    args = parser.parse_args()
+
+    cards = load_cards(args.items)
+    results = {
+        "legacy_items_per_sec": bench(legacy_normalize, cards),
+        "normalizer_items_per_sec": bench(ItemNormalizer().normalize, cards),
+    }
+    results["speedup"] = results["normalizer_items_per_sec"] / results["legacy_items_per_sec"]
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
-import gzip
+import sys
+
 from bs4 import BeautifulSoup
 
-# Exemplo de documento crawleado pelo scrapy
-cached_file_path = r'gig_finder\.scrapy\httpcache\freelancer\1b\1bf48bd5e368b3707a9139469ada52755b368b02\response_body'
+sys.path.insert(0, 'gig_finder')
+
+from gig_finder.httpcache import CachePack
+
+# Exemplo de documento crawleado pelo scrapy, lido do cache do dia em que foi baixado
+cache_path = r'gig_finder/.scrapy/httpcache/freelancer/2024-01-01'
+url = 'https://www.freelancer.com/projects/web-development/web-application-development-specialist'
 
-with gzip.open(cached_file_path, 'rb') as compressed_file:
-    soup = BeautifulSoup(compressed_file.read(), 'html.parser')
+pack = CachePack(cache_path).open()
+_, offset, length = pack.lookup_url(url)
+soup = BeautifulSoup(pack.response(offset, length).body, 'html.parser')
+pack.close()
 
 # Caso queira consultar o documento todo
 # print(soup.prettify())
 
 # Deve imprimir o título 'Web Application Development Specialist
-print(soup.find('h1').text)
\ No newline at end of file
+print(soup.find('h1').text)
@@ -0,0 +1,184 @@
+import math
+import threading
+
+from collections import Counter
+from decimal import Decimal
+
+# Counters of a tag and day, next to the price sketches
+COUNTERS = ("seen", "new", "ended", "hourly", "competition", "verified")
+PRICE_FIELDS = ("price_min", "price_max")
+
+
+class QuantileSketch:
+    """Streaming quantiles of positive values within a relative error, as in DDSketch.
+
+    Values are counted in logarithmic bins, so a sketch of prices from 1 to
+    100000 at 1% accuracy has at most a few hundred bins however many values
+    it saw. Sketches of the same accuracy merge exactly by adding their bins.
+    """
+
+    def __init__(self, relative_accuracy=0.01, bins=None, zeros=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = Counter(bins or {})  # bin index -> count
+        self.zeros = zeros  # Values of 0, which have no logarithm
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.bins.values())
+
+    def add(self, value):
+        value = float(value)
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.bins[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge sketches of accuracy {other.relative_accuracy} and "
+                             f"{self.relative_accuracy}")
+        self.bins.update(other.bins)
+        self.zeros += other.zeros
+        return self
+
+    def quantile(self, q):
+        """Return the value at a quantile between 0 and 1, or None for an empty sketch."""
+        count = self.count
+        if not count:
+            return None
+        rank = q * (count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # The middle of the bin, within the relative accuracy of every value in it
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dynamodb(self):
+        return {
+            "accuracy": Decimal(str(self.relative_accuracy)),
+            "zeros": self.zeros,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dynamodb(cls, data):
+        return cls(
+            float(data["accuracy"]),
+            bins={int(index): int(count) for index, count in data.get("bins", {}).items()},
+            zeros=int(data.get("zeros", 0)),
+        )
+
+
+class TagDay:
+    """Market summary of one tag on one day.
+
+    `seen` counts the jobs listed that day, and the hourly, competition,
+    verified counts and the price sketches describe those jobs. Prices are
+    sketched per "<currency>/<hourly|fixed>" group, as amounts in different
+    currencies or per hour and per project do not compare. `new` and `ended`
+    count the jobs first stored and marked as ended that day.
+    """
+
+    def __init__(self, tag, day, relative_accuracy=0.01):
+        self.tag = tag
+        self.day = day
+        self.relative_accuracy = relative_accuracy
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.prices = {}  # group -> {"price_min": QuantileSketch, "price_max": QuantileSketch}
+
+    def observe(self, item):
+        self.counters["seen"] += 1
+        self.counters["hourly"] += bool(item.get("is_hourly"))
+        self.counters["competition"] += bool(item.get("is_competition"))
+        self.counters["verified"] += bool(item.get("verified_payment"))
+        if item.get("price_min") is None:
+            return
+        group = f"{item.get('currency') or 'unknown'}/{'hourly' if item.get('is_hourly') else 'fixed'}"
+        sketches = self.prices.setdefault(
+            group, {field: QuantileSketch(self.relative_accuracy) for field in PRICE_FIELDS}
+        )
+        for field in PRICE_FIELDS:
+            sketches[field].add(item.get(field) if item.get(field) is not None else item["price_min"])
+
+    def merge(self, other):
+        for counter in COUNTERS:
+            self.counters[counter] += other.counters[counter]
+        for group, sketches in other.prices.items():
+            if group in self.prices:
+                for field in PRICE_FIELDS:
+                    self.prices[group][field].merge(sketches[field])
+            else:
+                self.prices[group] = sketches
+        return self
+
+    def to_dynamodb(self):
+        return {
+            "tag": self.tag,
+            "day": self.day,
+            "accuracy": Decimal(str(self.relative_accuracy)),
+            **self.counters,
+            "prices": {
+                group: {field: sketch.to_dynamodb() for field, sketch in sketches.items()}
+                for group, sketches in self.prices.items()
+            },
+        }
+
+    @classmethod
+    def from_dynamodb(cls, record):
+        tag_day = cls(record["tag"], record["day"], float(record.get("accuracy", 0.01)))
+        for counter in COUNTERS:
+            tag_day.counters[counter] = int(record.get(counter, 0))
+        tag_day.prices = {
+            group: {field: QuantileSketch.from_dynamodb(sketch) for field, sketch in sketches.items()}
+            for group, sketches in record.get("prices", {}).items()
+        }
+        return tag_day
+
+
+class MarketAggregates:
+    """Per tag and day summaries of the jobs this process stored as seen, written to the table at the end."""
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.records = {}  # (tag, day) -> TagDay
+        self.observed = set()  # Jobs already counted as seen, by (_id, day)
+        self.lock = threading.Lock()
+
+    def record(self, tag, day):
+        key = (tag, day)
+        if key not in self.records:
+            self.records[key] = TagDay(tag, day, self.relative_accuracy)
+        return self.records[key]
+
+    def observe(self, item, day):
+        """Count a job listed on a day under each of its tags, once however many listing pages show it."""
+        with self.lock:
+            if (item['_id'], day) in self.observed:
+                return
+            self.observed.add((item['_id'], day))
+            for tag in item.get('tags') or []:
+                self.record(tag, day).observe(item)
+
+    def count(self, counter, tags, day):
+        """Count a job as new or ended on a day under each of its tags."""
+        with self.lock:
+            for tag in tags or []:
+                self.record(tag, day).counters[counter] += 1
+
+    def drain(self):
+        """Return the summaries gathered since the last call and start new ones."""
+        with self.lock:
+            records, self.records = list(self.records.values()), {}
+        return records
+
+    def restore(self, records):
+        """Put back drained summaries that could not be saved, so the next drain returns them again."""
+        with self.lock:
+            for tag_day in records:
+                self.record(tag_day.tag, tag_day.day).merge(tag_day)
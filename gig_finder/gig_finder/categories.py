@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+from scrapy.utils.project import data_path
+
+
+def category_cache_path(settings):
+    """Return the category cache file, or None when the cache is disabled."""
+    if not settings.getbool("CATEGORY_CACHE_ENABLED", True):
+        return None
+    return data_path(settings.get("CATEGORY_CACHE_FILE", "categories.json"))
+
+
+class CategoryCache:
+    """Category and tag map of the /job/ page, kept between runs with the validators needed to refetch it.
+
+    The file groups the tags by category, as compact JSON:
+    {"fetched_at": ..., "etag": ..., "last_modified": ..., "content_hash": ...,
+     "categories": {category: [[tag, tag_link], ...]}, "changes": {...}}
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl  # Seconds during which the cached map is used without asking the site
+        self.categories = []  # [{"category": ..., "tag": ..., "tag_link": ...}] as extracted by the spider
+        self.fetched_at = None
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+        self.changes = None  # Tags added and removed the last time the map changed
+
+    def load(self):
+        """Read the cached map, if any."""
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            return self  # A categories.json written before the cache existed
+        self.categories = [
+            {"category": category, "tag": tag, "tag_link": tag_link}
+            for category, tags in data.get("categories", {}).items()
+            for tag, tag_link in tags
+        ]
+        self.fetched_at = data.get("fetched_at")
+        self.etag = data.get("etag")
+        self.last_modified = data.get("last_modified")
+        self.content_hash = data.get("content_hash")
+        self.changes = data.get("changes")
+        return self
+
+    def is_fresh(self, now=None):
+        """Check whether the cached map is recent enough to skip fetching the /job/ page."""
+        if not self.categories or self.fetched_at is None:
+            return False
+        return (now or time.time()) - self.fetched_at < self.ttl
+
+    def conditional_headers(self):
+        """Return the headers asking the site to answer 304 if the /job/ page did not change."""
+        headers = {}
+        if not self.categories:
+            return headers
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def update(self, categories, etag=None, last_modified=None, content_hash=None, now=None):
+        """Replace the cached map with a fetched one, returning the (added, removed) "category / tag" names."""
+        added, removed = [], []
+        if self.categories:  # The first fetch has nothing to compare with
+            previous = {(entry["category"], entry["tag"]) for entry in self.categories}
+            current = {(entry["category"], entry["tag"]) for entry in categories}
+            added = sorted(f"{category} / {tag}" for category, tag in current - previous)
+            removed = sorted(f"{category} / {tag}" for category, tag in previous - current)
+
+        self.fetched_at = now or time.time()
+        if added or removed:
+            self.changes = {"changed_at": self.fetched_at, "added": added, "removed": removed}
+        self.categories = categories
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        return added, removed
+
+    def touch(self, now=None):
+        """Record that the site confirmed the cached map is still current."""
+        self.fetched_at = now or time.time()
+
+    def save(self):
+        """Write the cache, replacing the previous file only once the new one is complete."""
+        grouped = {}
+        for entry in self.categories:
+            grouped.setdefault(entry["category"], []).append([entry["tag"], entry["tag_link"]])
+        data = {
+            "fetched_at": self.fetched_at,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_hash": self.content_hash,
+            "categories": grouped,
+            "changes": self.changes,
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
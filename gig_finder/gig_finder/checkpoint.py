@@ -0,0 +1,201 @@
+import datetime
+import json
+import os
+import re
+
+from scrapy.utils.project import data_path
+
+# Listing pages are numbered by the last path segment, the first page has none
+PAGE_NUMBER_PATTERN = re.compile(r"/(\d+)/?(?:\?|$)")
+
+
+def checkpoint_path(settings, spider_name):
+    """Return the checkpoint file of a spider, or None when checkpoints are disabled."""
+    if not settings.getbool("CHECKPOINT_ENABLED", True):
+        return None
+    checkpoint_dir = data_path(settings.get("CHECKPOINT_DIR", "checkpoints"), createdir=True)
+    return os.path.join(checkpoint_dir, f"{spider_name}.jsonl")
+
+
+def full_crawl_log_path(settings):
+    """Return the file of the days each tag was last fully crawled, or None when incremental crawls never fall back."""
+    if settings.getint("INCREMENTAL_FULL_CRAWL_DAYS", 7) <= 0:
+        return None
+    return data_path(settings.get("FULL_CRAWL_LOG_FILE", "full_crawls.json"))
+
+
+def page_number(url):
+    """Return the number of a listing page from its URL."""
+    match = PAGE_NUMBER_PATTERN.search(url)
+    return int(match.group(1)) if match else 1
+
+
+class CrawlCheckpoint:
+    """Append-only log of the listing pages a crawl requested and finished, so it can be resumed.
+
+    The first line describes the crawl (day and spider arguments). Every
+    listing page request is logged before it is scheduled and every page is
+    logged again once parsed, with the ids of the jobs it yielded. Requested
+    pages that were never finished are the crawl frontier. Tags whose
+    pagination stopped early are logged too, so a resumed crawl still spares
+    their jobs when marking unseen ones as ended. Each line is flushed as it
+    is written, so the log survives the process being killed.
+    """
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        self.crawl = None
+        self.requested = {}  # url -> tag
+        self.finished = {}  # url -> ids of the jobs found on the page, None when it could not be fetched
+        self.stopped_tags = set()
+        self.file = None
+
+    def open(self, crawl, resume=False):
+        """Load the log of an unfinished crawl with the same description if resuming, else start a new one.
+
+        Returns whether a previous crawl is resumed.
+        """
+        resumed = resume and self.load(crawl)
+        if not resumed:
+            self.requested = {}
+            self.finished = {}
+            self.stopped_tags = set()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "a" if resumed else "w", encoding="utf-8")
+        if not resumed:
+            self.write({"crawl": crawl})
+        self.crawl = crawl
+        return resumed
+
+    def load(self, crawl):
+        """Read the log left by a previous crawl, returning whether it can be resumed."""
+        if not os.path.exists(self.path):
+            self.logger.info(f"No checkpoint at {self.path}, starting a new crawl")
+            return False
+
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.readlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Only the last line can be cut short by a crash
+                self.logger.warning(f"Ignoring a truncated line in {self.path}")
+
+        if not records or records[0].get("crawl") != crawl:
+            self.logger.warning(f"The checkpoint at {self.path} is from another day or spider arguments, "
+                                f"starting a new crawl")
+            return False
+
+        for record in records[1:]:
+            if "requested" in record:
+                self.requested[record["requested"]] = record["tag"]
+            elif "finished" in record:
+                self.finished[record["finished"]] = record.get("ids")
+            elif "stopped" in record:
+                self.stopped_tags.add(record["stopped"])
+            elif record.get("complete"):
+                self.logger.info(f"The crawl in {self.path} already completed, starting a new crawl")
+                return False
+        return True
+
+    def close(self, complete=False):
+        """Close the log, recording that the crawl completed when nothing is left to fetch."""
+        if self.file is None:
+            return
+        if complete and not self.pending():
+            self.write({"complete": True})
+        self.file.close()
+        self.file = None
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def record_request(self, url, tag):
+        """Log a listing page request, returning False if the page was already requested by this crawl."""
+        if url in self.requested:
+            return False
+        self.requested[url] = tag
+        self.write({"requested": url, "tag": tag})
+        return True
+
+    def record_page(self, url, ids=None):
+        """Log a listing page as finished, with the ids of the jobs it yielded."""
+        self.finished[url] = ids
+        self.write({"finished": url, "ids": ids})
+
+    def record_stopped_tag(self, tag):
+        """Log a tag whose pagination stopped before its last page."""
+        self.stopped_tags.add(tag)
+        self.write({"stopped": tag})
+
+    def pending(self):
+        """Return the (url, tag) pairs of the pages requested but not finished yet."""
+        return [(url, tag) for url, tag in self.requested.items() if url not in self.finished]
+
+    def reopen_unstored_pages(self, is_stored):
+        """Forget the finished pages holding a job that did not reach the storage, returning their count.
+
+        Jobs still waiting in the pipeline when a crawl is killed are lost, so
+        the pages they came from have to be fetched again.
+        """
+        unstored = [
+            url for url, ids in self.finished.items()
+            if ids is not None and not all(is_stored(item_id) for item_id in ids)
+        ]
+        for url in unstored:
+            del self.finished[url]
+        return len(unstored)
+
+    def highest_pages(self):
+        """Return the highest page number parsed for each tag."""
+        highest = {}
+        for url, ids in self.finished.items():
+            if ids is None:
+                continue
+            tag = self.requested.get(url)
+            highest[tag] = max(highest.get(tag, 0), page_number(url))
+        return highest
+
+
+class FullCrawlLog:
+    """Day each tag was last crawled to its last listing page, so incremental crawls fully crawl it again now and then.
+
+    An incremental crawl stops paginating a tag at a known page, and the jobs
+    listed under a stopped tag are never marked as ended. A tag whose last
+    full crawl is `max_days` old or more is crawled to its last page again.
+    """
+
+    def __init__(self, path, max_days):
+        self.path = path
+        self.max_days = max_days
+        self.days = {}  # tag -> day of its last full crawl
+
+    def load(self):
+        """Read the days of the previous full crawls, if any."""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.days = json.load(f)
+        return self
+
+    def is_due(self, tag, today):
+        """Check whether a tag has to be crawled to its last page today."""
+        last = self.days.get(tag)
+        if last is None:
+            return True
+        return (datetime.date.fromisoformat(today) - datetime.date.fromisoformat(last)).days >= self.max_days
+
+    def save(self, tags, today):
+        """Record the tags fully crawled today and write the log."""
+        # Read again first, the other processes of a sharded crawl save the tags they crawled too
+        self.load()
+        self.days.update(dict.fromkeys(tags, today))
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.days, f, ensure_ascii=False, sort_keys=True)
+        os.replace(temporary_path, self.path)
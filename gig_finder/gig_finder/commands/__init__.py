@@ -0,0 +1,4 @@
+# This package will contain the custom Scrapy commands of the project
+#
+# Commands are registered through the COMMANDS_MODULE setting and run as
+# `scrapy <command>` from the project directory.
@@ -0,0 +1,180 @@
+import datetime
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict, closest_scrapy_cfg
+from scrapy.utils.project import data_path
+
+from gig_finder.categories import CategoryCache, category_cache_path
+from gig_finder.middlewares import TagYieldStore
+from gig_finder.pipelines import GigFinderPipeline
+from gig_finder.sharding import ShardRun, partition_tags
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": True}
+
+    def syntax(self):
+        return "[options] <spider>"
+
+    def short_desc(self):
+        return "Run a spider as N processes, each crawling a shard of the tags, then mark unseen jobs as ended"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("-a", dest="spargs", action="append", default=[], metavar="NAME=VALUE",
+                            help="set spider argument, passed to every shard (may be repeated)")
+        parser.add_argument("--shards", type=int, default=4, help="number of spider processes (default: 4)")
+        parser.add_argument("--strategy", choices=("hash", "weighted"), default="weighted",
+                            help="split the tags by hash, or balance the listing pages each tag had in past "
+                                 "runs (default: weighted)")
+        parser.add_argument("--launcher", choices=("local", "compose"), default="local",
+                            help="run the shards as local processes or as docker compose containers (default: local)")
+        parser.add_argument("--compose-file", default=None,
+                            help="compose file of the compose launcher (default: docker-compose.yml next to the "
+                                 "project)")
+        parser.add_argument("--compose-service", default="gig_finder",
+                            help="compose service of the spider (default: gig_finder)")
+        parser.add_argument("--compose-command", default="docker compose",
+                            help="compose executable (default: 'docker compose')")
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+        except ValueError:
+            raise UsageError("Invalid -a value, use -a NAME=VALUE", print_help=False)
+        try:
+            json.loads(opts.spargs.get("categories", "[]"))
+        except json.JSONDecodeError:
+            raise UsageError("Invalid categories argument, expected a JSON list of prefixes", print_help=False)
+        for name in ("shard", "shard_run", "discover_only"):
+            if name in opts.spargs:
+                raise UsageError(f"The {name} argument is set by crawl_shards", print_help=False)
+        # The crawl run by this process only fetches the job categories, it stores no item and its stats
+        # would overwrite the metrics of a full crawl
+        self.settings.set("ITEM_PIPELINES", {}, priority="cmdline")
+        self.settings.set("METRICS_DUMP_FORMAT", None, priority="cmdline")
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        if opts.shards < 1:
+            raise UsageError("--shards must be at least 1")
+        spider_name = args[0]
+        path = category_cache_path(self.settings)
+        if path is None:
+            raise UsageError("crawl_shards needs CATEGORY_CACHE_ENABLED, the shards read the tags from the cache",
+                             print_help=False)
+
+        categories = self.discover_categories(spider_name, path, opts)
+        if not categories:
+            raise UsageError("No job categories found, nothing to crawl", print_help=False)
+        prefixes = json.loads(opts.spargs.get("categories", "[]"))
+        tags = sorted({
+            entry["tag"] for entry in categories
+            if not prefixes or any(entry["category"].startswith(prefix) for prefix in prefixes)
+        })
+
+        weights = self.tag_weights(tags) if opts.strategy == "weighted" else None
+        assignments = partition_tags(tags, opts.shards, weights)
+        run = ShardRun.create(spider_name)
+        today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        run.save_plan(assignments, opts.strategy, today)
+        for index, shard_tags in enumerate(assignments):
+            pages = f", {sum(weights[tag] for tag in shard_tags):.0f} expected pages" if weights else ""
+            print(f"Shard {index}/{opts.shards}: {len(shard_tags)} tags{pages}")
+
+        exit_codes = self.launch_shards(spider_name, run, opts)
+        incomplete = []
+        stopped_tags = set()
+        for index, exit_code in enumerate(exit_codes):
+            report = run.load_report(index)
+            if report is not None:
+                stopped_tags.update(report.get("stopped_tags", []))
+            complete = exit_code == 0 and report is not None and report["complete"]
+            reason = report["reason"] if report is not None else "no report"
+            print(f"Shard {index}/{opts.shards}: exit code {exit_code}, {reason}, "
+                  f"{'complete' if complete else 'incomplete'}")
+            if not complete:
+                incomplete.append(index)
+
+        if incomplete:
+            # Their unvisited tags would look like ended jobs
+            print(f"Not marking unseen jobs as ended, shards {', '.join(map(str, incomplete))} did not finish "
+                  f"every listing page. The plan and reports are in {run.path}")
+            self.exitcode = 1
+            return
+        print(f"Marked {self.mark_ended(spider_name, today, stopped_tags)} unseen jobs as ended")
+
+    def discover_categories(self, spider_name, path, opts):
+        """Return the tags of the category cache, fetching the job categories first when it is stale."""
+        cache = CategoryCache(path, self.settings.getint("CATEGORY_CACHE_TTL", 7 * 24 * 3600)).load()
+        if cache.is_fresh():
+            return cache.categories
+        self.crawler_process.crawl(spider_name, discover_only=True, **opts.spargs)
+        self.crawler_process.start()
+        return CategoryCache(path, cache.ttl).load().categories
+
+    def tag_weights(self, tags):
+        """Return the expected listing pages of each tag; tags never crawled count as the average tag."""
+        if not self.settings.get("TAG_YIELDS_FILE"):
+            raise UsageError("--strategy weighted needs TAG_YIELDS_FILE, use --strategy hash", print_help=False)
+        store = TagYieldStore(data_path(self.settings.get("TAG_YIELDS_FILE"))).load()
+        known = {tag: store.expected_pages(tag) for tag in tags if store.expected_pages(tag) is not None}
+        default = sum(known.values()) / len(known) if known else 1
+        return {tag: known.get(tag, default) for tag in tags}
+
+    def launch_shards(self, spider_name, run, opts):
+        """Start a spider process per shard and return their exit codes once all have exited."""
+        project_dir = os.path.dirname(closest_scrapy_cfg())
+        # Relative to the project, which is also the working directory of the containers
+        run_dir = os.path.relpath(run.path, project_dir)
+        processes = []
+        try:
+            for index in range(opts.shards):
+                command = ["scrapy", "crawl", spider_name,
+                           "-a", f"shard={index}/{opts.shards}", "-a", f"shard_run={run.name}",
+                           "--logfile", os.path.join(run_dir, f"shard-{index}.log")]
+                for name, value in opts.spargs.items():
+                    command += ["-a", f"{name}={value}"]
+                for setting in opts.set:
+                    command += ["-s", setting]
+                if opts.launcher == "local":
+                    command = [sys.executable, "-m", "scrapy"] + command[1:]
+                else:
+                    compose_file = opts.compose_file or os.path.join(project_dir, os.pardir, "docker-compose.yml")
+                    command = (shlex.split(opts.compose_command) + ["-f", compose_file, "run", "--rm", "-T",
+                                                                    opts.compose_service] + command)
+                logger.info(f"Starting shard {index}/{opts.shards}: {shlex.join(command)}")
+                processes.append(subprocess.Popen(command, cwd=project_dir))
+            return [process.wait() for process in processes]
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+
+    def mark_ended(self, spider_name, today, stopped_tags=None):
+        """Mark the jobs no shard saw as ended, in a single pass once every shard has stored its items.
+
+        Jobs listed under a tag whose pagination a shard stopped early are spared.
+        """
+        pipeline = GigFinderPipeline.from_settings(self.settings, spider_name)
+        # Jobs seen by a shard that ran past midnight carry the next date and are not stale
+        pipeline.today = today
+        pipeline.open_storage(spider_name, logger)
+        try:
+            ended = pipeline.mark_unseen_as_ended(logger, stopped_tags)
+            pipeline.save_aggregates(logger)  # The ended counts, the shards saved the rest
+            return ended
+        finally:
+            pipeline.close_storage()
@@ -0,0 +1,39 @@
+import json
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from gig_finder.normalizer import BASE_URL
+from gig_finder.pipelines import DynamoDBManager
+from gig_finder.snapshot import json_default
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <job_url>"
+
+    def short_desc(self):
+        return "Print a stored job with its full change timeline"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--table", default="freelancer", help="DynamoDB jobs table (default: freelancer)")
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        item_id = args[0] if args[0].startswith(BASE_URL) else f"{BASE_URL}{args[0]}"
+
+        manager = DynamoDBManager.from_settings(self.settings)
+        table = manager.get_table(opts.table)
+        history_table_name = DynamoDBManager.history_table_name(opts.table)
+        # Records written with HISTORY_STORAGE = "table" live there, older ones stay inline on the item
+        history_table = manager.load_table(history_table_name)
+
+        item = manager.get_timeline(table, item_id, history_table)
+        if item is None:
+            raise UsageError(f"No job {item_id} in {opts.table}", print_help=False)
+        print(json.dumps(item, indent=4, ensure_ascii=False, default=json_default))
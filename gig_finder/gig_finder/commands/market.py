@@ -0,0 +1,88 @@
+import datetime
+import json
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from gig_finder.aggregates import COUNTERS, PRICE_FIELDS
+from gig_finder.pipelines import DynamoDBManager
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Print per tag and day job counts, churn and price quantiles from the market aggregates"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--table", default="freelancer", help="DynamoDB jobs table (default: freelancer)")
+        parser.add_argument("--tag", dest="tags", action="append", default=[],
+                            help="tag to report, e.g. Python (may be repeated, default: every tag)")
+        parser.add_argument("--days", type=int, default=7, help="number of days up to --until (default: 7)")
+        parser.add_argument("--since", help="first day, YYYY-MM-DD (default: from --days)")
+        parser.add_argument("--until", help="last day, YYYY-MM-DD (default: today)")
+        parser.add_argument("--merge-days", action="store_true",
+                            help="report each tag once over all the days; a job listed on several days is counted, "
+                                 "and its prices weighted, once per day")
+        parser.add_argument("--group", dest="groups", action="append", default=[],
+                            help="price group to report, such as USD/hourly or EUR/fixed (may be repeated, "
+                                 "default: every group)")
+        parser.add_argument("--quantiles", default="0.1,0.5,0.9", help="price quantiles (default: 0.1,0.5,0.9)")
+        parser.add_argument("--sort", choices=COUNTERS, default="seen", help="counter to sort by (default: seen)")
+        parser.add_argument("--limit", type=int, default=None, help="number of tags to print")
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        try:
+            quantiles = [float(quantile) for quantile in opts.quantiles.split(",")]
+            until = opts.until or datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+            since = opts.since or (datetime.date.fromisoformat(until) - datetime.timedelta(days=opts.days - 1)).isoformat()
+            datetime.date.fromisoformat(since)
+        except ValueError as e:
+            raise UsageError(str(e), print_help=False)
+
+        manager = DynamoDBManager.from_settings(self.settings)
+        table = manager.load_table(DynamoDBManager.aggregates_table_name(opts.table))
+        if table is None:
+            raise UsageError(f"No aggregates for {opts.table}, they are written by crawls with "
+                             f"MARKET_AGGREGATES_ENABLED", print_help=False)
+
+        summaries = {}
+        days = {}  # Days merged into each summary
+        for tag_day in manager.query_aggregates(table, since, until, opts.tags):
+            # The summaries count the jobs of one day, merged they count job-days
+            key = tag_day.tag if opts.merge_days else (tag_day.tag, tag_day.day)
+            if key in summaries:
+                summaries[key].merge(tag_day)
+                days[key] += 1
+            else:
+                summaries[key] = tag_day
+                days[key] = 1
+
+        report = []
+        for tag_day in sorted(summaries.values(), key=lambda tag_day: (-tag_day.counters[opts.sort], tag_day.tag,
+                                                                      tag_day.day))[:opts.limit]:
+            prices = {}
+            for group, sketches in sorted(tag_day.prices.items()):
+                if opts.groups and group not in opts.groups:
+                    continue
+                prices[group] = {"jobs": sketches["price_min"].count}
+                for field in PRICE_FIELDS:
+                    prices[group][field] = {
+                        f"p{quantile * 100:g}": round(sketches[field].quantile(quantile), 2) for quantile in quantiles
+                    }
+            entry = {"tag": tag_day.tag}
+            if opts.merge_days:
+                entry.update(since=since, until=until, days=days[tag_day.tag])
+            else:
+                entry["day"] = tag_day.day
+            entry.update(tag_day.counters)
+            entry["prices"] = prices
+            report.append(entry)
+        print(json.dumps(report, indent=4, ensure_ascii=False))
@@ -0,0 +1,34 @@
+from scrapy.commands import ScrapyCommand
+
+from gig_finder.pipelines import DynamoDBManager
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": True}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Add the active items index to an existing jobs table and backfill its keys"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--table", default="freelancer", help="DynamoDB table to migrate (default: freelancer)")
+        parser.add_argument("--skip-index", action="store_true", help="only backfill, the index already exists")
+
+    def run(self, args, opts):
+        manager = DynamoDBManager.from_settings(self.settings)
+        table = manager.get_table(opts.table)
+
+        # Keys are backfilled first so the index is complete as soon as it becomes queryable
+        updated = manager.backfill_active_shards(table)
+        print(f"Backfilled the active shard of {updated} items in {opts.table}")
+
+        if not opts.skip_index:
+            print(f"Creating index '{DynamoDBManager.ACTIVE_INDEX_NAME}' on {opts.table}, this can take several minutes")
+            if manager.add_active_index(table):
+                print("Index created")
+            else:
+                print("Index already exists")
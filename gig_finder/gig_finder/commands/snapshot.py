@@ -0,0 +1,50 @@
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from gig_finder.pipelines import DynamoDBManager
+from gig_finder.snapshot import PART_WRITERS, TableSnapshot
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": True}
+
+    def syntax(self):
+        return "[options] <output_dir>"
+
+    def short_desc(self):
+        return "Copy a whole jobs or history table to compressed NDJSON or Parquet files with a parallel scan"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--table", default="freelancer", help="DynamoDB table to copy (default: freelancer)")
+        parser.add_argument("--format", dest="output_format", choices=sorted(PART_WRITERS), default="ndjson",
+                            help="output format (default: ndjson, gzip compressed)")
+        parser.add_argument("--segments", type=int, default=4,
+                            help="parallel scan segments, each read by its own worker (default: 4)")
+        parser.add_argument("--page-size", type=int, default=None,
+                            help="items per scan request, lower it to spread the read capacity used")
+        parser.add_argument("--part-size", type=int, default=100000,
+                            help="items per output file of a segment, also the resume granularity (default: 100000)")
+        parser.add_argument("--resume", action="store_true", help="continue an interrupted snapshot in output_dir")
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        if opts.segments < 1:
+            raise UsageError("--segments must be at least 1")
+
+        manager = DynamoDBManager.from_settings(self.settings)
+        snapshot = TableSnapshot(
+            manager,
+            opts.table,
+            args[0],
+            output_format=opts.output_format,
+            segments=opts.segments,
+            page_size=opts.page_size,
+            part_size=opts.part_size,
+        )
+        try:
+            snapshot.run(resume=opts.resume)
+        except ValueError as e:
+            raise UsageError(str(e), print_help=False)
@@ -0,0 +1,165 @@
+import datetime
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.project import data_path
+from twisted.internet import defer, threads
+
+# Columns of an exported job, in file order. Every file has exactly this schema, so a
+# whole export directory reads as one dataset whatever fields the crawled cards had.
+JOB_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("title", pa.string()),
+    ("description", pa.string()),
+    ("status", pa.string()),
+    ("tags", pa.list_(pa.string())),
+    ("tag_links", pa.list_(pa.string())),
+    ("types", pa.list_(pa.string())),
+    ("found_under", pa.list_(pa.string())),
+    ("offers", pa.int32()),
+    ("is_competition", pa.bool_()),
+    ("verified_payment", pa.bool_()),
+    ("price_min", pa.float64()),
+    ("price_max", pa.float64()),
+    ("currency", pa.string()),
+    ("is_hourly", pa.bool_()),
+    ("last_seen_at", pa.date32()),
+])
+
+def job_row(item, schema=JOB_SCHEMA):
+    """Return the values of a normalized or stored item for the columns of a schema."""
+    row = {}
+    for field in schema:
+        value = item.get(field.name)
+        if pa.types.is_list(field.type):
+            value = list(value) if value else []  # Copied, the dedup middleware may still append tags
+        elif value is not None and pa.types.is_integer(field.type):
+            value = int(value)  # DynamoDB numbers are read back as Decimal
+        elif value is not None and field.type == pa.float64():
+            value = float(value)
+        elif value is not None and field.type == pa.date32():
+            value = datetime.date.fromisoformat(value)
+        row[field.name] = value
+    return row
+
+
+class ParquetExportPipeline:
+    """Stream the normalized items into Parquet files partitioned by crawl date.
+
+    Items are buffered column by column and written as one row group every
+    PARQUET_ROW_GROUP_SIZE rows, on a worker thread, so memory stays bounded by
+    the row group size whatever the length of the crawl. Each crawl writes
+    `<PARQUET_EXPORT_DIR>/crawl_date=<YYYY-MM-DD>/<spider>-<start time>.parquet`,
+    named with a `.tmp` suffix until the crawl closes. The directory can be read
+    with column pruning and memory mapping, e.g.
+    `pyarrow.dataset.dataset(path, partitioning="hive").to_table(columns=["tags", "price_min"])`.
+
+    Runs after GigFinderPipeline, which normalizes the items in place. Jobs
+    the local index shows were stored by an earlier crawl of the same day are
+    not exported again.
+    """
+
+    def __init__(self, export_dir, row_group_size=10000, compression="zstd"):
+        self.export_dir = export_dir
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.started_at = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self.buffers = {}  # crawl date -> {column: values} of the rows not written yet
+        self.writers = {}  # crawl date -> (ParquetWriter, temporary path, final path)
+        self.write_lock = defer.DeferredLock()  # Row groups are written one at a time, in order
+        self.pending_writes = set()
+        self.paths = []
+        self.spider = None
+        self.stats = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("PARQUET_EXPORT_ENABLED", True):
+            raise NotConfigured
+        pipeline = cls(
+            export_dir=data_path(crawler.settings.get("PARQUET_EXPORT_DIR", "exports"), createdir=True),
+            row_group_size=crawler.settings.getint("PARQUET_ROW_GROUP_SIZE", 10000),
+            compression=crawler.settings.get("PARQUET_COMPRESSION", "zstd"),
+        )
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def open_spider(self, spider):
+        self.spider = spider
+
+    def process_item(self, item, spider):
+        if item is None:
+            return item  # Private projects are not stored
+
+        crawl_date = item.get("last_seen_at")
+        # The local index snapshot the spider took when the crawl started; a job an earlier crawl of the
+        # same day stored is already in that crawl's file
+        known_items = getattr(spider, "known_items", None)
+        entry = known_items.get(item["_id"]) if known_items is not None else None
+        if entry is not None and entry[1] == crawl_date:
+            if self.stats is not None:
+                self.stats.inc_value("gig_finder/parquet/skipped_seen_today")
+            return item
+
+        row = job_row(item)
+        buffer = self.buffers.setdefault(crawl_date, {field.name: [] for field in JOB_SCHEMA})
+        for column, value in row.items():
+            buffer[column].append(value)
+
+        if len(buffer["_id"]) >= self.row_group_size:
+            # The item waits for the write, so a slow disk slows the crawl down instead of growing the buffers
+            return self.flush(crawl_date).addCallback(lambda _: item)
+        return item
+
+    def flush(self, crawl_date):
+        """Write the buffered rows of a crawl date as one row group."""
+        buffer = self.buffers.pop(crawl_date, None)
+        if not buffer or not buffer["_id"]:
+            return defer.succeed(None)
+        table = pa.Table.from_pydict(buffer, schema=JOB_SCHEMA)
+        if self.stats is not None:
+            self.stats.inc_value("gig_finder/parquet/rows", table.num_rows)
+            self.stats.inc_value("gig_finder/parquet/row_groups")
+
+        def log_failure(failure):
+            self.spider.logger.error(f"Could not write {table.num_rows} rows to the Parquet export: "
+                                     f"{failure.getErrorMessage()}")
+
+        d = self.write_lock.run(threads.deferToThread, self.write_table, crawl_date, table)
+        d.addErrback(log_failure)
+        self.pending_writes.add(d)
+        d.addBoth(lambda result: self.pending_writes.discard(d) or result)
+        return d
+
+    def write_table(self, crawl_date, table):
+        """Append a row group to the file of a crawl date, opening it on first use."""
+        if crawl_date not in self.writers:
+            directory = os.path.join(self.export_dir, f"crawl_date={crawl_date}")
+            os.makedirs(directory, exist_ok=True)
+            # The shards of a crawl start together, their run names keep the files apart
+            run_name = getattr(self.spider, "run_name", self.spider.name)
+            path = os.path.join(directory, f"{run_name}-{self.started_at}.parquet")
+            writer = pq.ParquetWriter(f"{path}.tmp", JOB_SCHEMA, compression=self.compression)
+            self.writers[crawl_date] = (writer, f"{path}.tmp", path)
+        self.writers[crawl_date][0].write_table(table, row_group_size=table.num_rows)
+
+    @defer.inlineCallbacks
+    def close_spider(self, spider):
+        """Write the remaining rows, then close the files under their final names."""
+        for crawl_date in list(self.buffers):
+            self.flush(crawl_date)
+        yield defer.DeferredList(list(self.pending_writes))
+        yield threads.deferToThread(self.close_writers)
+        for path in self.paths:
+            spider.logger.info(f"Exported the crawled jobs to {path}")
+
+    def close_writers(self):
+        for writer, temporary_path, path in self.writers.values():
+            writer.close()
+            os.replace(temporary_path, path)
+            self.paths.append(path)
+        self.writers = {}
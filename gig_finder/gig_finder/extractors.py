@@ -0,0 +1,73 @@
+from lxml import etree
+
+from gig_finder.items import JobItem
+
+# Compiled once and shared by every response
+JOB_CARDS_XPATH = etree.XPath('//div[contains(@class, "JobSearchCard-item-inner")]')
+
+# (tag, class substring, field, value) rules matched while walking a card, mirroring the
+# `.//tag[contains(@class, substring)]` queries the card fields were originally read with
+CARD_RULES = (
+    ("a", "JobSearchCard-primary-heading-link", "_id", "href"),
+    ("a", "JobSearchCard-primary-heading-link", "title", "text"),
+    ("p", "JobSearchCard-primary-description", "description", "text"),
+    ("span", "JobSearchCard-primary-heading-days", "status", "text"),
+    ("a", "JobSearchCard-primary-tagsLink", "tag_links", "href"),
+    ("a", "JobSearchCard-primary-tagsLink", "tags", "text"),
+    ("div", "JobSearchCard-primary-price", "price", "text"),
+    ("div", "JobSearchCard-secondary-entry", "offers", "text"),
+    ("span", "promotion-tag", "types", "text"),
+    ("div", "JobSearchCard-primary-heading-status", "verified_payment", "exists"),
+)
+LIST_FIELDS = ("tag_links", "tags", "types")
+
+RULES_BY_TAG = {}
+for tag, substring, field, value in CARD_RULES:
+    RULES_BY_TAG.setdefault(tag, []).append((substring, field, value))
+
+
+def text_nodes(element):
+    """Return the text() nodes of an element: its own text and the tails of its children."""
+    nodes = [element.text] if element.text else []
+    nodes.extend(child.tail for child in element if child.tail)
+    return nodes
+
+
+def extract_job_cards(root, item_class=JobItem):
+    """Extract the job cards of a listing page as item_class instances, walking each card's elements once."""
+    cards = []
+    for job_card in JOB_CARDS_XPATH(root):
+        values = {field: [] for field in LIST_FIELDS}
+        for element in job_card.iterdescendants():
+            rules = RULES_BY_TAG.get(element.tag)
+            if rules is None:
+                continue
+            classes = element.get("class")
+            if classes is None:
+                continue
+            for substring, field, value in rules:
+                if substring not in classes:
+                    continue
+                if value == "exists":
+                    values[field] = True
+                    continue
+                nodes = text_nodes(element) if value == "text" else [element.get(value)]
+                if field in LIST_FIELDS:
+                    values[field].extend(node for node in nodes if node is not None)
+                elif values.get(field) is None and nodes and nodes[0] is not None:
+                    # Like .get(), keep the first node found in document order
+                    values[field] = nodes[0]
+
+        cards.append(item_class(
+            _id=values.get("_id"),
+            title=values.get("title"),
+            description=values.get("description"),
+            status=values.get("status"),
+            tag_links=values["tag_links"],
+            tags=values["tags"],
+            price=values.get("price"),
+            offers=values.get("offers"),
+            types=values["types"],
+            verified_payment=values.get("verified_payment", False),
+        ))
+    return cards
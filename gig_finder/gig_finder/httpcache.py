@@ -0,0 +1,285 @@
+import datetime
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import time
+
+import pyarrow as pa
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+logger = logging.getLogger(__name__)
+
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".sqlite"
+
+
+def cache_pack_path(settings, spider_name, pack_name):
+    """Return the path, without suffix, of a pack of cached responses of a spider."""
+    return os.path.join(data_path(settings["HTTPCACHE_DIR"]), spider_name, pack_name)
+
+
+def cache_pack_name(crawl_date, spider_name, run_name=None):
+    """Return the pack written by a process: the crawl date, followed by the shard for the shards of a crawl.
+
+    Each process of `scrapy crawl_shards` appends to a pack of its own, e.g.
+    2024-01-01-shard-1-of-4, as a pack has a single writer.
+    """
+    if not run_name or run_name == spider_name:
+        return crawl_date
+    return f"{crawl_date}-{run_name.removeprefix(f'{spider_name}-')}"
+
+
+def cache_pack_names(settings, spider_name, crawl_date=None):
+    """Return the names of the stored packs of a spider, only those of a crawl date if given, newest first."""
+    directory = os.path.dirname(cache_pack_path(settings, spider_name, "pack"))
+    if not os.path.isdir(directory):
+        return []
+    names = [name[:-len(PACK_SUFFIX)] for name in os.listdir(directory) if name.endswith(PACK_SUFFIX)]
+    if crawl_date is not None:
+        names = [name for name in names if name == crawl_date or name.startswith(f"{crawl_date}-")]
+    return sorted(names, reverse=True)
+
+
+class CachePack:
+    """Responses of one crawl date, in an append-only file of zstd compressed records and a SQLite index.
+
+    Each record is a fixed header (magic, metadata length, payload length),
+    the JSON metadata and the compressed raw headers and body. The records
+    describe themselves, so the index, keyed by request fingerprint and
+    searchable by URL, can always be rebuilt from the pack; records written
+    after its last commit are indexed again when the pack is opened. Records
+    are read through a memory map of the pack, without a copy until
+    decompression.
+    """
+
+    HEADER = struct.Struct(">4sII")
+    MAGIC = b"GFC1"
+    # Index rows are committed in groups, a crash only loses entries that the pack still holds
+    COMMIT_EVERY = 100
+
+    def __init__(self, path, compression_level=9):
+        self.path = path
+        self.pack_path = f"{path}{PACK_SUFFIX}"
+        self.index_path = f"{path}{INDEX_SUFFIX}"
+        self.codec = pa.Codec("zstd", compression_level=compression_level)
+        self.connection = None
+        self.file = None  # Append handle, only when writable
+        self.reader = None
+        self.map = None
+        self.uncommitted = 0
+
+    def open(self, writable=False):
+        """Open the index, indexing any record it is missing, and the pack for appending when writable."""
+        directory = os.path.dirname(self.pack_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (fingerprint TEXT PRIMARY KEY, url TEXT, tag TEXT, "
+            "status INTEGER, stored_at REAL, offset INTEGER, length INTEGER) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_url ON responses (url)")
+        if writable:
+            self.file = open(self.pack_path, "ab")
+        self.recover(truncate=writable)
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def recover(self, truncate=False):
+        """Index the records appended after the last index commit, dropping a record cut short by a crash."""
+        indexed_end = self.connection.execute("SELECT MAX(offset + length) FROM responses").fetchone()[0] or 0
+        size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        if size <= indexed_end:
+            return
+        offset = indexed_end
+        with open(self.pack_path, "rb") as f:
+            f.seek(offset)
+            while offset + self.HEADER.size <= size:
+                magic, metadata_length, payload_length = self.HEADER.unpack(f.read(self.HEADER.size))
+                length = self.HEADER.size + metadata_length + payload_length
+                if magic != self.MAGIC or offset + length > size:
+                    break
+                metadata = json.loads(f.read(metadata_length))
+                f.seek(payload_length, os.SEEK_CUR)
+                self.index(metadata, offset, length)
+                offset += length
+        self.connection.commit()
+        if self.uncommitted:
+            logger.info(f"Indexed {self.uncommitted} cached responses missing from {self.index_path}")
+        self.uncommitted = 0
+        if offset < size and truncate:
+            logger.warning(f"Dropping {size - offset} bytes of an incomplete record at the end of {self.pack_path}")
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+    def index(self, metadata, offset, length):
+        # A response stored again for the same request replaces the entry, the older record stays in the pack
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (metadata["fingerprint"], metadata["url"], metadata.get("tag"), metadata["status"],
+             metadata["stored_at"], offset, length),
+        )
+        self.uncommitted += 1
+
+    def append(self, fingerprint, request, response):
+        """Append a response to the pack and index it under the fingerprint and URL of its request."""
+        raw_headers = headers_dict_to_raw(response.headers) or b""
+        metadata = {
+            "fingerprint": fingerprint,
+            "url": request.url,
+            "method": request.method,
+            "tag": request.meta.get("tag"),
+            "status": response.status,
+            "response_url": response.url,
+            "stored_at": time.time(),
+            "headers_size": len(raw_headers),
+            "body_size": len(response.body),
+        }
+        encoded_metadata = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+        payload = self.codec.compress(raw_headers + response.body, asbytes=True)
+        offset = self.file.tell()
+        self.file.write(self.HEADER.pack(self.MAGIC, len(encoded_metadata), len(payload)))
+        self.file.write(encoded_metadata)
+        self.file.write(payload)
+        self.index(metadata, offset, self.HEADER.size + len(encoded_metadata) + len(payload))
+        if self.uncommitted >= self.COMMIT_EVERY:
+            self.file.flush()  # Records reach the pack before the index entries pointing to them
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def lookup(self, fingerprint):
+        """Return the (stored_at, offset, length) of the response cached for a request fingerprint, or None."""
+        return self.connection.execute(
+            "SELECT stored_at, offset, length FROM responses WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+
+    def lookup_url(self, url):
+        """Return the (stored_at, offset, length) of the latest response cached for a URL, or None."""
+        return self.connection.execute(
+            "SELECT stored_at, offset, length FROM responses WHERE url = ? ORDER BY stored_at DESC LIMIT 1", (url,)
+        ).fetchone()
+
+    def listing_pages(self):
+        """Yield the (url, tag) of every cached listing page, in the order they were fetched."""
+        yield from self.connection.execute(
+            "SELECT url, tag FROM responses WHERE tag IS NOT NULL AND status = 200 ORDER BY offset"
+        )
+
+    def read(self, offset, length):
+        """Return the (metadata, raw headers, body) of the record at an offset of the pack."""
+        if self.file is not None:
+            self.file.flush()
+        if self.map is None or offset + length > len(self.map):
+            # The pack being written grows past the mapped size
+            if self.map is not None:
+                self.map.close()
+            if self.reader is None:
+                self.reader = open(self.pack_path, "rb")
+            self.map = mmap.mmap(self.reader.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, metadata_length, payload_length = self.HEADER.unpack_from(self.map, offset)
+        if magic != self.MAGIC:
+            raise ValueError(f"No cached response at offset {offset} of {self.pack_path}")
+        start = offset + self.HEADER.size
+        metadata = json.loads(self.map[start:start + metadata_length])
+        start += metadata_length
+        payload = pa.py_buffer(self.map)[start:start + payload_length]
+        content = self.codec.decompress(payload, metadata["headers_size"] + metadata["body_size"], asbytes=True)
+        return metadata, content[:metadata["headers_size"]], content[metadata["headers_size"]:]
+
+    def response(self, offset, length):
+        """Return the cached record at an offset of the pack as a Scrapy response."""
+        metadata, raw_headers, body = self.read(offset, length)
+        url = metadata["response_url"]
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+        return response_class(url=url, headers=headers, status=metadata["status"], body=body)
+
+
+class PackedCacheStorage:
+    """HTTP cache storage keeping each crawl date in a single CachePack instead of a directory per response.
+
+    Responses are appended to the pack of the current crawl date, one per
+    shard in a sharded crawl, and looked up in the packs of that date only,
+    so a live crawl never gets the listing pages of an earlier day and every
+    day's pack holds what that day's crawl saw. A spider with a `replay`
+    date only reads the packs of that date.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.compression_level = settings.getint("HTTPCACHE_ZSTD_LEVEL", 9)
+        self.packs = {}  # pack name -> CachePack, opened on first use
+        self.pack_names = []
+        self.write_pack = None  # Name of the pack this process appends to
+
+    def open_spider(self, spider):
+        self.spider_name = spider.name
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        replay = getattr(spider, "replay", None)
+        if replay:
+            self.pack_names = cache_pack_names(self.settings, spider.name, replay)
+            self.write_pack = None  # The replayed packs are only read, a replay stores nothing
+        else:
+            crawl_date = getattr(spider, "today", None) or datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+            self.write_pack = cache_pack_name(crawl_date, spider.name, getattr(spider, "run_name", None))
+            os.makedirs(os.path.dirname(cache_pack_path(self.settings, spider.name, self.write_pack)), exist_ok=True)
+            self.pack_names = sorted(set(cache_pack_names(self.settings, spider.name, crawl_date)) | {self.write_pack},
+                                     reverse=True)
+        logger.debug(f"Using the packed cache storage with {len(self.pack_names)} packs", extra={"spider": spider})
+
+    def close_spider(self, spider):
+        for pack in self.packs.values():
+            pack.close()
+        self.packs = {}
+
+    def pack(self, name):
+        if name not in self.packs:
+            path = cache_pack_path(self.settings, self.spider_name, name)
+            if name != self.write_pack and not os.path.exists(f"{path}{PACK_SUFFIX}"):
+                return None
+            self.packs[name] = CachePack(path, self.compression_level).open(writable=name == self.write_pack)
+        return self.packs[name]
+
+    def retrieve_response(self, spider, request):
+        """Return the response cached for a request, or None if it is not cached or expired."""
+        fingerprint = self.fingerprinter.fingerprint(request).hex()
+        for name in self.pack_names:
+            pack = self.pack(name)
+            entry = pack.lookup(fingerprint) if pack is not None else None
+            if entry is None:
+                continue
+            stored_at, offset, length = entry
+            if 0 < self.expiration_secs < time.time() - stored_at:
+                continue  # Another shard's pack of the date may hold a fresher copy
+            return pack.response(offset, length)
+        return None
+
+    def store_response(self, spider, request, response):
+        if self.write_pack is None:
+            return
+        self.pack(self.write_pack).append(self.fingerprinter.fingerprint(request).hex(), request, response)
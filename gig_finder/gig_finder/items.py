@@ -3,10 +3,178 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
-import scrapy
+import sys
 
+from collections.abc import MutableMapping
+from dataclasses import dataclass, fields
+from decimal import Decimal
 
-class GigFinderItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+from boto3.dynamodb.types import TypeSerializer
+from itemadapter import ItemAdapter
+from itemadapter.adapter import AdapterInterface
+
+
+class _Missing:
+    """Value of a JobItem field that was never set, which a dict would not have as a key."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        return "MISSING"  # Unpickled as the module singleton
+
+
+MISSING = _Missing()
+
+# Fields whose values repeat across thousands of jobs, stored once per distinct string
+INTERNED_LIST_FIELDS = ("tags", "tag_links", "types", "found_under")
+
+SERIALIZER = TypeSerializer()
+
+
+@dataclass(slots=True, eq=False, repr=False)
+class JobItem(MutableMapping):
+    """A job card, from its raw extracted strings to the attributes stored in DynamoDB.
+
+    The field set is fixed and kept in slots, without a per-item dict. The item
+    still behaves as a mapping of its set fields, so the pipelines keep reading
+    and updating it in place like the dicts the spider used to yield; an unset
+    field is absent, not None.
+    """
+
+    # Extracted from the listing page
+    _id: str = MISSING
+    title: str = MISSING
+    description: str = MISSING
+    status: str = MISSING
+    tag_links: list = MISSING
+    tags: list = MISSING
+    price: str = MISSING  # Parsed into price_min, price_max, currency and is_hourly, then removed
+    offers: object = MISSING  # Raw text, then the number of offers
+    types: list = MISSING
+    verified_payment: bool = MISSING
+    found_under: list = MISSING  # Tags the job was listed under, set by DuplicateJobCardMiddleware
+    # Set by ItemNormalizer
+    is_competition: bool = MISSING
+    price_min: Decimal = MISSING
+    price_max: Decimal = MISSING
+    currency: str = MISSING
+    is_hourly: bool = MISSING
+    last_seen_at: str = MISSING
+    # Set by GigFinderPipeline
+    created_at: str = MISSING
+    history: list = MISSING
+    active_shard: str = MISSING
+    relevance_score: Decimal = MISSING
+
+    def __post_init__(self):
+        for field in INTERNED_LIST_FIELDS:
+            values = getattr(self, field)
+            if values is not MISSING:
+                values[:] = [sys.intern(value) if type(value) is str else value for value in values]
+
+    def __getitem__(self, field):
+        # Checked against the fields, getattr alone would also find the methods, e.g. item["get"]
+        value = getattr(self, field) if field in self.__dataclass_fields__ else MISSING
+        if value is MISSING:
+            raise KeyError(field)
+        return value
+
+    def __setitem__(self, field, value):
+        if field not in FIELD_NAMES:
+            raise KeyError(f"JobItem does not support field: {field}")
+        setattr(self, field, value)
+
+    def __delitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        setattr(self, field, MISSING)
+
+    def __iter__(self):
+        return (field for field in FIELD_NAMES if getattr(self, field) is not MISSING)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, field):
+        return field in self.__dataclass_fields__ and getattr(self, field) is not MISSING
+
+    def get(self, field, default=None):
+        value = getattr(self, field) if field in self.__dataclass_fields__ else MISSING
+        return default if value is MISSING else value
+
+    def __repr__(self):
+        return f"JobItem({dict(self)!r})"
+
+    def to_dynamodb(self):
+        """Return the set fields in the DynamoDB wire format, e.g. {"title": {"S": "..."}}.
+
+        Strings, numbers, booleans and string lists, which make up nearly every
+        field, are converted directly; only the history goes through boto3's
+        type inspection.
+        """
+        attributes = {}
+        for field in FIELD_NAMES:
+            value = getattr(self, field)
+            if value is MISSING:
+                continue
+            value_type = type(value)
+            if value_type is str:
+                attributes[field] = {"S": value}
+            elif value_type is bool:
+                attributes[field] = {"BOOL": value}
+            elif value_type is int:
+                attributes[field] = {"N": str(value)}
+            elif value is None:
+                attributes[field] = {"NULL": True}
+            elif value_type is list and all(type(element) is str for element in value):
+                attributes[field] = {"L": [{"S": element} for element in value]}
+            else:
+                attributes[field] = SERIALIZER.serialize(value)  # Validates numbers and nested maps
+        return attributes
+
+
+FIELD_NAMES = tuple(field.name for field in fields(JobItem))
+
+
+def dynamodb_item(item):
+    """Return a JobItem or a plain dict of attributes in the DynamoDB wire format."""
+    if isinstance(item, JobItem):
+        return item.to_dynamodb()
+    return {field: SERIALIZER.serialize(value) for field, value in item.items()}
+
+
+class JobItemAdapter(AdapterInterface):
+    """Show Scrapy components such as the feed exporters only the set fields of a JobItem.
+
+    Without it, JobItem would be handled as a plain dataclass and every unset
+    field would be exported as MISSING.
+    """
+
+    @classmethod
+    def is_item_class(cls, item_class):
+        return issubclass(item_class, JobItem)
+
+    @classmethod
+    def get_field_names_from_class(cls, item_class):
+        return list(FIELD_NAMES)
+
+    def __getitem__(self, field):
+        return self.item[field]
+
+    def __setitem__(self, field, value):
+        self.item[field] = value
+
+    def __delitem__(self, field):
+        del self.item[field]
+
+    def __iter__(self):
+        return iter(self.item)
+
+    def __len__(self):
+        return len(self.item)
+
+
+ItemAdapter.ADAPTER_CLASSES.appendleft(JobItemAdapter)
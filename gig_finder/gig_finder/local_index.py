@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from boto3.dynamodb.types import TypeDeserializer
+from scrapy.utils.project import data_path
+
+from gig_finder.items import dynamodb_item
+
+DESERIALIZER = TypeDeserializer()
+
+
+def local_index_path(settings, spider_name):
+    """Return the index file of a spider, or None when the local index is disabled."""
+    if not settings.getbool("LOCAL_INDEX_ENABLED", True):
+        return None
+    index_dir = data_path(settings.get("LOCAL_INDEX_DIR", "local_index"), createdir=True)
+    return os.path.join(index_dir, f"{spider_name}.sqlite")
+
+
+class LocalItemIndex:
+    """On-disk index of the items already stored in DynamoDB, keyed by _id.
+
+    Each entry keeps the day the item was last written, a digest of the
+    content that was written apart from the tracked fields, and the values of
+    the tracked fields, so the pipeline can tell unchanged items apart and
+    build the change record of an item whose tracked fields alone changed
+    (such as the daily days-left countdown of its status) without reading it
+    back from the table.
+    """
+
+    # Fields that change on every visit and therefore never count as a content change
+    # The relevance score drifts with the word frequencies of every job crawled since, unchanged items get it
+    # written along with their last_seen_at
+    volatile_fields = ("last_seen_at", "created_at", "history", "active_shard", "found_under", "relevance_score")
+
+    def __init__(self, path, tracked_fields=()):
+        self.path = path
+        self.tracked_fields = tuple(tracked_fields)
+        self.entries = {}  # _id -> (digest, last_seen_at, tracked values in the DynamoDB wire format as JSON)
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def open(self):
+        """Open the SQLite file and preload every entry into memory."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS items (_id TEXT PRIMARY KEY, digest TEXT, last_seen_at TEXT, tracked TEXT) "
+            "WITHOUT ROWID"
+        )
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(items)")}
+        if "tracked" not in columns:
+            # Written before the tracked values were kept, its entries take the full write path once
+            with self.connection:
+                self.connection.execute("ALTER TABLE items ADD COLUMN tracked TEXT")
+        self.entries = {
+            item_id: (digest, last_seen_at, tracked)
+            for item_id, digest, last_seen_at, tracked in self.connection.execute(
+                "SELECT _id, digest, last_seen_at, tracked FROM items"
+            )
+        }
+
+    def close(self):
+        """Close the SQLite file."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def digest(self, item):
+        """Return a digest of the item content, ignoring the bookkeeping and the tracked fields."""
+        content = {
+            field: value for field, value in item.items()
+            if field not in self.volatile_fields and field not in self.tracked_fields
+        }
+        serialized = json.dumps(content, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
+
+    def tracked(self, item):
+        """Return the tracked values of an item as recorded in an entry."""
+        values = {field: item[field] for field in self.tracked_fields if field in item}
+        return json.dumps(dynamodb_item(values), sort_keys=True, ensure_ascii=False)
+
+    @staticmethod
+    def tracked_values(entry):
+        """Return the tracked values recorded in an entry, typed as read from the table, or None if unknown."""
+        if entry[2] is None:
+            return None
+        return {field: DESERIALIZER.deserialize(value) for field, value in json.loads(entry[2]).items()}
+
+    def get(self, item_id):
+        """Return the (digest, last_seen_at, tracked) entry recorded for an item, or None."""
+        return self.entries.get(item_id)
+
+    def update(self, entries):
+        """Record (item_id, digest, last_seen_at, tracked) entries for items that were just written."""
+        entries = list(entries)
+        if not entries:
+            return
+        with self.lock:
+            for item_id, digest, last_seen_at, tracked in entries:
+                self.entries[item_id] = (digest, last_seen_at, tracked)
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)", entries)
+
+    def discard(self, item_ids):
+        """Forget items whose stored version was changed outside of the crawl."""
+        item_ids = list(item_ids)
+        if not item_ids:
+            return
+        with self.lock:
+            for item_id in item_ids:
+                self.entries.pop(item_id, None)
+            with self.connection:
+                self.connection.executemany("DELETE FROM items WHERE _id = ?", [(item_id,) for item_id in item_ids])
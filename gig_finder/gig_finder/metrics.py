@@ -0,0 +1,208 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.project import data_path
+
+# Upper bounds, in seconds, of the latency histogram buckets (the Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# DynamoDB operations accepting ReturnConsumedCapacity
+CAPACITY_OPERATIONS = {
+    "BatchGetItem", "BatchWriteItem", "DeleteItem", "GetItem", "PutItem", "Query", "Scan",
+    "TransactGetItems", "TransactWriteItems", "UpdateItem",
+}
+THROTTLING_ERRORS = {"ProvisionedThroughputExceededException", "RequestLimitExceeded", "ThrottlingException"}
+
+
+class Metrics:
+    """Counters and latency histograms recorded in the Scrapy stats, safe to use from storage threads.
+
+    Counters are plain stats under gig_finder/. A histogram is a single stat,
+    gig_finder/histogram/<name>[/<label>=<value>...], holding a dict with the
+    observation count, their sum in seconds and a count per LATENCY_BUCKETS
+    bound. Without stats every call is a no-op.
+    """
+
+    # The stats collector is not thread safe; the spider and the pipeline each have their own
+    # Metrics over the same collector, so every instance shares one lock
+    lock = threading.Lock()
+
+    def __init__(self, stats=None):
+        self.stats = stats
+
+    def inc(self, key, count=1):
+        if self.stats is None:
+            return
+        with self.lock:
+            self.stats.inc_value(f"gig_finder/{key}", count)
+
+    def observe(self, name, seconds, **labels):
+        """Add a duration to a histogram."""
+        if self.stats is None:
+            return
+        key = "/".join([f"gig_finder/histogram/{name}", *(f"{label}={value}" for label, value in sorted(labels.items()))])
+        with self.lock:
+            histogram = self.stats.get_value(key)
+            if histogram is None:
+                histogram = {"count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)}
+                self.stats.set_value(key, histogram)
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the enclosed block into a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def instrument_dynamodb(self, client):
+        """Time every call of a DynamoDB client and count its consumed capacity, retries and throttling."""
+        if self.stats is None:
+            return
+        events = client.meta.events
+        events.register("provide-client-params.dynamodb", self.request_consumed_capacity)
+        events.register("before-call.dynamodb", self.start_call)
+        events.register("after-call.dynamodb", self.finish_call)
+        # First, the retry handler stops the event as soon as it decides to retry
+        events.register_first("needs-retry.dynamodb", self.count_throttling)
+
+    def request_consumed_capacity(self, params, model, **kwargs):
+        if model.name in CAPACITY_OPERATIONS:
+            params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+    def start_call(self, context, **kwargs):
+        context["gig_finder_started"] = time.perf_counter()
+
+    def finish_call(self, parsed, model, context, **kwargs):
+        operation = model.name
+        started = context.get("gig_finder_started")
+        if started is not None:
+            self.observe("dynamodb_call", time.perf_counter() - started, operation=operation)
+        self.inc(f"dynamodb/{operation}/calls")
+
+        consumed = parsed.get("ConsumedCapacity")
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        capacity = sum(entry.get("CapacityUnits", 0) for entry in consumed or [])
+        if capacity:
+            self.inc(f"dynamodb/{operation}/consumed_capacity", capacity)
+
+        retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retries:
+            self.inc(f"dynamodb/{operation}/retries", retries)
+        if parsed.get("UnprocessedKeys") or parsed.get("UnprocessedItems"):
+            self.inc(f"dynamodb/{operation}/unprocessed")  # Resent by the caller, usually under throttling
+        error = parsed.get("Error", {}).get("Code")
+        if error:
+            self.inc(f"dynamodb/{operation}/errors/{error}")
+
+    def count_throttling(self, response=None, operation=None, **kwargs):
+        if response is not None and response[1].get("Error", {}).get("Code") in THROTTLING_ERRORS:
+            self.inc(f"dynamodb/{operation.name}/throttled")
+
+
+def timed(name):
+    """Record each run of a method in the histogram `name`, labelled with the method name.
+
+    The object's `metrics` attribute is used, nothing is recorded when it is None.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            with self.metrics.timer(name, method=method.__name__):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def prometheus_name(key):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+def prometheus_text(stats):
+    """Render numeric stats as gauges and gig_finder histograms as Prometheus histograms."""
+    lines = []
+    histograms = {}
+    for key, value in sorted(stats.items()):
+        if key.startswith("gig_finder/histogram/"):
+            name, *labels = key[len("gig_finder/histogram/"):].split("/")
+            histograms.setdefault(name, []).append((dict(label.split("=", 1) for label in labels), value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            name = f"scrapy_{prometheus_name(key)}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+
+    for name, series in histograms.items():
+        name = f"gig_finder_{prometheus_name(name)}_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            label_text = "".join(f'{label}="{value}",' for label, value in sorted(labels.items()))
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                lines.append(f'{name}_bucket{{{label_text}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label_text}le="+Inf"}} {histogram["count"]}')
+            label_text = "{" + label_text.rstrip(",") + "}" if label_text else ""
+            lines.append(f"{name}_sum{label_text} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsDump:
+    """Write the crawl stats to a file when the spider closes, after the pipelines have flushed.
+
+    METRICS_DUMP_FORMAT "prometheus" writes a textfile for the node_exporter
+    textfile collector, "json" writes every stat as is.
+    """
+
+    def __init__(self, stats, path, output_format):
+        self.stats = stats
+        self.path = path
+        self.output_format = output_format
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        output_format = crawler.settings.get("METRICS_DUMP_FORMAT")
+        if not output_format:
+            raise NotConfigured
+        if output_format not in ("prometheus", "json"):
+            raise NotConfigured(f"Unknown METRICS_DUMP_FORMAT '{output_format}', expected 'prometheus' or 'json'")
+        default_file = "metrics.prom" if output_format == "prometheus" else "metrics.json"
+        path = data_path(crawler.settings.get("METRICS_DUMP_FILE") or default_file)
+        extension = cls(crawler.stats, path, output_format)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_closed(self, spider, reason):
+        stats = dict(self.stats.get_stats(), finish_reason=reason)
+        if self.output_format == "prometheus":
+            content = prometheus_text(stats)
+        else:
+            content = json.dumps(stats, indent=4, default=str)
+
+        path = self.path
+        shard = getattr(spider, "shard", None)
+        if shard is not None:
+            # Each shard of a crawl writes its own file, e.g. metrics-shard-0-of-4.prom
+            root, extension = os.path.splitext(path)
+            path = f"{root}-shard-{shard[0]}-of-{shard[1]}{extension}"
+
+        # Renamed into place, so collectors never read a partial file
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+        spider.logger.info(f"Wrote the crawl metrics to {path}")
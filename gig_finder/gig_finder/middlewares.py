@@ -3,11 +3,22 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import json
+import os
+import time
+
+from collections import OrderedDict
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import task
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from gig_finder.items import JobItem
+
 
 class GigFinderSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +112,268 @@ class GigFinderDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class DuplicateJobCardMiddleware:
+    """Drop job cards already yielded under another tag before they reach the pipelines.
+
+    The first card of a job gets a `found_under` list with the tag it was listed
+    under; later sightings append their tag to that list and are dropped. The
+    list goes to the table with its item, and GigFinderPipeline appends the
+    tags added after the item's batch was written when the spider closes. At
+    most DEDUP_MAX_ENTRIES jobs are remembered, the least recently seen ones
+    are forgotten first.
+    """
+
+    def __init__(self, stats, max_entries):
+        self.stats = stats
+        self.max_entries = max_entries
+        self.seen = OrderedDict()  # hash of the card _id -> found_under list of its first card
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("DEDUP_ENABLED", True):
+            raise NotConfigured
+        return cls(crawler.stats, crawler.settings.getint("DEDUP_MAX_ENTRIES", 100000))
+
+    def process_spider_output(self, response, result, spider):
+        tag = response.meta.get("tag")
+        for element in result:
+            if not isinstance(element, (dict, JobItem)) or not element.get("_id"):
+                yield element
+                continue
+
+            key = hash(element["_id"])  # An int key keeps the memory per job small
+            found_under = self.seen.get(key)
+            if found_under is not None:
+                self.seen.move_to_end(key)
+                if tag and tag not in found_under:
+                    found_under.append(tag)
+                self.stats.inc_value("gig_finder/dedup/duplicates")
+                continue
+
+            element["found_under"] = [tag] if tag else []
+            self.seen[key] = element["found_under"]
+            if len(self.seen) > self.max_entries:
+                self.seen.popitem(last=False)
+                self.stats.inc_value("gig_finder/dedup/evicted")
+            self.stats.inc_value("gig_finder/dedup/unique")
+            yield element
+
+
+class TagYieldStore:
+    """Expected number of new items per listing page, and of listing pages, of each tag, learnt across runs."""
+
+    def __init__(self, path, smoothing=0.5):
+        self.path = path
+        self.smoothing = smoothing  # Weight of the latest run in the moving average
+        self.yields = {}
+        self.page_counts = {}  # tag -> listing pages fetched per run
+        self.pages = {}
+        self.new_items = {}
+
+    def load(self):
+        """Read the yields and page counts of previous runs, if any."""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data.get("yields"), dict):
+                self.yields = data["yields"]
+                self.page_counts = data.get("pages", {})
+            else:
+                self.yields = data  # Written before the page counts were kept
+        return self
+
+    def expected_yield(self, tag):
+        """Return the expected new items per page of a tag; unseen tags rank above every known one."""
+        if tag in self.yields:
+            return self.yields[tag]
+        return max(self.yields.values(), default=0) + 1
+
+    def record_page(self, tag):
+        self.pages[tag] = self.pages.get(tag, 0) + 1
+
+    def record_new_item(self, tag):
+        self.new_items[tag] = self.new_items.get(tag, 0) + 1
+
+    def expected_pages(self, tag):
+        """Return the listing pages a tag had per run, or None for a tag never crawled."""
+        return self.page_counts.get(tag)
+
+    def save(self):
+        """Fold this run into the moving averages and write them."""
+        # Read again first, the other processes of a sharded crawl save the tags they crawled too
+        self.load()
+        for tag, pages in self.pages.items():
+            current = self.new_items.get(tag, 0) / pages
+            previous = self.yields.get(tag, current)
+            self.yields[tag] = round(self.smoothing * current + (1 - self.smoothing) * previous, 3)
+            previous = self.page_counts.get(tag, pages)
+            self.page_counts[tag] = round(self.smoothing * pages + (1 - self.smoothing) * previous, 1)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"yields": self.yields, "pages": self.page_counts}, f, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
+
+
+class TagThrottle:
+    """Download delay and concurrency of the slot of a single tag."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.concurrency = 1
+        self.latencies = []
+
+
+class AdaptiveTagThrottleMiddleware:
+    """Give each tag its own download slot and tune its delay and concurrency from its responses.
+
+    A tag speeds up (shorter delay first, then more concurrency once the delay is
+    0, as Scrapy sends one request at a time in a slot with a delay) while a window
+    of responses stays under the target latency with no throttling status, and
+    backs off on its own as soon as the site answers 403/429/503 or latency
+    degrades. The requests of every tag are also paced by a global interval, so
+    the crawl starts at one request per DOWNLOAD_DELAY whatever the number of
+    tags, and the interval only shrinks (down to ADAPTIVE_THROTTLE_MIN_DELAY /
+    CONCURRENT_REQUESTS) as tags speed up.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        if settings.getbool("AUTOTHROTTLE_ENABLED"):
+            raise NotConfigured("ADAPTIVE_THROTTLE_ENABLED needs AUTOTHROTTLE_ENABLED = False, both set slot delays")
+
+        self.crawler = crawler
+        self.start_delay = settings.getfloat("DOWNLOAD_DELAY")
+        self.min_delay = settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 1.0)
+        self.max_delay = settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0)
+        self.max_concurrency = settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", 2)
+        self.target_latency = settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 2.0)
+        self.window = settings.getint("ADAPTIVE_THROTTLE_WINDOW", 5)
+        self.throttle_codes = set(settings.getlist("ADAPTIVE_THROTTLE_HTTP_CODES", [403, 429, 503]))
+        self.log_interval = settings.getfloat("LOGSTATS_INTERVAL", 60.0)
+        self.interval = self.start_delay  # Global seconds between the requests of all the tags
+        self.min_interval = self.min_delay / max(1, settings.getint("CONCURRENT_REQUESTS"))
+        self.next_request_at = 0.0
+        self.tags = {}
+        self.responses = 0
+        self.last_responses = 0
+        self.last_tick = None
+        self.metrics_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.item_scraped, signal=signals.item_scraped)
+        return s
+
+    def spider_opened(self, spider):
+        self.last_tick = time.monotonic()
+        self.metrics_loop = task.LoopingCall(self.log_metrics, spider)
+        self.metrics_loop.start(self.log_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.metrics_loop is not None and self.metrics_loop.running:
+            self.metrics_loop.stop()
+        tag_yields = getattr(spider, "tag_yields", None)
+        if tag_yields is not None:
+            tag_yields.save()
+
+    def item_scraped(self, item, response, spider):
+        tag = response.meta.get("tag")
+        known_items = getattr(spider, "known_items", None)
+        tag_yields = getattr(spider, "tag_yields", None)
+        if tag and item and tag_yields is not None and known_items is not None:
+            if known_items.get(item.get("_id")) is None:
+                tag_yields.record_new_item(tag)
+
+    def process_request(self, request, spider):
+        tag = request.meta.get("tag")
+        if not tag:
+            return None
+        if "download_slot" not in request.meta:
+            request.meta["download_slot"] = f"{urlparse_cached(request).hostname}/{tag}"
+        # The slots each have their own delay, the global interval keeps their sum from raising the crawl rate
+        now = time.monotonic()
+        wait = self.next_request_at - now
+        self.next_request_at = max(now, self.next_request_at) + self.interval
+        if wait > 0:
+            from twisted.internet import reactor  # Imported late so Scrapy can install the configured reactor first
+            return task.deferLater(reactor, wait, lambda: None)
+        return None
+
+    def process_response(self, request, response, spider):
+        tag = request.meta.get("tag")
+        if tag:
+            self.responses += 1
+            if response.status == 200 and getattr(spider, "tag_yields", None) is not None:
+                spider.tag_yields.record_page(tag)
+            self.observe(spider, tag, request.meta.get("download_slot"), response.status,
+                         request.meta.get("download_latency"))
+        return response
+
+    def process_exception(self, request, exception, spider):
+        tag = request.meta.get("tag")
+        if tag:
+            self.observe(spider, tag, request.meta.get("download_slot"), None, None)
+
+    def observe(self, spider, tag, slot_key, status, latency):
+        """Update the throttle of a tag with one response (status None for a failed download)."""
+        state = self.tags.setdefault(tag, TagThrottle(self.start_delay))
+        decision = None
+        if status is None or status in self.throttle_codes:
+            state.delay = min(self.max_delay, max(state.delay, self.min_delay) * 2)
+            state.concurrency = 1
+            state.latencies = []
+            self.interval = min(self.max_delay, max(self.interval, self.min_interval) * 2)
+            decision = "backoff"
+        elif latency is not None:
+            state.latencies.append(latency)
+            if len(state.latencies) >= self.window:
+                mean_latency = sum(state.latencies) / len(state.latencies)
+                state.latencies = []
+                if mean_latency <= self.target_latency:
+                    if state.delay > self.min_delay:
+                        state.delay = max(self.min_delay, state.delay * 0.75)
+                        decision = "speedup"
+                    elif state.delay <= 0 and state.concurrency < self.max_concurrency:
+                        # A slot with a delay sends one request at a time whatever its concurrency
+                        state.concurrency += 1
+                        decision = "speedup"
+                    if decision:
+                        self.interval = max(self.min_interval, self.interval * 0.9)
+                elif mean_latency > 2 * self.target_latency:
+                    state.delay = min(self.max_delay, state.delay * 1.5)
+                    state.concurrency = max(1, state.concurrency - 1)
+                    self.interval = min(self.max_delay, self.interval * 1.5)
+                    decision = "slowdown"
+
+        if decision:
+            self.crawler.stats.inc_value(f"gig_finder/throttle/{decision}")
+            spider.logger.info(
+                f"Throttle {decision} for tag {tag} (status {status}): "
+                f"delay {state.delay:.2f}s, concurrency {state.concurrency}"
+            )
+        slot = self.crawler.engine.downloader.slots.get(slot_key)
+        if slot is not None:
+            slot.delay = state.delay
+            slot.concurrency = state.concurrency
+
+    def log_metrics(self, spider):
+        """Publish the effective request rate and the state of the tag throttles."""
+        now = time.monotonic()
+        rate = (self.responses - self.last_responses) / (now - self.last_tick)
+        self.last_responses, self.last_tick = self.responses, now
+        self.crawler.stats.set_value("gig_finder/throttle/requests_per_sec", round(rate, 3))
+        self.crawler.stats.set_value("gig_finder/throttle/tags", len(self.tags))
+        self.crawler.stats.set_value("gig_finder/throttle/interval", round(self.interval, 3))
+        if self.tags:
+            delays = sorted(state.delay for state in self.tags.values())
+            spider.logger.info(
+                f"Throttle: {rate:.2f} requests/sec over {len(self.tags)} tags, "
+                f"delays {delays[0]:.2f}s to {delays[-1]:.2f}s, global interval {self.interval:.2f}s"
+            )
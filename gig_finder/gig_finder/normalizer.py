@@ -0,0 +1,75 @@
+import re
+import sys
+
+from decimal import Decimal
+
+# Patterns are compiled once at import time and shared by every item
+OFFERS_PATTERN = re.compile(r'(\d+)\s*(bids?|entr(?:y|ies))?')
+# Ranges are written with a hyphen, an en dash or an em dash
+PRICE_PATTERN = re.compile(
+    r'(?P<symbol>[^\d\s.,\-–—]*)\s*(?P<min>\d[\d,]*(?:\.\d+)?)'
+    r'(?:\s*[\-–—]\s*[^\d\s.,\-–—]*\s*(?P<max>\d[\d,]*(?:\.\d+)?))?'
+    r'\s*(?P<code>[A-Z]{3})?'
+    r'(?P<hourly>\s*/\s*hr)?'
+)
+BASE_URL = "https://www.freelancer.com"
+
+# Currency shown by a symbol only, used when the card has no ISO code after the amount
+CURRENCY_SYMBOLS = {
+    "$": "USD",
+    "€": "EUR",
+    "£": "GBP",
+    "₹": "INR",
+    "¥": "JPY",
+    "₱": "PHP",
+    "Rp": "IDR",
+    "RM": "MYR",
+    "R$": "BRL",
+}
+
+
+class ItemNormalizer:
+    """Turn the raw strings of a job card into the typed fields stored in DynamoDB."""
+
+    def is_private(self, item):
+        """Return True for private projects and items with no price, which are not stored."""
+        return (item.get('offers') is None and item.get('price') is None) or item.get('price') == 'N/A'
+
+    def normalize(self, item, today):
+        """Normalize the item in place and return it."""
+        for field, value in item.items():
+            if isinstance(value, str):
+                item[field] = self.clean_string(value)
+            elif isinstance(value, list):
+                # Cleaned in place, other stages may still hold a reference to the list. The tags and
+                # types repeat across jobs, so each distinct cleaned string is kept once.
+                value[:] = [sys.intern(self.clean_string(element)) for element in value if isinstance(element, str)]
+
+        item['offers'], item['is_competition'] = self.parse_offers(item.get('offers'))
+        item['price_min'], item['price_max'], item['currency'], item['is_hourly'] = self.parse_price(item.pop('price', None))
+
+        item['_id'] = f"{BASE_URL}{item.get('_id', '')}"
+        item['last_seen_at'] = today
+        return item
+
+    def clean_string(self, text):
+        """Clean whitespace and normalize strings."""
+        return " ".join(text.split())
+
+    def parse_offers(self, offers):
+        """Return the number of offers and whether they are contest entries, e.g. '12 entries' -> (12, True)."""
+        match = OFFERS_PATTERN.search(offers) if offers else None
+        if not match:
+            return None, False
+        return int(match.group(1)), bool(match.group(2) and match.group(2).startswith('entr'))
+
+    def parse_price(self, price):
+        """Return (price_min, price_max, currency, is_hourly) from a price such as '€30 - €250 EUR / hr'."""
+        match = PRICE_PATTERN.search(price) if price else None
+        if not match:
+            return None, None, None, False
+
+        price_min = Decimal(match.group('min').replace(',', ''))
+        price_max = Decimal(match.group('max').replace(',', '')) if match.group('max') else price_min
+        currency = match.group('code') or CURRENCY_SYMBOLS.get(match.group('symbol'))
+        return price_min, price_max, currency, bool(match.group('hourly'))
@@ -1,92 +1,554 @@
+import copy
 import datetime
+import hashlib
+import threading
+import time
 import boto3
-import re
 
-from boto3.dynamodb.conditions import Attr
-from decimal import Decimal
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from twisted.internet import defer, task, threads
+from twisted.python.threadpool import ThreadPool
+
+from gig_finder.aggregates import MarketAggregates, TagDay
+from gig_finder.items import dynamodb_item
+from gig_finder.local_index import LocalItemIndex, local_index_path
+from gig_finder.metrics import Metrics, timed
+from gig_finder.normalizer import ItemNormalizer
+from gig_finder.relevance import DocumentFrequencyStore, RelevanceScorer, relevance_store_path
 
 class GigFinderPipeline:
-    def __init__(self, aws_region, aws_access_key, aws_secret_key):
-        self.dynamodb_manager = DynamoDBManager(aws_region, aws_access_key, aws_secret_key)
+    def __init__(self, aws_region, aws_access_key, aws_secret_key, batch_size=100, flush_interval=5.0,
+                 async_writes=True, max_inflight_writes=4, write_retries=3, active_shards=10, update_workers=8,
+                 local_index_path=None, history_storage="inline", delta_writes=True, storage_options=None,
+                 relevance_path=None, relevance_keywords=None, relevance_learn=True, aggregates=True,
+                 aggregates_accuracy=0.01, stats=None):
+        self.metrics = Metrics(stats)
+        self.dynamodb_manager = DynamoDBManager(aws_region, aws_access_key, aws_secret_key, active_shards,
+                                                metrics=self.metrics, **(storage_options or {}))
+        self.normalizer = ItemNormalizer()
         self.track_fields = ["status", "price_min", "price_max", "offers", "is_competition", 
                              "is_hourly", "types", "verified_payment", "tags"]  # Default fields to track
         self.today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch = {}  # Pending items keyed by _id, in arrival order
+        # found_under lists of the flushed items, shared with DuplicateJobCardMiddleware, and their length
+        # when flushed; tags it adds later are appended to the stored lists when the spider closes
+        self.flushed_found_under = {}
+        self.flush_loop = None
+        self.async_writes = async_writes
+        self.threadpool = None  # Runs the blocking boto3 calls off the reactor thread
+        self.inflight = defer.DeferredSemaphore(max(1, max_inflight_writes))
+        self.pending_writes = set()
+        self.write_retries = write_retries
+        self.update_workers = update_workers
+        self.update_executor = None  # Runs single-item update_item calls concurrently
+        self.local_index_path = local_index_path
+        self.local_index = None
+        if history_storage not in ("inline", "table"):
+            raise ValueError(f"Unknown HISTORY_STORAGE '{history_storage}', expected 'inline' or 'table'")
+        self.history_storage = history_storage
+        self.history_table = None
+        self.delta_writes = delta_writes
+        self.relevance_path = relevance_path
+        self.relevance_keywords = relevance_keywords or {}
+        self.relevance_learn = relevance_learn
+        self.relevance = None
+        # Per tag and day market summaries, added to the aggregates table when the spider closes
+        self.aggregates = MarketAggregates(aggregates_accuracy) if aggregates else None
+        self.aggregates_table = None
 
     @classmethod
     def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings, crawler.spidercls.name, crawler.stats)
+
+    @classmethod
+    def from_settings(cls, settings, spider_name, stats=None):
         return cls(
-            aws_region=crawler.settings.get("AWS_REGION"),
-            aws_access_key=crawler.settings.get("AWS_ACCESS_KEY"),
-            aws_secret_key=crawler.settings.get("AWS_SECRET_KEY"),
+            aws_region=settings.get("AWS_REGION"),
+            aws_access_key=settings.get("AWS_ACCESS_KEY"),
+            aws_secret_key=settings.get("AWS_SECRET_KEY"),
+            batch_size=settings.getint("DYNAMODB_BATCH_SIZE", 100),
+            flush_interval=settings.getfloat("DYNAMODB_FLUSH_INTERVAL", 5.0),
+            async_writes=settings.getbool("DYNAMODB_ASYNC_WRITES", True),
+            max_inflight_writes=settings.getint("DYNAMODB_MAX_INFLIGHT_WRITES", 4),
+            write_retries=settings.getint("DYNAMODB_WRITE_RETRIES", 3),
+            active_shards=settings.getint("DYNAMODB_ACTIVE_SHARDS", 10),
+            update_workers=settings.getint("DYNAMODB_UPDATE_WORKERS", 8),
+            local_index_path=local_index_path(settings, spider_name),
+            history_storage=settings.get("HISTORY_STORAGE", "inline"),
+            delta_writes=settings.getbool("DYNAMODB_DELTA_WRITES", True),
+            storage_options=DynamoDBManager.options_from_settings(settings),
+            relevance_path=relevance_store_path(settings),
+            relevance_keywords=settings.getdict("RELEVANCE_KEYWORDS"),
+            relevance_learn=settings.getbool("RELEVANCE_LEARN", True),
+            aggregates=settings.getbool("MARKET_AGGREGATES_ENABLED", True),
+            aggregates_accuracy=settings.getfloat("MARKET_AGGREGATES_ACCURACY", 0.01),
+            stats=stats,
         )
 
     def open_spider(self, spider):
         """Initialize the DynamoDB manager and table."""
-        self.table = self.dynamodb_manager.get_or_create_table(spider.name)
+        # A replay stores the jobs of a past day in a table of its own
+        self.today = getattr(spider, "today", self.today)
+        self.open_storage(getattr(spider, "table_name", spider.name), spider.logger)
+        if self.relevance_path:
+            self.relevance = RelevanceScorer(DocumentFrequencyStore(self.relevance_path).open(), self.relevance_keywords,
+                                             learn=self.relevance_learn)
+            spider.logger.info(f"Scoring jobs against {len(self.relevance.keywords)} keywords, with the word "
+                               f"frequencies of {self.relevance.store.documents} jobs")
+        if self.async_writes:
+            self.threadpool = ThreadPool(minthreads=1, maxthreads=self.inflight.limit, name="dynamodb")
+            self.threadpool.start()
+        if self.flush_interval > 0:
+            # Flush partial batches periodically so slow crawls still persist their items
+            self.flush_loop = task.LoopingCall(self.flush_batch, spider)
+            self.flush_loop.start(self.flush_interval, now=False)
+
+    def open_storage(self, table_name, logger):
+        """Open the tables and the local index, also used without a crawl by `scrapy crawl_shards`."""
+        self.table = self.dynamodb_manager.get_or_create_table(table_name)
+        # The description loaded by get_or_create_table is recent enough
+        self.has_active_index = self.dynamodb_manager.has_active_index(self.table, reload=False)
+        tables = [self.table]
+        if self.history_storage == "table":
+            self.history_table = self.dynamodb_manager.get_or_create_history_table(
+                DynamoDBManager.history_table_name(self.table.name)
+            )
+            tables.append(self.history_table)
+        if self.aggregates is not None:
+            self.aggregates_table = self.dynamodb_manager.get_or_create_aggregates_table(
+                DynamoDBManager.aggregates_table_name(self.table.name)
+            )
+            tables.append(self.aggregates_table)
+        for table in tables:
+            try:
+                for change in self.dynamodb_manager.configure_capacity(table):
+                    logger.info(f"Table {table.name}: {change}")
+            except Exception as e:
+                # The crawl can still run on the current capacity
+                logger.warning(f"Could not apply the capacity settings to {table.name}: {e}")
+        if not self.has_active_index:
+            logger.warning(
+                f"Table {self.table.name} has no '{DynamoDBManager.ACTIVE_INDEX_NAME}' index, ended items will be "
+                "found with a full table scan. Run `scrapy migrate_active_index` to create it."
+            )
+        if self.local_index_path:
+            self.local_index = LocalItemIndex(self.local_index_path, self.track_fields)
+            self.local_index.open()
+            logger.info(f"Loaded {len(self.local_index)} entries from the local index at {self.local_index.path}")
+        self.update_executor = ThreadPoolExecutor(max_workers=self.update_workers)
+
+    def close_storage(self):
+        self.update_executor.shutdown()
+        if self.local_index is not None:
+            self.local_index.close()
 
+    @defer.inlineCallbacks
     def close_spider(self, spider):
-        """Mark offers as ended if they are not seen today and don't have the status 'Ended'."""        
-        active_items = self.dynamodb_manager.get_items_excluding_status_and_date(
-            self.table, "Ended", self.today, ["_id", "status"]
-        )
+        """Flush pending writes, then mark offers that were not seen today as ended."""
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        try:
+            # Persist the final partial batch and wait for in-flight writes before looking for ended items
+            yield self.flush_batch(spider)
+            yield defer.DeferredList(list(self.pending_writes))
+            yield self.run_storage(self.save_late_found_under, spider.logger)
+            yield self.run_storage(self.mark_ended_items, spider)
+            yield self.run_storage(self.save_aggregates, spider.logger)
+        finally:
+            if self.threadpool is not None:
+                self.threadpool.stop()
+                self.threadpool = None
+            self.close_storage()
+            if self.relevance is not None:
+                self.relevance.store.close()
+
+    def inc_stat(self, key, count=1):
+        """Increment a pipeline counter in the crawl stats."""
+        self.metrics.inc(key, count)
+
+    def run_storage(self, function, *args):
+        """Run a blocking storage call on the thread pool, or inline when async writes are disabled."""
+        if self.threadpool is None:
+            return defer.maybeDeferred(function, *args)
+        from twisted.internet import reactor  # Imported late so Scrapy can install the configured reactor first
+        return threads.deferToThreadPool(reactor, self.threadpool, function, *args)
+
+    def mark_ended_items(self, spider):
+        """Mark offers as ended if they are not seen today and don't have the status 'Ended'."""
+        if getattr(spider, "partial_crawl", False):
+            spider.logger.info("Not marking unseen offers as ended, this crawl did not visit every listing page")
+            return
+        self.mark_unseen_as_ended(spider.logger, getattr(spider, "stopped_tags", None))
+
+    def save_late_found_under(self, logger):
+        """Append the tags jobs were listed under after their items were flushed to their stored found_under.
+
+        Items an earlier crawl of the day stored are flushed but not written, so
+        their stored list may already hold some of the tags.
+        """
+        late = [
+            (item_id, found_under[count:]) for item_id, (found_under, count) in self.flushed_found_under.items()
+            if len(found_under) > count
+        ]
+        self.flushed_found_under = {}
+        table = self.table.name
+
+        def append(entry):
+            item_id, tags = entry
+            return self.dynamodb_manager.append_to_list(self.dynamodb_manager.get_table(table), item_id,
+                                                        "found_under", tags)
+
+        try:
+            appended = sum(self.update_executor.map(append, late))
+        except Exception as e:
+            self.inc_stat("found_under/errors")
+            logger.error(f"Error saving the tags jobs were listed under after their write: {e}")
+            return
+        self.inc_stat("found_under/late_tags", appended)
+
+    def save_aggregates(self, logger):
+        """Add the market summaries of this crawl to the stored ones of each tag and day, retrying failed ones."""
+        if self.aggregates is None:
+            return
+        table = self.aggregates_table.name
+
+        def merge(tag_day):
+            try:
+                self.dynamodb_manager.merge_aggregate(self.dynamodb_manager.get_table(table), tag_day)
+            except Exception as e:
+                return e
+
+        saved = 0
+        for attempt in range(self.write_retries + 1):
+            records = self.aggregates.drain()
+            failed = [(tag_day, error) for tag_day, error in zip(records, self.update_executor.map(merge, records))
+                      if error is not None]
+            saved += len(records) - len(failed)
+            if not failed:
+                break
+            # Each summary is merged in one conditional write, so the failed ones can be merged again whole
+            self.aggregates.restore(tag_day for tag_day, _ in failed)
+            if attempt < self.write_retries:
+                self.inc_stat("aggregates/retries")
+                logger.warning(f"Error saving {len(failed)} market aggregates, retrying them: {failed[0][1]}")
+                time.sleep(min(2 ** attempt, 30))
+        else:
+            self.inc_stat("aggregates/errors", len(failed))
+            logger.error(f"Error saving {len(failed)} market aggregates after {self.write_retries} retries: "
+                         f"{failed[0][1]}")
+        self.inc_stat("aggregates/records", saved)
+        logger.info(f"Saved the market aggregates of {saved} tags and days")
+
+    def mark_unseen_as_ended(self, logger, spared_tags=None):
+        """Mark every stored offer not seen today as ended, returning how many were.
 
-        for item in active_items:
-            previous_status = item['status']
-            success = self.dynamodb_manager.update_status_to_ended(
-                table=self.table,
-                item_id=item['_id'],
-                previous_status=previous_status,
-                today=self.today,
+        Offers listed under one of the spared tags, whose pagination stopped
+        before the last page, may still be listed further down and are left alone.
+        """
+        table = self.dynamodb_manager.get_table(self.table.name)
+        if self.has_active_index:
+            pages = self.dynamodb_manager.iter_stale_active_items(table, self.today)
+            if spared_tags:
+                # The index only projects the status, the tags are read for the stale items alone
+                pages = (self.drop_spared_items(table, page, spared_tags, read=True) for page in pages)
+        else:
+            pages = [self.dynamodb_manager.get_items_excluding_status_and_date(
+                table, "Ended", self.today, ["_id", "status", "tags", "found_under"]
+            )]
+            if spared_tags:
+                pages = [self.drop_spared_items(table, pages[0], spared_tags)]
+        if spared_tags:
+            logger.info(f"Not marking the unseen offers of {len(spared_tags)} tags as ended, their pagination "
+                        f"stopped at a known page")
+
+        def mark_ended(item):
+            try:
+                ended_item = self.dynamodb_manager.update_status_to_ended(
+                    table=self.dynamodb_manager.get_table(self.table.name),
+                    item_id=item['_id'],
+                    previous_status=item['status'],
+                    today=self.today,
+                    history_table=self.get_history_table(),
+                )
+            except RuntimeError as e:
+                self.inc_stat("ended_errors")
+                logger.error(str(e))
+                return False
+            if ended_item is None:
+                # Stored today after the index page was read, it is still live
+                self.inc_stat("ended_skipped")
+                logger.debug(f"Item {item['_id']} was seen today, not marking it as Ended.")
+                return False
+            self.inc_stat("ended")
+            if self.aggregates is not None:
+                self.aggregates.count("ended", ended_item.get('tags'), self.today)
+            logger.debug(f"Marked item {item['_id']} as Ended.")
+            return True
+
+        # Each page is updated concurrently while the next one is being fetched
+        count = 0
+        for page in pages:
+            ended = [item['_id'] for item, success in zip(page, self.update_executor.map(mark_ended, page)) if success]
+            count += len(ended)
+            if self.local_index is not None:
+                # The stored status no longer matches the last crawled content
+                self.local_index.discard(ended)
+        return count
+
+    def drop_spared_items(self, table, items, spared_tags, read=False):
+        """Return the stale items listed under none of the spared tags, reading their tags first if asked."""
+        spared_tags = set(spared_tags)
+        listed = {item['_id']: item for item in items}
+        if read and items:
+            listed = self.dynamodb_manager.batch_get_items_with_projection(
+                table, list(listed), ["_id", "tags", "found_under"]
             )
-            if success:
-                spider.logger.info(f"Marked item {item['_id']} as Ended.")
-            else:
-                spider.logger.error(f"Failed to update item {item['_id']} to Ended.")
+        remaining = []
+        for item in items:
+            stored = listed.get(item['_id'], {})
+            # Items stored before found_under was recorded fall back on their own tags
+            if spared_tags.isdisjoint(stored.get('found_under') or stored.get('tags') or []):
+                remaining.append(item)
+        self.inc_stat("ended_spared", len(items) - len(remaining))
+        return remaining
 
     def process_item(self, item, spider):
         """Process and save the item to DynamoDB."""
-        if (item.get('offers') is None and item.get('price') is None) or item.get('price') == 'N/A':
-            spider.logger.info(f"Skipping private project or item with no price: {item.get('_id')}")
+        with self.metrics.timer("pipeline_stage", stage="is_private"):
+            private = self.normalizer.is_private(item)
+        if private:
+            self.inc_stat("private_skipped")
+            spider.logger.debug(f"Skipping private project or item with no price: {item.get('_id')}")
             return None
 
-        for field in item:
-            if isinstance(item[field], str):
-                item[field] = self.clean_string(item[field])
-            elif isinstance(item[field], list):
-                item[field] = [self.clean_string(element) for element in item[field] if isinstance(element, str)]
+        with self.metrics.timer("pipeline_stage", stage="normalize"):
+            self.normalizer.normalize(item, self.today)
+        if self.relevance is not None:
+            with self.metrics.timer("pipeline_stage", stage="relevance"):
+                # The words of a job are counted once write_batch finds it is not stored yet
+                item['relevance_score'] = self.relevance.score(item)
 
-        item['is_competition'] = bool(re.search(r'entries', str(item.get('offers', ''))))
+        # The same job can be listed under several tags; only the first sighting of the day counts
+        self.batch.setdefault(item['_id'], item)
+        if len(self.batch) >= self.batch_size:
+            # Hold the item until the batch has a write slot, so a slow table throttles the scraper
+            start = time.perf_counter()
 
-        offers_match = re.search(r'(\d+)', str(item.get('offers', '')))
-        item['offers'] = int(offers_match.group(1)) if offers_match else None
+            def record_wait(_):
+                self.metrics.observe("pipeline_stage", time.perf_counter() - start, stage="write_slot_wait")
+                return item
 
-        hourly_suffix = r'\s*/\s*hr'
-        item['is_hourly'] = bool(re.search(hourly_suffix, str(item.get('price', ''))))
+            return self.flush_batch(spider).addCallback(record_wait)
+        return item
 
-        extraction_pattern = r'\$(\d+)(?:\s*-\s*\$(\d+))?'
-        extracted = re.search(extraction_pattern, item.get("price"))
-        item['price_min'] = Decimal(extracted.group(1)) if extracted else None
-        item['price_max'] = Decimal(extracted.group(2)) if extracted and extracted.group(2) else item['price_min']
-        item.pop('price', None)
+    def flush_batch(self, spider):
+        """Hand the pending items to a free write slot; the Deferred fires once the write has started."""
+        if not self.batch:
+            return defer.succeed(None)
+        for item in self.batch.values():
+            if 'found_under' in item:
+                self.flushed_found_under[item['_id']] = (item['found_under'], len(item['found_under']))
+        # The writer gets its own copy, the items also go on to the exporters while it runs
+        items, self.batch = [copy.deepcopy(item) for item in self.batch.values()], {}
 
-        item['_id'] = f"https://www.freelancer.com{item.get('_id', '')}"
+        def start_write(_):
+            write = self.run_storage(self.write_batch, items, spider)
+            self.pending_writes.add(write)
 
-        item['last_seen_at'] = self.today
+            def finish(result):
+                self.pending_writes.discard(write)
+                self.inflight.release()
+                return result
 
-        try:
-            item = self.prepare_item_with_history(item)
-            if item is not None:  # Only insert the item if it's not None
-                self.dynamodb_manager.insert_item(self.table, item)
-        except Exception as e:
-            spider.logger.error(f"Error inserting item into DynamoDB: {e}")
-        return item
-    
-    def prepare_item_with_history(self, item):
-        """Prepare the item by adding history tracking for selected fields."""
-        existing_item = self.dynamodb_manager.get_item_with_projection(
-            self.table, item['_id'], self.track_fields + ["history", "created_at", "last_seen_at"]
-        )
+            write.addBoth(finish)
+
+        return self.inflight.acquire().addCallback(start_write)
+
+    def write_batch(self, items, spider):
+        """Write a batch of items, retrying the whole batch with a backoff when it fails."""
+        start = time.monotonic()
+        for attempt in range(self.write_retries + 1):
+            try:
+                # The items are the batch's own copies. Writing sets their created_at, history and
+                # active_shard, which the next attempt derives again from its own read, and the items an
+                # attempt stored are seen today by the next one, which skips them; so no copy is needed.
+                written = self.write_items(items)
+                break
+            except Exception as e:
+                if attempt == self.write_retries:
+                    self.inc_stat("write_errors")
+                    self.inc_stat("write_errors/items", len(items))
+                    spider.logger.error(f"Error inserting a batch of {len(items)} items into DynamoDB after "
+                                        f"{attempt} retries: {e}")
+                    return
+                self.inc_stat("write_retries")
+                spider.logger.warning(f"Error inserting item batch into DynamoDB, retrying it: {e}")
+                time.sleep(min(2 ** attempt, 30))
+        self.metrics.observe("write_batch", time.monotonic() - start)
+        spider.logger.debug(f"Flushed {written}/{len(items)} items in {time.monotonic() - start:.2f}s")
+
+    def write_items(self, items):
+        """Read the stored versions of the items in bulk and write back the changed ones, returning how many."""
+        table = self.dynamodb_manager.get_table(self.table.name)
+        digests = {}
+        timer = self.metrics.timer
+        if self.local_index is not None:
+            with timer("write_stage", stage="skip_unchanged"):
+                items = self.skip_unchanged_items(items, digests)
+        # Delta writes compare every written attribute, which costs no extra read capacity:
+        # reads are billed on the whole item size whatever the projection
+        fields = {"_id", "history", "created_at", "last_seen_at", "active_shard", *self.track_fields}
+        if self.delta_writes:
+            fields.update(field for item in items for field in item)
+        with timer("write_stage", stage="read"):
+            existing_items = self.dynamodb_manager.batch_get_items_with_projection(
+                table, [item['_id'] for item in items], sorted(fields)
+            )
+        prepared_items = []
+        new_items, updates = [], []  # Items put whole, and (item, existing item, new history) to update
+        created = []  # Items the table did not have
+        for item in items:
+            existing_item = existing_items.get(item['_id'])
+            # prepare_item_with_history appends to the stored list, so its length is taken first
+            stored_history = len(existing_item.get('history', [])) if existing_item else 0
+            prepared = self.prepare_item_with_history(item, existing_item)
+            if prepared is not None:  # Only insert the item if it's not None
+                if prepared.get('status') != "Ended":
+                    # Only live offers carry the key of the sparse index read by mark_ended_items
+                    prepared['active_shard'] = self.dynamodb_manager.active_shard(prepared['_id'])
+                prepared_items.append(prepared)
+                if existing_item is None:
+                    created.append(prepared)
+                if existing_item is None or not self.delta_writes:
+                    new_items.append(prepared)
+                else:
+                    updates.append((prepared, existing_item, prepared['history'][stored_history:]))
+        if self.history_table is not None:
+            # Written before the items, which no longer carry their history once put back
+            with timer("write_stage", stage="history"):
+                self.dynamodb_manager.batch_insert_history(
+                    self.get_history_table(),
+                    [record for item in prepared_items for record in self.pop_history_records(item)]
+                )
+        with timer("write_stage", stage="put_new"):
+            self.dynamodb_manager.batch_insert_items(table, new_items)
+        for item in created:
+            if self.aggregates is not None:
+                self.aggregates.count("new", item.get('tags'), self.today)
+            if self.relevance is not None:
+                self.relevance.count(item)
+        with timer("write_stage", stage="update_changed"):
+            conflicts = self.write_deltas(updates)
+        if self.aggregates is not None:
+            with timer("write_stage", stage="aggregates"):
+                # Only the process whose write moved last_seen_at to today counts the job, so the shards of a
+                # crawl and the other crawls of the day never count it twice
+                for item in prepared_items:
+                    if item['_id'] not in conflicts:
+                        self.aggregates.observe(item, self.today)
+        if self.local_index is not None:
+            # Items skipped because they were already stored today have an unknown stored content
+            written = {item['_id'] for item in prepared_items} - conflicts
+            self.local_index.update(
+                (item['_id'], digests[item['_id']], self.today, self.local_index.tracked(item)) if item['_id'] in written
+                else (item['_id'], None, self.today, None)
+                for item in items
+            )
+        return len(prepared_items)
+
+    def write_deltas(self, updates):
+        """Update stored items with only their changed attributes, returning the ids written by someone else."""
+        def update(entry):
+            item, existing_item, new_history = entry
+            changes = {
+                field: value for field, value in item.items()
+                if field not in ("_id", "history") and (field not in existing_item or existing_item[field] != value)
+            }
+            # Inline history is appended to; with a history table the item no longer keeps one
+            removed = [field for field in existing_item if field not in item and field != "_id"]
+            self.inc_stat("delta/attributes", len(changes) + len(removed))
+            return self.dynamodb_manager.update_item_delta(
+                self.dynamodb_manager.get_table(self.table.name), item['_id'], changes, removed,
+                previous_last_seen_at=existing_item.get('last_seen_at'),
+                new_history=new_history if self.history_table is None else None,
+            )
+
+        conflicts = set()
+        for (item, _, _), success in zip(updates, self.update_executor.map(update, updates)):
+            if success:
+                self.inc_stat("delta/writes")
+            else:
+                # Another crawler stored this item since it was read, its visit of today is recorded
+                self.inc_stat("delta/conflicts")
+                conflicts.add(item['_id'])
+        return conflicts
 
+    def skip_unchanged_items(self, items, digests):
+        """Write the items the local index knows well enough without a read, returning those that need a full write.
+
+        Items whose content outside the tracked fields is unchanged are written
+        blind: unchanged ones only get their last_seen_at moved, and those whose
+        tracked fields changed (a live job's status counts its days left down
+        every day) get the changed fields and the change record built from the
+        values kept in the index.
+        """
+        remaining, known = [], []
+        for item in items:
+            digest = digests[item['_id']] = self.local_index.digest(item)
+            entry = self.local_index.get(item['_id'])
+            previous = self.local_index.tracked_values(entry) if entry is not None else None
+            if entry is None:
+                self.inc_stat("local_index/miss")
+                remaining.append(item)
+            elif entry[1] == self.today:
+                self.inc_stat("local_index/hit_seen_today")
+            elif entry[0] == digest and previous is not None:
+                known.append((item, entry[1], self.calculate_diff(previous, item)))
+            else:
+                self.inc_stat("local_index/hit_changed")
+                remaining.append(item)
+
+        # The relevance score and the tags of this crawl are not part of the digest, so they are written along
+        def write(entry):
+            item, last_seen_at, diff = entry
+            table = self.dynamodb_manager.get_table(self.table.name)
+            attributes = {field: item[field] for field in ("relevance_score", "found_under") if field in item}
+            if not diff:
+                return self.dynamodb_manager.update_last_seen(table, item['_id'], self.today, attributes)
+            changes = {field: item[field] for field in diff}
+            changes.update(attributes, last_seen_at=self.today)
+            # Applies only if nobody wrote the item since it was indexed, like the delta writes
+            return self.dynamodb_manager.update_item_delta(
+                table, item['_id'], changes, [], previous_last_seen_at=last_seen_at,
+                new_history=[{"modified_at": self.today, "changes": diff}] if self.history_table is None else None,
+            )
+
+        written, history = [], []
+        for (item, _, diff), success in zip(known, self.update_executor.map(write, known)):
+            if success:
+                self.inc_stat("local_index/hit_tracked_changed" if diff else "local_index/hit_unchanged")
+                written.append((item['_id'], digests[item['_id']], self.today, self.local_index.tracked(item)))
+                if diff:
+                    history.append({"_id": item['_id'], "modified_at": self.today, "changes": diff})
+                if self.aggregates is not None:
+                    self.aggregates.observe(item, self.today)
+            else:
+                # Deleted from the table since it was indexed, or written by another process since; the
+                # full write path reads it and finds out which
+                self.inc_stat("local_index/stale")
+                remaining.append(item)
+        if self.history_table is not None:
+            self.dynamodb_manager.batch_insert_history(self.get_history_table(), history)
+        self.local_index.update(written)
+        self.inc_stat("local_index/reads_avoided", len(items) - len(remaining))
+        return remaining
+
+    def prepare_item_with_history(self, item, existing_item):
+        """Prepare the item by adding history tracking for selected fields."""
         if existing_item:
             if existing_item.get('last_seen_at') == self.today:
                 # If the item was already seen today, return None to skip processing.
@@ -108,11 +570,28 @@ class GigFinderPipeline:
 
         return item
 
-    def clean_string(self, text):
-        """Clean whitespace and normalize strings."""
-        text = text.strip()
-        text = re.sub(r'\s+', ' ', text)
-        return text
+    def get_history_table(self):
+        """Return this thread's handle on the history table, or None when the history is stored inline."""
+        if self.history_table is None:
+            return None
+        return self.dynamodb_manager.get_table(self.history_table.name)
+
+    def pop_history_records(self, item):
+        """Remove the history list of an item, returning it as history table records.
+
+        Besides today's change, the list holds the inline history the item had
+        before the table was used, which moves to the table on its first write.
+        """
+        records = {}
+        for record in item.pop('history', None) or []:
+            # Records of the same day are merged, keeping the oldest previous value of each field
+            changes = records.setdefault(record['modified_at'], {})
+            for field, previous_value in record.get('changes', {}).items():
+                changes.setdefault(field, previous_value)
+        return [
+            {"_id": item['_id'], "modified_at": modified_at, "changes": changes}
+            for modified_at, changes in records.items()
+        ]
 
     def calculate_diff(self, old_item, new_item):
         """Calculate the diff for tracked fields."""
@@ -124,30 +603,384 @@ class GigFinderPipeline:
 
 
 class DynamoDBManager:
-    def __init__(self, aws_region, aws_access_key, aws_secret_key):
-        self.dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=aws_region,
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key
+    # Sparse index over the offers that are not Ended, spread across shards to avoid a hot partition
+    ACTIVE_INDEX_NAME = "active-index"
+    BILLING_MODES = ("PAY_PER_REQUEST", "PROVISIONED")
+
+    def __init__(self, aws_region, aws_access_key, aws_secret_key, active_shards=10, metrics=None,
+                 endpoint_url=None, client_config=None, billing_mode=None, read_capacity=5,
+                 write_capacity=5, autoscaling_max_capacity=0, autoscaling_target=70.0):
+        self.session_kwargs = {
+            "region_name": aws_region,
+            "aws_access_key_id": aws_access_key,
+            "aws_secret_access_key": aws_secret_key,
+        }
+        self.local = threading.local()
+        self.active_shards = active_shards
+        self.metrics = metrics  # Times every method below and every DynamoDB call, when given
+        self.endpoint_url = endpoint_url  # e.g. a DynamoDB Local instance
+        self.client_config = client_config
+        if billing_mode is not None and billing_mode not in self.BILLING_MODES:
+            raise ValueError(f"Unknown DYNAMODB_BILLING_MODE '{billing_mode}', expected one of {self.BILLING_MODES}")
+        # Existing tables keep their billing mode unless one is configured, new tables default to on demand
+        self.billing_mode = billing_mode
+        self.read_capacity = read_capacity
+        self.write_capacity = write_capacity
+        # Provisioned tables and indexes scale between their configured capacity and this maximum, 0 disables
+        self.autoscaling_max_capacity = autoscaling_max_capacity
+        self.autoscaling_target = autoscaling_target
+
+    @staticmethod
+    def options_from_settings(settings):
+        """Return the client and capacity keyword arguments configured in the Scrapy settings."""
+        return {
+            "endpoint_url": settings.get("DYNAMODB_ENDPOINT_URL") or None,
+            "client_config": Config(
+                max_pool_connections=settings.getint("DYNAMODB_MAX_POOL_CONNECTIONS", 10),
+                retries={
+                    "mode": settings.get("DYNAMODB_RETRY_MODE", "adaptive"),
+                    "max_attempts": settings.getint("DYNAMODB_MAX_ATTEMPTS", 10),
+                },
+                connect_timeout=settings.getfloat("DYNAMODB_CONNECT_TIMEOUT", 5),
+                read_timeout=settings.getfloat("DYNAMODB_READ_TIMEOUT", 10),
+            ),
+            "billing_mode": settings.get("DYNAMODB_BILLING_MODE") or None,
+            "read_capacity": settings.getint("DYNAMODB_READ_CAPACITY", 5),
+            "write_capacity": settings.getint("DYNAMODB_WRITE_CAPACITY", 5),
+            "autoscaling_max_capacity": settings.getint("DYNAMODB_AUTOSCALING_MAX_CAPACITY", 0),
+            "autoscaling_target": settings.getfloat("DYNAMODB_AUTOSCALING_TARGET", 70.0),
+        }
+
+    @classmethod
+    def from_settings(cls, settings, metrics=None):
+        return cls(
+            settings.get("AWS_REGION"),
+            settings.get("AWS_ACCESS_KEY"),
+            settings.get("AWS_SECRET_KEY"),
+            settings.getint("DYNAMODB_ACTIVE_SHARDS", 10),
+            metrics=metrics,
+            **cls.options_from_settings(settings),
         )
 
+    @property
+    def session(self):
+        """Return the boto3 session of the calling thread, whose resource and client share the loaded models."""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = boto3.session.Session(**self.session_kwargs)
+        return session
+
+    @property
+    def dynamodb(self):
+        """Return the DynamoDB resource of the calling thread, since boto3 resources are not thread safe."""
+        resource = getattr(self.local, "dynamodb", None)
+        if resource is None:
+            # Each thread also gets its own connection pool, sized by max_pool_connections
+            resource = self.local.dynamodb = self.session.resource(
+                'dynamodb', endpoint_url=self.endpoint_url, config=self.client_config
+            )
+            if self.metrics is not None:
+                self.metrics.instrument_dynamodb(resource.meta.client)
+        return resource
+
+    @property
+    def client(self):
+        """Return a low-level DynamoDB client of the calling thread, taking attributes in the wire format.
+
+        Unlike the resource's own client, it does not convert Python values.
+        """
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.session.client(
+                'dynamodb', endpoint_url=self.endpoint_url, config=self.client_config
+            )
+            if self.metrics is not None:
+                self.metrics.instrument_dynamodb(client)
+        return client
+
+    def get_table(self, table_name):
+        """Return a handle on an existing table that is safe to use from the calling thread."""
+        return self.dynamodb.Table(table_name)
+
+    def load_table(self, table_name):
+        """Return a handle on a table with its description loaded, or None if the table does not exist."""
+        table = self.dynamodb.Table(table_name)
+        try:
+            table.load()  # A single DescribeTable, unlike listing every table of the account
+        except table.meta.client.exceptions.ResourceNotFoundException:
+            return None
+        return table
+
+    def create_table(self, table_name, key_schema, attribute_definitions, global_secondary_indexes=()):
+        """Create a table with the configured billing mode and wait until it can be used."""
+        create_kwargs = {}
+        if self.new_table_billing_mode == "PAY_PER_REQUEST":
+            create_kwargs["BillingMode"] = "PAY_PER_REQUEST"
+        else:
+            create_kwargs["ProvisionedThroughput"] = self.provisioned_throughput()
+        if global_secondary_indexes:
+            create_kwargs["GlobalSecondaryIndexes"] = list(global_secondary_indexes)
+        self.dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=key_schema,
+            AttributeDefinitions=attribute_definitions,
+            **create_kwargs
+        )
+        table = self.dynamodb.Table(table_name)
+        table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+        table.load()
+        return table
+
+    @property
+    def new_table_billing_mode(self):
+        return self.billing_mode or "PAY_PER_REQUEST"
+
+    def provisioned_throughput(self):
+        return {'ReadCapacityUnits': self.read_capacity, 'WriteCapacityUnits': self.write_capacity}
+
+    @timed("dynamodb_method")
     def get_or_create_table(self, table_name, partition_key='_id', partition_key_type='S'):
         """Ensure the table exists or create it if it doesn't."""
-        existing_tables = self.dynamodb.meta.client.list_tables()['TableNames']
-        if table_name not in existing_tables:
-            self.dynamodb.create_table(
-                TableName=table_name,
-                KeySchema=[{'AttributeName': partition_key, 'KeyType': 'HASH'}],
-                AttributeDefinitions=[{'AttributeName': partition_key, 'AttributeType': partition_key_type}],
-                ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
-            )
-            table = self.dynamodb.Table(table_name)
-            table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
-        else:
-            table = self.dynamodb.Table(table_name)
+        table = self.load_table(table_name)
+        if table is None:
+            table = self.create_table(
+                table_name,
+                key_schema=[{'AttributeName': partition_key, 'KeyType': 'HASH'}],
+                attribute_definitions=[
+                    {'AttributeName': partition_key, 'AttributeType': partition_key_type},
+                    *self.active_index_attribute_definitions(),
+                ],
+                global_secondary_indexes=[self.active_index_definition(self.new_table_billing_mode == "PROVISIONED")],
+            )
+        return table
+
+    @staticmethod
+    def history_table_name(table_name):
+        return f"{table_name}_history"
+
+    @staticmethod
+    def aggregates_table_name(table_name):
+        return f"{table_name}_aggregates"
+
+    @timed("dynamodb_method")
+    def get_or_create_history_table(self, table_name):
+        """Ensure the table of change records exists, keyed by item _id and sorted by modified_at."""
+        table = self.load_table(table_name)
+        if table is None:
+            table = self.create_table(
+                table_name,
+                key_schema=[
+                    {'AttributeName': '_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'modified_at', 'KeyType': 'RANGE'},
+                ],
+                attribute_definitions=[
+                    {'AttributeName': '_id', 'AttributeType': 'S'},
+                    {'AttributeName': 'modified_at', 'AttributeType': 'S'},
+                ],
+            )
         return table
 
+    @timed("dynamodb_method")
+    def get_or_create_aggregates_table(self, table_name):
+        """Ensure the table of market summaries exists, keyed by tag and sorted by day."""
+        table = self.load_table(table_name)
+        if table is None:
+            table = self.create_table(
+                table_name,
+                key_schema=[
+                    {'AttributeName': 'tag', 'KeyType': 'HASH'},
+                    {'AttributeName': 'day', 'KeyType': 'RANGE'},
+                ],
+                attribute_definitions=[
+                    {'AttributeName': 'tag', 'AttributeType': 'S'},
+                    {'AttributeName': 'day', 'AttributeType': 'S'},
+                ],
+            )
+        return table
+
+    @staticmethod
+    def table_billing_mode(table):
+        # Tables created before on-demand billing existed have no billing mode summary
+        return (table.billing_mode_summary or {}).get('BillingMode', 'PROVISIONED')
+
+    @timed("dynamodb_method")
+    def configure_capacity(self, table):
+        """Bring an existing table to the configured billing mode and auto scaling, returning what changed.
+
+        Without an explicit DYNAMODB_BILLING_MODE the table keeps its own, so a
+        provisioned production table is never switched to on demand by default.
+        Only a mismatching billing mode is updated, so this is a no-op on later
+        runs; DynamoDB allows switching a table to on-demand at most once per 24 hours.
+        """
+        changes = []
+        if self.billing_mode is not None and self.table_billing_mode(table) != self.billing_mode:
+            update_kwargs = {"TableName": table.name, "BillingMode": self.billing_mode}
+            if self.billing_mode == "PROVISIONED":
+                update_kwargs["ProvisionedThroughput"] = self.provisioned_throughput()
+                if table.global_secondary_indexes:
+                    update_kwargs["GlobalSecondaryIndexUpdates"] = [
+                        {'Update': {'IndexName': index['IndexName'],
+                                    'ProvisionedThroughput': self.provisioned_throughput()}}
+                        for index in table.global_secondary_indexes
+                    ]
+            table.meta.client.update_table(**update_kwargs)
+            changes.append(f"billing mode switched to {self.billing_mode}")
+        billing_mode = self.billing_mode or self.table_billing_mode(table)
+        if billing_mode == "PROVISIONED" and self.autoscaling_max_capacity > 0:
+            self.register_autoscaling(table)
+            changes.append(f"auto scaling up to {self.autoscaling_max_capacity} capacity units "
+                           f"at {self.autoscaling_target:g}% utilization")
+        return changes
+
+    def register_autoscaling(self, table):
+        """Scale the read and write capacity of a provisioned table and its indexes with target tracking."""
+        client = self.session.client('application-autoscaling', config=self.client_config)
+        resources = [f"table/{table.name}"]
+        resources += [f"table/{table.name}/index/{index['IndexName']}" for index in table.global_secondary_indexes or []]
+        for resource_id in resources:
+            dimension_prefix = "dynamodb:index" if "/index/" in resource_id else "dynamodb:table"
+            for capacity, minimum in (("Read", self.read_capacity), ("Write", self.write_capacity)):
+                # Both calls are idempotent, registering again only updates the bounds and target
+                client.register_scalable_target(
+                    ServiceNamespace="dynamodb",
+                    ResourceId=resource_id,
+                    ScalableDimension=f"{dimension_prefix}:{capacity}CapacityUnits",
+                    MinCapacity=minimum,
+                    MaxCapacity=max(minimum, self.autoscaling_max_capacity),
+                )
+                client.put_scaling_policy(
+                    PolicyName=f"{resource_id.replace('/', '-')}-{capacity.lower()}-scaling",
+                    ServiceNamespace="dynamodb",
+                    ResourceId=resource_id,
+                    ScalableDimension=f"{dimension_prefix}:{capacity}CapacityUnits",
+                    PolicyType="TargetTrackingScaling",
+                    TargetTrackingScalingPolicyConfiguration={
+                        "TargetValue": self.autoscaling_target,
+                        "PredefinedMetricSpecification": {
+                            "PredefinedMetricType": f"DynamoDB{capacity}CapacityUtilization",
+                        },
+                    },
+                )
+
+    def active_index_attribute_definitions(self):
+        """Attribute definitions required by the active items index."""
+        return [
+            {'AttributeName': 'active_shard', 'AttributeType': 'S'},
+            {'AttributeName': 'last_seen_at', 'AttributeType': 'S'},
+        ]
+
+    def active_index_definition(self, provisioned):
+        """Definition of the sparse index holding only the offers that are not Ended."""
+        definition = {
+            'IndexName': self.ACTIVE_INDEX_NAME,
+            'KeySchema': [
+                {'AttributeName': 'active_shard', 'KeyType': 'HASH'},
+                {'AttributeName': 'last_seen_at', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['status']},
+        }
+        if provisioned:  # On-demand tables take no index throughput
+            definition['ProvisionedThroughput'] = self.provisioned_throughput()
+        return definition
+
+    @timed("dynamodb_method")
+    def has_active_index(self, table, reload=True):
+        """Check whether the table already has an active index that can be queried."""
+        if reload:
+            table.reload()
+        return any(
+            index['IndexName'] == self.ACTIVE_INDEX_NAME and index.get('IndexStatus', 'ACTIVE') == 'ACTIVE'
+            for index in table.global_secondary_indexes or []
+        )
+
+    def active_shard(self, item_id):
+        """Return the active index shard an item belongs to."""
+        return str(int(hashlib.md5(item_id.encode('utf-8')).hexdigest(), 16) % self.active_shards)
+
+    def iter_stale_active_items(self, table, today):
+        """Yield pages of active items whose last_seen_at is before today, reading only the active index."""
+        try:
+            for shard in range(self.active_shards):
+                query_kwargs = {
+                    "IndexName": self.ACTIVE_INDEX_NAME,
+                    "KeyConditionExpression": Key('active_shard').eq(str(shard)) & Key('last_seen_at').lt(today),
+                }
+                while True:
+                    response = table.query(**query_kwargs)
+                    if response.get('Items'):
+                        yield response['Items']
+                    if 'LastEvaluatedKey' not in response:
+                        break
+                    query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            raise RuntimeError(f"Failed to query active items last seen before '{today}': {e}")
+
+    def scan_segment(self, table, segment, total_segments, start_key=None, page_size=None):
+        """Yield (items, last_evaluated_key) pages of one segment of a parallel scan, starting after start_key."""
+        scan_kwargs = {"Segment": segment, "TotalSegments": total_segments}
+        if page_size:
+            scan_kwargs["Limit"] = page_size
+        if start_key:
+            scan_kwargs["ExclusiveStartKey"] = start_key
+        try:
+            while True:
+                response = table.scan(**scan_kwargs)
+                last_evaluated_key = response.get('LastEvaluatedKey')
+                yield response.get('Items', []), last_evaluated_key
+                if last_evaluated_key is None:
+                    break
+                scan_kwargs['ExclusiveStartKey'] = last_evaluated_key
+        except Exception as e:
+            raise RuntimeError(f"Failed to scan segment {segment}/{total_segments} of {table.name}: {e}")
+
+    @timed("dynamodb_method")
+    def add_active_index(self, table):
+        """Create the active index on an existing table and wait until it can be queried."""
+        if self.has_active_index(table):
+            return False
+        if not any(index['IndexName'] == self.ACTIVE_INDEX_NAME for index in table.global_secondary_indexes or []):
+            table.meta.client.update_table(
+                TableName=table.name,
+                AttributeDefinitions=self.active_index_attribute_definitions(),
+                GlobalSecondaryIndexUpdates=[{'Create': self.active_index_definition(
+                    self.table_billing_mode(table) == "PROVISIONED"
+                )}],
+            )
+        while not self.has_active_index(table):
+            time.sleep(10)  # Index creation takes minutes and has no boto3 waiter
+        return True
+
+    @timed("dynamodb_method")
+    def backfill_active_shards(self, table, excluded_status="Ended"):
+        """Set the active index key on stored items that are not Ended and still lack it."""
+        try:
+            updated = 0
+            scan_kwargs = {
+                "FilterExpression": Attr('status').ne(excluded_status) & Attr('active_shard').not_exists(),
+                "ProjectionExpression": "#_id",
+                "ExpressionAttributeNames": {"#_id": "_id"},
+            }
+            while True:
+                response = table.scan(**scan_kwargs)
+                for item in response.get('Items', []):
+                    table.update_item(
+                        Key={'_id': item['_id']},
+                        UpdateExpression="SET #active_shard = :shard",
+                        ConditionExpression="#status <> :excluded_status",
+                        ExpressionAttributeNames={"#active_shard": "active_shard", "#status": "status"},
+                        ExpressionAttributeValues={
+                            ":shard": self.active_shard(item['_id']),
+                            ":excluded_status": excluded_status,
+                        },
+                    )
+                    updated += 1
+                if 'LastEvaluatedKey' not in response:
+                    return updated
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            raise RuntimeError(f"Failed to backfill active shards: {e}")
+
+    @timed("dynamodb_method")
     def insert_item(self, table, item):
         """Insert an item into the given DynamoDB table."""
         try:
@@ -155,6 +988,237 @@ class DynamoDBManager:
         except Exception as e:
             raise RuntimeError(f"Failed to insert item into table: {e}")
 
+    @timed("dynamodb_method")
+    def batch_insert_items(self, table, items, max_retries=8):
+        """Insert items in chunks of 25, already converted to the wire format, resending unprocessed ones."""
+        try:
+            # BatchWriteItem rejects duplicate keys, the last version of an item wins
+            items = list({item['_id']: item for item in items}.values())
+            for i in range(0, len(items), 25):  # BatchWriteItem accepts at most 25 requests
+                request_items = {
+                    table.name: [{'PutRequest': {'Item': dynamodb_item(item)}} for item in items[i:i + 25]]
+                }
+                attempt = 0
+                while request_items:
+                    response = self.client.batch_write_item(RequestItems=request_items)
+                    request_items = response.get('UnprocessedItems')
+                    if request_items:
+                        self.wait_before_retry(attempt, max_retries, "unprocessed items")
+                        attempt += 1
+        except Exception as e:
+            raise RuntimeError(f"Failed to batch insert items into table: {e}")
+
+    def wait_before_retry(self, attempt, max_retries, unprocessed):
+        """Back off exponentially before resending the unprocessed part of a batch request."""
+        if attempt >= max_retries:
+            raise RuntimeError(f"{unprocessed} left after {max_retries} retries")
+        if self.metrics is not None:
+            self.metrics.inc("dynamodb/unprocessed_retries")
+        time.sleep(min(0.05 * 2 ** attempt, 5))  # Exponential backoff on throttling
+
+    @timed("dynamodb_method")
+    def batch_insert_history(self, table, records):
+        """Insert change records in chunks of 25, one record per item and day."""
+        if not records:
+            return
+        try:
+            with table.batch_writer(overwrite_by_pkeys=['_id', 'modified_at']) as batch:
+                for record in records:
+                    batch.put_item(Item=record)
+        except Exception as e:
+            raise RuntimeError(f"Failed to batch insert history records into table: {e}")
+
+    @timed("dynamodb_method")
+    def query_history(self, table, item_id):
+        """Return the change records of an item from a history table, oldest first."""
+        try:
+            records = []
+            query_kwargs = {"KeyConditionExpression": Key('_id').eq(item_id), "ScanIndexForward": True}
+            while True:
+                response = table.query(**query_kwargs)
+                records.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    return records
+                query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            raise RuntimeError(f"Failed to query the history of item {item_id}: {e}")
+
+    @timed("dynamodb_method")
+    def get_timeline(self, table, item_id, history_table=None):
+        """Return an item with its full history, oldest change first, or None if it is not stored.
+
+        The history is rebuilt from the records kept inline on the item and,
+        when given, from the history table, whichever way they were written.
+        """
+        try:
+            item = table.get_item(Key={'_id': item_id}).get('Item')
+        except Exception as e:
+            raise RuntimeError(f"Failed to get item {item_id} from table: {e}")
+        if item is None:
+            return None
+        history = list(item.get('history', []))
+        if history_table is not None:
+            history.extend(
+                {"modified_at": record['modified_at'], "changes": record.get('changes', {})}
+                for record in self.query_history(history_table, item_id)
+            )
+        item['history'] = sorted(history, key=lambda record: record['modified_at'])
+        return item
+
+    @timed("dynamodb_method")
+    def merge_aggregate(self, table, tag_day, max_retries=10):
+        """Add the summary of a tag and day to the stored one.
+
+        The stored summary is read, merged and put back on the condition that
+        its version did not change in between, so the shards of a crawl and the
+        mark-ended pass can all add to the same record.
+        """
+        client = table.meta.client
+        for _ in range(max_retries):
+            try:
+                stored = table.get_item(Key={'tag': tag_day.tag, 'day': tag_day.day}, ConsistentRead=True).get('Item')
+                merged = TagDay.from_dynamodb(stored).merge(tag_day) if stored else tag_day
+                version = int(stored['version']) if stored else 0
+                condition = {"ConditionExpression": "attribute_not_exists(#tag)",
+                             "ExpressionAttributeNames": {"#tag": "tag"}}
+                if stored:
+                    condition = {"ConditionExpression": "#version = :version",
+                                 "ExpressionAttributeNames": {"#version": "version"},
+                                 "ExpressionAttributeValues": {":version": version}}
+                table.put_item(Item={**merged.to_dynamodb(), "version": version + 1}, **condition)
+                return
+            except client.exceptions.ConditionalCheckFailedException:
+                continue  # Written by another process since it was read
+            except Exception as e:
+                raise RuntimeError(f"Failed to merge the aggregates of {tag_day.tag} on {tag_day.day}: {e}")
+        raise RuntimeError(f"Failed to merge the aggregates of {tag_day.tag} on {tag_day.day} "
+                           f"after {max_retries} conflicting writes")
+
+    @timed("dynamodb_method")
+    def query_aggregates(self, table, since, until, tags=None):
+        """Return the summaries of the days from since to until, of the given tags or of every tag."""
+        try:
+            records = []
+            if tags:
+                for tag in tags:
+                    query_kwargs = {"KeyConditionExpression": Key('tag').eq(tag) & Key('day').between(since, until)}
+                    while True:
+                        response = table.query(**query_kwargs)
+                        records.extend(response.get('Items', []))
+                        if 'LastEvaluatedKey' not in response:
+                            break
+                        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            else:
+                # The table holds one small record per tag and day, never the jobs themselves
+                scan_kwargs = {"FilterExpression": Attr('day').between(since, until)}
+                while True:
+                    response = table.scan(**scan_kwargs)
+                    records.extend(response.get('Items', []))
+                    if 'LastEvaluatedKey' not in response:
+                        break
+                    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            raise RuntimeError(f"Failed to read the aggregates from {since} to {until}: {e}")
+        return [TagDay.from_dynamodb(record) for record in records]
+
+    @timed("dynamodb_method")
+    def update_last_seen(self, table, item_id, today, attributes=None):
+        """Set last_seen_at and the given attributes of an existing item not seen today yet, returning False otherwise.
+
+        Of the processes crawling the same job on the same day, only the first
+        one moves last_seen_at, so only that one counts the job.
+        """
+        names = {"#_id": "_id", "#last_seen_at": "last_seen_at"}
+        values = {":today": today}
+        set_actions = ["#last_seen_at = :today"]
+        for index, (field, value) in enumerate((attributes or {}).items()):
+            names[f"#set{index}"] = field
+            values[f":set{index}"] = value
+            set_actions.append(f"#set{index} = :set{index}")
+        try:
+            table.update_item(
+                Key={'_id': item_id},
+                UpdateExpression="SET " + ", ".join(set_actions),
+                ConditionExpression="attribute_exists(#_id) AND #last_seen_at < :today",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+            return True
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            raise RuntimeError(f"Failed to update last_seen_at of item {item_id}: {e}")
+
+    @timed("dynamodb_method")
+    def append_to_list(self, table, item_id, field, values):
+        """Append the values a list attribute of an existing item lacks, returning how many were appended."""
+        appended = 0
+        # One conditional update per value, as a condition cannot check several values of a list
+        for value in values:
+            try:
+                table.update_item(
+                    Key={'_id': item_id},
+                    UpdateExpression="SET #field = list_append(if_not_exists(#field, :empty), :values)",
+                    ConditionExpression="attribute_exists(#_id) AND NOT contains(#field, :value)",
+                    ExpressionAttributeNames={"#_id": "_id", "#field": field},
+                    ExpressionAttributeValues={":empty": [], ":values": [value], ":value": value},
+                )
+                appended += 1
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                continue  # Already in the list, or the item is not stored
+            except Exception as e:
+                raise RuntimeError(f"Failed to append to {field} of item {item_id}: {e}")
+        return appended
+
+    @timed("dynamodb_method")
+    def update_item_delta(self, table, item_id, changes, removed, previous_last_seen_at, new_history=None):
+        """Set the changed attributes of a stored item, remove the dropped ones and append its new history.
+
+        The write only applies if last_seen_at still has the value it was read
+        with, so concurrent crawlers never overwrite each other's changes.
+        Returns False when that condition fails.
+        """
+        names = {"#last_seen_at": "last_seen_at"}
+        values = {}
+        set_actions = []
+        for index, (field, value) in enumerate(changes.items()):
+            names[f"#set{index}"] = field
+            values[f":set{index}"] = value
+            set_actions.append(f"#set{index} = :set{index}")
+        if new_history:
+            names["#history"] = "history"
+            values.update({":new_history": new_history, ":empty_list": []})
+            set_actions.append("#history = list_append(if_not_exists(#history, :empty_list), :new_history)")
+        remove_actions = []
+        for index, field in enumerate(removed):
+            names[f"#remove{index}"] = field
+            remove_actions.append(f"#remove{index}")
+
+        update_expression = "SET " + ", ".join(set_actions)
+        if remove_actions:
+            update_expression += " REMOVE " + ", ".join(remove_actions)
+        if previous_last_seen_at is None:
+            names["#_id"] = "_id"
+            condition_expression = "attribute_exists(#_id) AND attribute_not_exists(#last_seen_at)"
+        else:
+            condition_expression = "#last_seen_at = :previous_last_seen_at"
+            values[":previous_last_seen_at"] = previous_last_seen_at
+
+        try:
+            table.update_item(
+                Key={'_id': item_id},
+                UpdateExpression=update_expression,
+                ConditionExpression=condition_expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+            return True
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            raise RuntimeError(f"Failed to update the changed attributes of item {item_id}: {e}")
+
+    @timed("dynamodb_method")
     def get_item_with_projection(self, table, partition_key_value, fields):
         """Retrieve an item with only specific fields."""
         try:
@@ -170,35 +1234,104 @@ class DynamoDBManager:
         except Exception as e:
             raise RuntimeError(f"Failed to get item with projection from table: {e}")
         
-    def update_status_to_ended(self, table, item_id, previous_status, today):
-        """Update the status of an item to 'Ended' and append to its history."""
+    @timed("dynamodb_method")
+    def batch_get_items_with_projection(self, table, partition_key_values, fields, max_retries=8):
+        """Retrieve many items with only specific fields, keyed by partition key."""
         try:
-            table.update_item(
+            expression_attribute_names = {f"#{field}": field for field in fields}
+            projection_expression = ", ".join(expression_attribute_names.keys())
+            keys = list(dict.fromkeys(partition_key_values))  # BatchGetItem rejects duplicate keys
+
+            items = {}
+            for i in range(0, len(keys), 100):  # BatchGetItem accepts at most 100 keys
+                request_items = {
+                    table.name: {
+                        'Keys': [{'_id': key} for key in keys[i:i + 100]],
+                        'ProjectionExpression': projection_expression,
+                        'ExpressionAttributeNames': expression_attribute_names,
+                    }
+                }
+                attempt = 0
+                while request_items:
+                    response = self.dynamodb.batch_get_item(RequestItems=request_items)
+                    for found in response.get('Responses', {}).get(table.name, []):
+                        items[found['_id']] = found
+
+                    request_items = response.get('UnprocessedKeys')
+                    if request_items:
+                        self.wait_before_retry(attempt, max_retries, "unprocessed keys")
+                        attempt += 1
+            return items
+        except Exception as e:
+            raise RuntimeError(f"Failed to batch get items with projection from table: {e}")
+
+    @timed("dynamodb_method")
+    def update_status_to_ended(self, table, item_id, previous_status, today, history_table=None):
+        """Update the status of an item to 'Ended' and append to its history.
+
+        The stale items come from the active index, which is eventually
+        consistent, so the update only applies if the item is still not Ended
+        and was last seen before today. Returns the item as it was before the
+        update, or None when that condition fails.
+        """
+        change_record = {"modified_at": today, "changes": {"status": previous_status}}
+        if history_table is not None:
+            return self.update_status_to_ended_with_history_table(
+                table, history_table, item_id, change_record, today
+            )
+        try:
+            response = table.update_item(
                 Key={'_id': item_id},
                 UpdateExpression="""
                     SET #status = :new_status,
                         #history = list_append(if_not_exists(#history, :empty_list), :new_history)
+                    REMOVE #active_shard
                 """,
-                ConditionExpression="attribute_exists(#_id) AND #status <> :new_status",
+                ConditionExpression="attribute_exists(#_id) AND #status <> :new_status AND #last_seen_at < :today",
                 ExpressionAttributeNames={
                     "#_id": "_id",
                     "#status": "status",
-                    "#history": "history"
+                    "#history": "history",
+                    "#active_shard": "active_shard",
+                    "#last_seen_at": "last_seen_at",
                 },
                 ExpressionAttributeValues={
                     ":new_status": "Ended",
-                    ":new_history": [{
-                        "modified_at": today,
-                        "changes": {"status": previous_status}
-                    }],
-                    ":empty_list": []
-                }
+                    ":new_history": [change_record],
+                    ":empty_list": [],
+                    ":today": today,
+                },
+                ReturnValues="ALL_OLD",  # Gives the tags counted as ended without another read
             )
-            return True
+            return response['Attributes']
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            return None  # Seen today or already Ended, the index was behind the table
         except Exception as e:
-            print(f"Error updating item {item_id} to Ended: {e}")
-            return False
+            raise RuntimeError(f"Failed to update item {item_id} to Ended: {e}")
+
+    def update_status_to_ended_with_history_table(self, table, history_table, item_id, change_record, today):
+        """Update the status of an item to 'Ended', recording the change in the history table, as above."""
+        try:
+            response = table.update_item(
+                Key={'_id': item_id},
+                UpdateExpression="SET #status = :new_status REMOVE #active_shard",
+                ConditionExpression="attribute_exists(#_id) AND #status <> :new_status AND #last_seen_at < :today",
+                ExpressionAttributeNames={"#_id": "_id", "#status": "status", "#active_shard": "active_shard",
+                                          "#last_seen_at": "last_seen_at"},
+                ExpressionAttributeValues={":new_status": "Ended", ":today": today},
+                ReturnValues="ALL_OLD",
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            return None
+        except Exception as e:
+            raise RuntimeError(f"Failed to update item {item_id} to Ended: {e}")
+        try:
+            history_table.put_item(Item={"_id": item_id, **change_record})
+        except Exception as e:
+            raise RuntimeError(f"Failed to record the end of item {item_id} in the history table: {e}")
+        return response['Attributes']
 
+    @timed("dynamodb_method")
     def get_items_excluding_status_and_date(self, table, excluded_status, today, fields=None):
         """Retrieve all items that do not have the specified excluded status and last_seen_at is not today."""
         try:
@@ -0,0 +1,144 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from collections import Counter
+from decimal import Decimal
+
+from scrapy.utils.project import data_path
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+# Job descriptions are written in English and Portuguese
+STOP_WORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing done down during each few for from further get had has have having he her here hers him
+his how i if in into is it its itself just me more most my need needs no nor not now of off on once only or other
+our out over own please same she should so some such than that the their them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you your
+ao aos as com como da das de do dos e ela ele em entre era essa esse esta este eu foi ha isso ja mais mas me mesmo
+muito na nas nao no nos o os ou para pela pelo por pra que se sem ser seu sua sao tambem tem um uma voce
+""".split())
+
+
+def relevance_store_path(settings):
+    """Return the document frequency store, or None when relevance scoring is disabled."""
+    if not settings.getbool("RELEVANCE_ENABLED", True):
+        return None
+    return data_path(settings.get("RELEVANCE_STORE_FILE", "relevance.sqlite"))
+
+
+def tokenize(text):
+    """Return the accent-free, lowercase words of a text without stop words: 'APIs de Criação' -> apis, criacao."""
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [token for token in TOKEN_PATTERN.findall(text) if len(token) > 1 and token not in STOP_WORDS]
+
+
+class DocumentFrequencyStore:
+    """Number of jobs each word appeared in, kept across runs in SQLite.
+
+    The counts are loaded into memory when the store opens and only the
+    increments of the run are written back, added to the stored counts, so
+    the processes of a sharded crawl can share the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.frequencies = {}  # word -> number of jobs containing it
+        self.documents = 0
+        self.pending = Counter()  # Increments not written yet, "" counting the documents
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS frequencies (term TEXT PRIMARY KEY, documents INTEGER) WITHOUT ROWID"
+        )
+        self.frequencies = dict(self.connection.execute("SELECT term, documents FROM frequencies"))
+        self.documents = self.frequencies.pop("", 0)  # Stored under the empty term, which no word can be
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            self.save()
+            self.connection.close()
+            self.connection = None
+
+    def add(self, terms):
+        """Count one more job containing each of the distinct terms."""
+        with self.lock:
+            self.documents += 1
+            self.pending[""] += 1
+            for term in terms:
+                self.frequencies[term] = self.frequencies.get(term, 0) + 1
+                self.pending[term] += 1
+
+    def save(self):
+        """Add the counts of this run to the stored ones."""
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        if not pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO frequencies VALUES (?, ?) "
+                "ON CONFLICT (term) DO UPDATE SET documents = documents + excluded.documents",
+                pending.items(),
+            )
+
+    def idf(self, term):
+        """Return the smoothed inverse document frequency of a term, as computed by scikit-learn."""
+        return math.log((1 + self.documents) / (1 + self.frequencies.get(term, 0))) + 1
+
+
+class RelevanceScorer:
+    """Score jobs by the cosine similarity of their TF-IDF vector with a weighted keyword profile.
+
+    Vectors are dicts of their non-zero terms, so scoring a job costs as much
+    as its number of distinct words whatever the size of the vocabulary.
+    """
+
+    def __init__(self, store, keywords, learn=True):
+        self.store = store
+        self.learn = learn  # Whether new jobs are counted in the document frequencies
+        self.keywords = {}  # term -> weight
+        for keyword, weight in keywords.items():
+            for term in tokenize(keyword):
+                self.keywords[term] = self.keywords.get(term, 0) + float(weight)
+        self.counted = set()  # Jobs of this run already counted in the document frequencies
+        self.lock = threading.Lock()
+
+    def terms(self, item):
+        return Counter(tokenize(f"{item.get('title') or ''} {item.get('description') or ''}"))
+
+    def count(self, item):
+        """Count the words of a job stored for the first time in the document frequencies."""
+        if not self.learn:
+            return
+        with self.lock:
+            if item['_id'] in self.counted:
+                return
+            self.counted.add(item['_id'])
+        self.store.add(self.terms(item))
+
+    def score(self, item):
+        """Return the relevance of a job between 0 and 1."""
+        counts = self.terms(item)
+        if not counts or not self.keywords:
+            return Decimal(0)
+
+        idf = self.store.idf
+        weights = {term: count * idf(term) for term, count in counts.items()}
+        dot = sum(weights[term] * weight * idf(term) for term, weight in self.keywords.items() if term in weights)
+        if not dot:
+            return Decimal(0)
+        norm = math.sqrt(sum(value * value for value in weights.values()))
+        profile_norm = math.sqrt(sum((weight * idf(term)) ** 2 for term, weight in self.keywords.items()))
+        return Decimal(str(round(dot / (norm * profile_norm), 4)))
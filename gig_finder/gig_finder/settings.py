@@ -15,6 +15,7 @@ BOT_NAME = "gig_finder"
 
 SPIDER_MODULES = ["gig_finder.spiders"]
 NEWSPIDER_MODULE = "gig_finder.spiders"
+COMMANDS_MODULE = "gig_finder.commands"
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 USER_AGENT = None
@@ -23,7 +24,10 @@ USER_AGENT = None
 ROBOTSTXT_OBEY = True
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
+# Each tag has its own download slot, so this also caps how many tags are fetched at once. The adaptive
+# throttle paces all the tags together, starting at one request per DOWNLOAD_DELAY, and only raises the
+# rate (up to CONCURRENT_REQUESTS requests per ADAPTIVE_THROTTLE_MIN_DELAY) while the tags stay healthy
+CONCURRENT_REQUESTS = 4
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
@@ -44,9 +48,12 @@ DEFAULT_REQUEST_HEADERS = None
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    "gig_finder.middlewares.GigFinderSpiderMiddleware": 543,
-#}
+SPIDER_MIDDLEWARES = {
+    "gig_finder.middlewares.DuplicateJobCardMiddleware": 543,
+}
+# Jobs listed under several tags are only passed on once; jobs remembered at most
+DEDUP_ENABLED = True
+DEDUP_MAX_ENTRIES = 100000
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
@@ -55,6 +62,7 @@ DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
     'scrapy_fake_useragent.middleware.RandomUserAgentMiddleware': 400,
     'scrapy_fake_useragent.middleware.RetryUserAgentMiddleware': 401,
+    'gig_finder.middlewares.AdaptiveTagThrottleMiddleware': 900,
 }
 
 FAKEUSERAGENT_PROVIDERS = [
@@ -67,19 +75,42 @@ FAKEUSERAGENT_FALLBACK = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "gig_finder.metrics.MetricsDump": 500,
+}
+# Parse, pipeline stage and DynamoDB timings, consumed capacity and throttling are kept in the crawl
+# stats (gig_finder/...). Set "prometheus" or "json" to also write them to METRICS_DUMP_FILE (under
+# the .scrapy data dir, default metrics.prom or metrics.json) when the spider closes; point the
+# node_exporter textfile collector at a .prom file to scrape it.
+METRICS_DUMP_FORMAT = None
+METRICS_DUMP_FILE = None
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
    "gig_finder.pipelines.GigFinderPipeline": 300,
+   "gig_finder.exporters.ParquetExportPipeline": 400,
 }
 
+# Per-tag download slots whose delay and concurrency adapt to latency and 403/429/503 responses.
+# Replaces AutoThrottle, which would otherwise overwrite the slot delays.
+ADAPTIVE_THROTTLE_ENABLED = True
+# Delay bounds of a tag slot; it starts at DOWNLOAD_DELAY
+ADAPTIVE_THROTTLE_MIN_DELAY = 1
+ADAPTIVE_THROTTLE_MAX_DELAY = 60
+# Concurrency a tag slot may reach once its delay is 0 (Scrapy only runs parallel requests in a
+# slot without delay, so it is never raised unless ADAPTIVE_THROTTLE_MIN_DELAY = 0)
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 2
+# Mean latency (seconds) over a window of responses below which a tag speeds up
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2
+ADAPTIVE_THROTTLE_WINDOW = 5
+ADAPTIVE_THROTTLE_HTTP_CODES = [403, 429, 503]
+# New jobs per page of each tag in past runs (under the .scrapy data dir), used to prioritize tags
+TAG_YIELDS_FILE = "tag_yields.json"
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = False
 # The initial download delay
 AUTOTHROTTLE_START_DELAY = 5
 # The maximum download delay to be set in case of high latencies
@@ -96,7 +127,11 @@ HTTPCACHE_ENABLED = False
 HTTPCACHE_EXPIRATION_SECS = 0
 HTTPCACHE_DIR = "httpcache"
 HTTPCACHE_IGNORE_HTTP_CODES = [429]
-HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_STORAGE = "gig_finder.httpcache.PackedCacheStorage"
+# Packs the responses of each crawl date into one zstd compressed file with a SQLite index, see httpcache.py.
+# Replay a cached date with `scrapy crawl freelancer -a replay=YYYY-MM-DD`, even with HTTPCACHE_ENABLED = False.
+# Its jobs go to the scratch table freelancer_replay, or the one given with -a replay_table=<name>
+HTTPCACHE_ZSTD_LEVEL = 9
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
@@ -107,5 +142,92 @@ FEED_EXPORT_ENCODING = "utf-8"
 AWS_REGION = os.getenv('AWS_REGION')
 AWS_ACCESS_KEY = os.getenv('AWS_ACCESS_KEY')
 AWS_SECRET_KEY = os.getenv('AWS_SECRET_KEY')
+# Endpoint of a local DynamoDB (e.g. http://localhost:8000), the AWS one when unset
+DYNAMODB_ENDPOINT_URL = os.getenv('DYNAMODB_ENDPOINT_URL')
+# botocore client of each storage thread: connection pool, retries and timeouts (seconds).
+# Adaptive retries also rate limit the client once DynamoDB starts throttling it.
+DYNAMODB_MAX_POOL_CONNECTIONS = 10
+DYNAMODB_RETRY_MODE = "adaptive"
+DYNAMODB_MAX_ATTEMPTS = 10
+DYNAMODB_CONNECT_TIMEOUT = 5
+DYNAMODB_READ_TIMEOUT = 10
+# "PAY_PER_REQUEST" (on demand) or "PROVISIONED", used for new tables and applied to existing ones at startup.
+# When unset, new tables are created on demand and existing tables keep their billing mode.
+DYNAMODB_BILLING_MODE = None
+# Capacity of provisioned tables and indexes, and the minimum when auto scaling
+DYNAMODB_READ_CAPACITY = 5
+DYNAMODB_WRITE_CAPACITY = 5
+# With provisioned billing, scale between the capacity above and this maximum (0 disables auto scaling),
+# keeping the consumed capacity around DYNAMODB_AUTOSCALING_TARGET percent
+DYNAMODB_AUTOSCALING_MAX_CAPACITY = 0
+DYNAMODB_AUTOSCALING_TARGET = 70
+# Items are read and written in micro-batches (BatchGetItem takes up to 100 keys)
+DYNAMODB_BATCH_SIZE = 100
+# Seconds between flushes of a partial batch (0 disables the periodic flush)
+DYNAMODB_FLUSH_INTERVAL = 5
+# Run DynamoDB calls on a thread pool so the reactor keeps downloading and parsing meanwhile
+DYNAMODB_ASYNC_WRITES = True
+# Batches written concurrently; once all slots are busy the pipeline holds items back
+DYNAMODB_MAX_INFLIGHT_WRITES = 4
+# Times a failed batch is written again, with an exponential backoff, before its items are given up on
+DYNAMODB_WRITE_RETRIES = 3
+# Shards of the sparse index of active items queried when marking offers as ended
+DYNAMODB_ACTIVE_SHARDS = 10
+# Concurrent single-item update_item calls (ended offers, last_seen_at of unchanged items, delta writes)
+DYNAMODB_UPDATE_WORKERS = 8
+# Write stored items back with an UpdateItem of their changed attributes only, conditioned on the
+# last_seen_at they were read with; new items are still batch-put whole
+DYNAMODB_DELTA_WRITES = True
+# Local index of stored items (under the .scrapy data dir) letting unchanged items skip the table read
+LOCAL_INDEX_ENABLED = True
+LOCAL_INDEX_DIR = "local_index"
+# Score each job's title and description against RELEVANCE_KEYWORDS (keyword -> weight) with TF-IDF and store
+# it as relevance_score. Word frequencies of past jobs are kept in RELEVANCE_STORE_FILE under the .scrapy data dir
+RELEVANCE_ENABLED = True
+RELEVANCE_STORE_FILE = "relevance.sqlite"
+# Count the words of newly stored jobs into the frequencies; replays only score with the stored ones
+RELEVANCE_LEARN = True
+RELEVANCE_KEYWORDS = {
+    "python": 1.0,
+    "scraping": 1.0,
+    "scraper": 1.0,
+    "crawler": 1.0,
+    "api": 0.8,
+    "automation": 0.8,
+    "web": 0.5,
+    "data": 0.5,
+}
+# Per tag and day counts (seen, new, ended, hourly, competition, verified) and price quantile sketches, added to
+# the <table>_aggregates table at the end of each crawl and read by `scrapy market`
+MARKET_AGGREGATES_ENABLED = True
+# Relative error of the price quantiles
+MARKET_AGGREGATES_ACCURACY = 0.01
+# With -a incremental=True, stop paginating a tag once this fraction of a page was already stored
+INCREMENTAL_KNOWN_FRACTION = 0.9
+# Jobs listed under a tag whose pagination stopped are not marked as ended, as their later pages were not
+# seen. Incremental crawls still paginate a tag to its end when its last full crawl (logged in
+# FULL_CRAWL_LOG_FILE under the .scrapy data dir) is this many days old, so ended jobs are found up to this
+# many days late. 0 never falls back, which leaves ended detection off for incremental crawls.
+INCREMENTAL_FULL_CRAWL_DAYS = 7
+FULL_CRAWL_LOG_FILE = "full_crawls.json"
+# Where the change records of a job are kept: "inline" appends them to its history list, "table"
+# writes one item per job and day to <table>_history, so routine writes stay small (older inline
+# records move there on the job's next write). `scrapy history <job_url>` prints a job's timeline.
+HISTORY_STORAGE = "inline"
+# Log of the listing pages requested and parsed, so an interrupted crawl can continue with -a resume=True.
+# It lives in the bind-mounted project directory, which update.sh's docker volume prune does not touch.
+CHECKPOINT_ENABLED = True
+CHECKPOINT_DIR = "checkpoints"
+# Category and tag map of the /job/ page (under the .scrapy data dir), used without refetching for
+# CATEGORY_CACHE_TTL seconds and then refetched conditionally
+CATEGORY_CACHE_ENABLED = True
+CATEGORY_CACHE_FILE = "categories.json"
+CATEGORY_CACHE_TTL = 7 * 24 * 3600
+# Parquet copy of the crawled jobs (under the .scrapy data dir), one crawl_date=YYYY-MM-DD directory per day
+PARQUET_EXPORT_ENABLED = True
+PARQUET_EXPORT_DIR = "exports"
+# Rows buffered before a row group is written, which bounds the exporter memory
+PARQUET_ROW_GROUP_SIZE = 10000
+PARQUET_COMPRESSION = "zstd"
 
 LOG_LEVEL = 'INFO'
\ No newline at end of file
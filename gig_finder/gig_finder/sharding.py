@@ -0,0 +1,101 @@
+import datetime
+import hashlib
+import json
+import os
+
+from scrapy.utils.project import data_path
+
+
+def parse_shard(value):
+    """Return the (index, count) of a shard argument such as '2/4', shards being numbered from 0."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected <index>/<count> such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}', the index must be between 0 and {count - 1}")
+    return index, count
+
+
+def hash_shard(tag, count):
+    """Return the shard of a tag by hashing its name, the same in every process unlike hash()."""
+    return int(hashlib.blake2b(tag.encode("utf-8"), digest_size=8).hexdigest(), 16) % count
+
+
+def partition_tags(tags, count, weights=None):
+    """Split tags into `count` lists, by hash or, given weights, balancing the total weight of each list.
+
+    With weights, the heaviest tags are placed first, each on the currently
+    lightest shard, which keeps the heaviest shard within a third of the
+    optimum.
+    """
+    shards = [[] for _ in range(count)]
+    if weights is None:
+        for tag in tags:
+            shards[hash_shard(tag, count)].append(tag)
+        return shards
+
+    loads = [0.0] * count
+    for tag in sorted(tags, key=lambda tag: (-weights[tag], tag)):
+        lightest = min(range(count), key=lambda shard: (loads[shard], shard))
+        shards[lightest].append(tag)
+        loads[lightest] += weights[tag]
+    return shards
+
+
+class ShardRun:
+    """Directory shared by the coordinator and the processes of a sharded crawl.
+
+    Holds `plan.json`, the tags assigned to each shard, and `shard-N.json`,
+    the outcome each shard reports when it closes. It is named relative to the
+    .scrapy data dir, so the same name resolves on the host and in a container
+    mounting the project.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.path = data_path(name, createdir=True)
+        self.plan = None
+        self.assigned = {}  # tag -> shard index
+
+    @classmethod
+    def create(cls, spider_name):
+        started_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+        return cls(os.path.join("shards", f"{spider_name}-{started_at}"))
+
+    @property
+    def plan_path(self):
+        return os.path.join(self.path, "plan.json")
+
+    def report_path(self, index):
+        return os.path.join(self.path, f"shard-{index}.json")
+
+    def save_plan(self, assignments, strategy, today):
+        self.plan = {"date": today, "strategy": strategy, "shards": len(assignments), "assignments": assignments}
+        self.write_json(self.plan_path, self.plan)
+
+    def load_plan(self):
+        with open(self.plan_path, encoding="utf-8") as f:
+            self.plan = json.load(f)
+        self.assigned = {tag: index for index, tags in enumerate(self.plan["assignments"]) for tag in tags}
+        return self.plan
+
+    def shard_of(self, tag):
+        """Return the shard a tag was assigned to, or None for a tag the plan does not know."""
+        return self.assigned.get(tag)
+
+    def save_report(self, index, report):
+        self.write_json(self.report_path(index), report)
+
+    def load_report(self, index):
+        """Return the report of a shard, or None if it never closed."""
+        if not os.path.exists(self.report_path(index)):
+            return None
+        with open(self.report_path(index), encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_json(self, path, data):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temporary_path, path)
@@ -0,0 +1,226 @@
+import datetime
+import gzip
+import json
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from gig_finder.exporters import JOB_SCHEMA, job_row
+
+# Stored jobs also carry the day they were first seen; their history goes to the change log
+SNAPSHOT_JOB_SCHEMA = JOB_SCHEMA.append(pa.field("created_at", pa.date32()))
+
+# One row per tracked field change, with the value the field had before that day
+CHANGE_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("modified_at", pa.date32()),
+    ("field", pa.string()),
+    ("previous_value", pa.string()),  # JSON encoded, tracked fields have different types
+])
+
+
+def json_default(value):
+    """Serialize the Decimal numbers returned by DynamoDB."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def change_rows(item):
+    """Flatten the history of a stored job into one change row per field."""
+    yield from record_change_rows(item["_id"], item.get("history") or [])
+
+
+def record_change_rows(item_id, records):
+    """Flatten change records, inline or from a history table, into one change row per field."""
+    for record in records:
+        for field, previous_value in (record.get("changes") or {}).items():
+            yield {
+                "_id": item_id,
+                "modified_at": record.get("modified_at"),
+                "field": field,
+                "previous_value": json.dumps(previous_value, ensure_ascii=False, default=json_default),
+            }
+
+
+class NdjsonPartWriter:
+    """Gzip compressed newline-delimited JSON part file."""
+
+    extension = "ndjson.gz"
+
+    def __init__(self, path, schema):
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False, default=json_default) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetPartWriter:
+    """Parquet part file, written one row group at a time."""
+
+    extension = "parquet"
+
+    def __init__(self, path, schema, row_group_size=10000):
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        self.rows = []
+
+    def write(self, rows):
+        for row in rows:
+            self.rows.append(job_row(row, self.schema))
+            if len(self.rows) >= self.row_group_size:
+                self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+PART_WRITERS = {"ndjson": NdjsonPartWriter, "parquet": ParquetPartWriter}
+
+
+class TableSnapshot:
+    """Full copy of a jobs table, read with a parallel scan and written segment by segment.
+
+    Each of the `segments` scan segments is read by its own worker and written
+    to `jobs/segment-NNNN-part-NNNNN.<ext>` and, for the flattened history,
+    `changes/segment-NNNN-part-NNNNN.<ext>`. A part is closed every
+    `part_size` items, then the key to continue the segment from is saved in
+    `state/segment-NNNN.json`; only one page and one part buffer per worker are
+    held in memory. Resuming restarts each segment at its last closed part, so
+    an interrupted snapshot neither loses nor duplicates rows.
+
+    A history table (`<table>_history`) holds change records only, which are
+    written to `changes/` alone. Aggregates tables have no Parquet schema and
+    are only copied as NDJSON.
+    """
+
+    def __init__(self, manager, table_name, output_dir, output_format="ndjson", segments=4, page_size=None,
+                 part_size=100000, logger=print):
+        if output_format not in PART_WRITERS:
+            raise ValueError(f"Unknown snapshot format '{output_format}', expected one of {sorted(PART_WRITERS)}")
+        if output_format == "parquet" and table_name.endswith("_aggregates"):
+            raise ValueError(f"{table_name} holds market summaries, not jobs, and can only be copied as NDJSON")
+        self.manager = manager
+        self.table_name = table_name
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.segments = segments
+        self.page_size = page_size
+        self.part_size = part_size
+        self.logger = logger
+        # Rows of a history table are change records, keyed by _id and modified_at
+        self.kinds = ("changes",) if table_name.endswith("_history") else ("jobs", "changes")
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.output_dir, "snapshot.json")
+
+    def state_path(self, segment):
+        return os.path.join(self.output_dir, "state", f"segment-{segment:04d}.json")
+
+    def part_path(self, kind, segment, part):
+        extension = PART_WRITERS[self.output_format].extension
+        return os.path.join(self.output_dir, kind, f"segment-{segment:04d}-part-{part:05d}.{extension}")
+
+    def prepare(self, resume=False):
+        """Create the output directory, or check that the snapshot in it can be resumed."""
+        manifest = {"table": self.table_name, "format": self.output_format, "segments": self.segments}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                existing = json.load(f)
+            if not resume:
+                raise ValueError(f"{self.output_dir} already holds a snapshot, resume it or use another directory")
+            if {key: existing.get(key) for key in manifest} != manifest:
+                raise ValueError(f"The snapshot in {self.output_dir} was taken with other options: {existing}")
+            return existing
+
+        for directory in (*self.kinds, "state"):
+            os.makedirs(os.path.join(self.output_dir, directory), exist_ok=True)
+        manifest["started_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        self.save_json(self.manifest_path, manifest)
+        return manifest
+
+    def run(self, resume=False):
+        """Take (or resume) the snapshot, returning the total (items, changes) written."""
+        self.prepare(resume)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.segments) as executor:
+            results = list(executor.map(self.copy_segment, range(self.segments)))
+        items = sum(result["items"] for result in results)
+        changes = sum(result["changes"] for result in results)
+        self.logger(f"Snapshot of {self.table_name} complete: {items} items and {changes} changes "
+                    f"in {time.perf_counter() - start:.1f}s")
+        return items, changes
+
+    def copy_segment(self, segment):
+        """Copy one scan segment, continuing after its last closed part."""
+        state = self.load_state(segment)
+        if state["done"]:
+            return state
+
+        # Each worker thread gets its own boto3 resource from the manager
+        table = self.manager.get_table(self.table_name)
+        writers = None
+        part_items = 0
+        for items, last_evaluated_key in self.manager.scan_segment(
+            table, segment, self.segments, start_key=state["start_key"], page_size=self.page_size
+        ):
+            if writers is None:
+                writers = self.open_part(segment, state["part"])
+            if "jobs" in writers:
+                # The history goes to the change log only
+                writers["jobs"].write({field: value for field, value in item.items() if field != "history"}
+                                      for item in items)
+                changes = [row for item in items for row in change_rows(item)]
+            else:
+                changes = [row for record in items for row in record_change_rows(record["_id"], [record])]
+            writers["changes"].write(changes)
+            part_items += len(items)
+            state["items"] += len(items)
+            state["changes"] += len(changes)
+
+            if last_evaluated_key is None or part_items >= self.part_size:
+                for writer in writers.values():
+                    writer.close()
+                writers = None
+                part_items = 0
+                state.update(part=state["part"] + 1, start_key=last_evaluated_key, done=last_evaluated_key is None)
+                self.save_json(self.state_path(segment), state)
+
+        self.logger(f"Segment {segment}/{self.segments}: {state['items']} items, {state['changes']} changes")
+        return state
+
+    def open_part(self, segment, part):
+        writer_class = PART_WRITERS[self.output_format]
+        schemas = {"jobs": SNAPSHOT_JOB_SCHEMA, "changes": CHANGE_SCHEMA}
+        return {kind: writer_class(self.part_path(kind, segment, part), schemas[kind]) for kind in self.kinds}
+
+    def load_state(self, segment):
+        path = self.state_path(segment)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return {"part": 0, "start_key": None, "done": False, "items": 0, "changes": 0}
+
+    def save_json(self, path, data):
+        """Write a JSON file, replacing the previous one only once the new one is complete."""
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=json_default)
+        os.replace(temporary_path, path)
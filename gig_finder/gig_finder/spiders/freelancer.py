@@ -1,16 +1,67 @@
 import scrapy
+import datetime
+import hashlib
 import json
+import os
 import re
 
+from scrapy import signals
+from scrapy.utils.project import data_path
+from scrapy.utils.url import url_is_from_any_domain
+from twisted.internet import threads
+
+from gig_finder.categories import CategoryCache, category_cache_path
+from gig_finder.checkpoint import CrawlCheckpoint, FullCrawlLog, checkpoint_path, full_crawl_log_path
+from gig_finder.extractors import extract_job_cards
+from gig_finder.httpcache import CachePack, cache_pack_names, cache_pack_path
+from gig_finder.local_index import LocalItemIndex, local_index_path
+from gig_finder.metrics import Metrics
+from gig_finder.middlewares import TagYieldStore
+from gig_finder.normalizer import BASE_URL, ItemNormalizer
+from gig_finder.sharding import ShardRun, hash_shard, parse_shard
+
 class FreelancerSpider(scrapy.Spider):
     name = 'freelancer'
     start_urls = ['https://www.freelancer.com/job/']
     suffix = "/?status=all" # Show all jobs including closed
 
-    def __init__(self, historical=False, categories=None, *args, **kwargs):
-        """Initialize the spider with the historical flag and categories list."""
+    def __init__(self, historical=False, categories=None, incremental=False, resume=False, shard=None,
+                 shard_run=None, discover_only=False, replay=None, replay_table=None, *args, **kwargs):
+        """Initialize the spider with the historical, incremental and resume flags, categories list and shard."""
         super().__init__(*args, **kwargs)
         self.historical = historical if isinstance(historical, bool) else historical.lower() == 'true'
+        self.incremental = incremental if isinstance(incremental, bool) else incremental.lower() == 'true'
+        self.resume = resume if isinstance(resume, bool) else resume.lower() == 'true'
+        # Only fetches the job categories into the category cache, used by `scrapy crawl_shards`
+        self.discover_only = discover_only if isinstance(discover_only, bool) else discover_only.lower() == 'true'
+        # Crawl only the tags of one shard, e.g. shard=1/4; the tags of a `scrapy crawl_shards` plan when
+        # shard_run names one, otherwise the tags hashing to the shard
+        self.shard = parse_shard(shard) if shard else None
+        self.shard_run = ShardRun(shard_run) if shard_run else None
+        if self.shard_run is not None:
+            if self.shard is None:
+                raise ValueError("shard_run needs the shard argument")
+            self.shard_run.load_plan()
+        # Parse the listing pages cached on a crawl date (YYYY-MM-DD) again, without requesting the site
+        self.replay = replay
+        self.replay_pages = []
+        # DynamoDB table the items are stored in; a replay writes to a scratch table, never the live one
+        self.table_name = (replay_table or f"{self.name}_replay") if replay else self.name
+        # Names the checkpoint and the files of this process, which differ between the shards of a crawl
+        self.run_name = self.name if self.shard is None else f"{self.name}-shard-{self.shard[0]}-of-{self.shard[1]}"
+        self.known_items = None  # Snapshot of the local index taken when the crawl starts
+        self.tag_yields = None
+        self.checkpoint = None
+        self.resumed_pages = []
+        self.category_cache = None
+        self.category_cache_saved = None
+        # A replay stores its jobs as seen on the replayed date
+        self.today = replay or datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        self.stopped_tags = set()  # Tags whose pagination stopped at a known page, their later jobs were not seen
+        self.crawled_tags = set()  # Tags with a listing page parsed by this process
+        self.full_crawls = None
+        self.normalizer = ItemNormalizer()
+        self._metrics = Metrics()
 
         # Log the raw value of categories for debugging
         self.logger.info(f"Raw categories argument: {categories}, Type: {type(categories)}")
@@ -25,13 +76,199 @@ class FreelancerSpider(scrapy.Spider):
         else:
             self.categories_list = []
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.known_fraction = crawler.settings.getfloat("INCREMENTAL_KNOWN_FRACTION", 0.9)
+        if spider.replay:
+            spider.open_replay(crawler.settings)
+            return spider
+        path = local_index_path(crawler.settings, spider.name)
+        if path is not None:
+            spider.known_items = LocalItemIndex(path)
+            spider.known_items.open()
+            spider.known_items.close()  # Entries stay in memory, the pipeline keeps writing the file
+            spider.logger.info(f"{len(spider.known_items)} items known before this crawl")
+        elif spider.incremental:
+            spider.logger.warning("Incremental mode needs LOCAL_INDEX_ENABLED, crawling every page")
+        path = full_crawl_log_path(crawler.settings) if spider.incremental else None
+        if path is not None:
+            spider.full_crawls = FullCrawlLog(path, crawler.settings.getint("INCREMENTAL_FULL_CRAWL_DAYS", 7)).load()
+
+        if crawler.settings.get("TAG_YIELDS_FILE"):
+            # Tags that brought the most new jobs per page in past runs are crawled first
+            spider.tag_yields = TagYieldStore(data_path(crawler.settings.get("TAG_YIELDS_FILE"))).load()
+
+        path = category_cache_path(crawler.settings)
+        if path is not None:
+            spider.category_cache = CategoryCache(path, crawler.settings.getint("CATEGORY_CACHE_TTL", 7 * 24 * 3600)).load()
+
+        path = checkpoint_path(crawler.settings, spider.run_name)
+        if path is not None and not spider.discover_only:
+            spider.open_checkpoint(path)
+            # Listing pages filtered out before the download are finished too, or the crawl would look interrupted
+            crawler.signals.connect(spider.page_scheduled, signal=signals.request_scheduled)
+            crawler.signals.connect(spider.page_dropped, signal=signals.request_dropped)
+        elif spider.resume:
+            spider.logger.warning("Resuming needs CHECKPOINT_ENABLED, starting a new crawl")
+        return spider
+
+    @property
+    def metrics(self):
+        """Metrics recorded in the crawl stats, bound on first use since Scrapy creates the stats after the spider."""
+        stats = getattr(getattr(self, "crawler", None), "stats", None)
+        if self._metrics.stats is not stats:
+            self._metrics = Metrics(stats)
+        return self._metrics
+
+    def open_replay(self, settings):
+        """Serve every request from the packed HTTP cache of the replayed date, queuing its listing pages.
+
+        The items go through the pipelines as in a crawl of the replayed date,
+        into the scratch table `table_name` and a Parquet export directory of
+        their own. The local index, word frequencies, tag yields and checkpoint
+        of the live crawls are left untouched and no job is marked as ended.
+        """
+        pack_names = cache_pack_names(settings, self.name, self.replay)
+        if not pack_names:
+            raise ValueError(f"No cached responses of {self.replay} in "
+                             f"{os.path.dirname(cache_pack_path(settings, self.name, self.replay))}")
+        settings.set("HTTPCACHE_ENABLED", True, priority="spider")
+        settings.set("HTTPCACHE_STORAGE", "gig_finder.httpcache.PackedCacheStorage", priority="spider")
+        settings.set("HTTPCACHE_IGNORE_MISSING", True, priority="spider")
+        settings.set("HTTPCACHE_EXPIRATION_SECS", 0, priority="spider")
+        # The local index describes the live table and the word frequencies already count the replayed jobs
+        settings.set("LOCAL_INDEX_ENABLED", False, priority="spider")
+        settings.set("RELEVANCE_LEARN", False, priority="spider")
+        settings.set("PARQUET_EXPORT_DIR", f"{settings.get('PARQUET_EXPORT_DIR', 'exports')}_replay", priority="spider")
+        # The shards of a sharded crawl each cached their pages in a pack of their own
+        for name in pack_names:
+            pack = CachePack(cache_pack_path(settings, self.name, name)).open()
+            try:
+                self.replay_pages.extend(pack.listing_pages())
+            finally:
+                pack.close()
+        self.replay_pages = list(dict.fromkeys(self.replay_pages))
+        self.logger.info(f"Replaying {len(self.replay_pages)} listing pages cached on {self.replay} "
+                         f"into the table {self.table_name}")
+
+    def open_checkpoint(self, path):
+        """Start logging the listing pages of this crawl, picking up an unfinished one when resuming."""
+        self.checkpoint = CrawlCheckpoint(path, self.logger)
+        # Only a crawl of the same day and arguments is resumed, so the items it stored still count as seen today
+        crawl = {"date": self.today, "historical": self.historical, "categories": self.categories_list,
+                 "shard": list(self.shard) if self.shard else None,
+                 "shard_run": self.shard_run.name if self.shard_run else None}
+        if not self.checkpoint.open(crawl, resume=self.resume):
+            return
+
+        self.stopped_tags.update(self.checkpoint.stopped_tags)
+
+        if self.known_items is not None:
+            reopened = self.checkpoint.reopen_unstored_pages(self.is_stored_today)
+            if reopened:
+                self.logger.info(f"Fetching {reopened} finished pages again, some of their jobs were not stored")
+        self.resumed_pages = self.checkpoint.pending()
+        highest_pages = ", ".join(f"{tag}: {page}" for tag, page in sorted(self.checkpoint.highest_pages().items()))
+        self.logger.info(f"Resuming the crawl with {len(self.resumed_pages)} pending pages "
+                         f"(highest finished page per tag: {highest_pages or 'none'})")
+
+    def is_stored_today(self, item_id):
+        """Check in the local index snapshot whether a job was stored by a crawl of today."""
+        entry = self.known_items.get(f"{BASE_URL}{item_id}")
+        return entry is not None and entry[1] == self.today
+
+    def start_requests(self):
+        if self.replay:
+            # Every cached page is queued at once, their next pages are not followed
+            for url, tag in self.replay_pages:
+                yield scrapy.Request(url, callback=self.parse_job_tag, errback=self.page_failed, meta={"tag": tag})
+            return
+        if self.category_cache is not None and self.category_cache.is_fresh():
+            self.logger.info(f"Using the {len(self.category_cache.categories)} cached tags "
+                             f"instead of fetching the job categories")
+            self.crawler.stats.inc_value("gig_finder/categories/cache_fresh")
+            if not self.discover_only:
+                yield from self.follow_categories(self.category_cache.categories)
+        else:
+            headers = self.category_cache.conditional_headers() if self.category_cache is not None else {}
+            for url in self.start_urls:
+                yield scrapy.Request(url, headers=headers, meta={"handle_httpstatus_list": [304]}, dont_filter=True)
+        # The frontier of the interrupted crawl; pages it already requested are not followed again
+        for url, tag in self.resumed_pages:
+            yield scrapy.Request(url, callback=self.parse_job_tag, errback=self.page_failed,
+                                 meta={"tag": tag}, priority=self.tag_priority(tag))
+
+    def closed(self, reason):
+        if self.shard_run is not None:
+            # Read by the coordinator, which marks the unseen items as ended only if every shard is complete
+            self.shard_run.save_report(self.shard[0], {
+                "shard": self.shard[0],
+                "shards": self.shard[1],
+                "reason": reason,
+                "complete": reason == "finished" and not self.interrupted,
+                "stopped_tags": sorted(self.stopped_tags),
+            })
+        if self.full_crawls is not None and reason == "finished" and not self.interrupted:
+            # Tags crawled to their last page; a resumed crawl only counts the tags it parsed itself
+            self.full_crawls.save(self.crawled_tags - self.stopped_tags, self.today)
+        if self.checkpoint is not None:
+            self.checkpoint.close(complete=reason == "finished")
+        # Scrapy waits for the category cache to be written before exiting
+        return self.category_cache_saved
+
     def parse(self, response):
         """Parse the main page and process job categories."""
-        # Extract category data
-        category_data = self.extract_categories(response)
+        with self.metrics.timer("parse", callback="parse"):
+            category_data = self.discover_categories(response)
+        if not self.discover_only:
+            yield from self.follow_categories(category_data)
+
+    def discover_categories(self, response):
+        """Return the categories of the main page, reusing the cached ones when the page did not change."""
+        if self.category_cache is None:
+            return self.extract_categories(response)
+
+        cache = self.category_cache
+        content_hash = hashlib.blake2b(response.body, digest_size=16).hexdigest()
+        if response.status == 304 or (cache.categories and content_hash == cache.content_hash):
+            self.logger.info("The job categories did not change, using the cached tags")
+            self.crawler.stats.inc_value("gig_finder/categories/not_modified")
+            cache.touch()
+        else:
+            categories = self.extract_categories(response)
+            if not categories and cache.categories:
+                self.logger.warning("No job categories found on the main page, using the cached tags")
+                return cache.categories
+            added, removed = cache.update(
+                categories,
+                etag=response.headers.get("ETag", b"").decode() or None,
+                last_modified=response.headers.get("Last-Modified", b"").decode() or None,
+                content_hash=content_hash,
+            )
+            self.report_category_changes(added, removed)
 
+        # Written on a worker thread, away from the reactor
+        self.category_cache_saved = threads.deferToThread(cache.save).addErrback(
+            lambda failure: self.logger.error(f"Could not save the category cache: {failure.getErrorMessage()}")
+        )
+        return cache.categories
+
+    def report_category_changes(self, added, removed):
+        """Log the tags added to and removed from the site since the previous category fetch."""
+        self.crawler.stats.set_value("gig_finder/categories/tags_added", len(added))
+        self.crawler.stats.set_value("gig_finder/categories/tags_removed", len(removed))
+        for tag in added:
+            self.logger.info(f"New tag: {tag}")
+        for tag in removed:
+            self.logger.info(f"Removed tag: {tag}")
+        if added or removed:
+            self.logger.info(f"{len(added)} tags added and {len(removed)} removed since the last category fetch")
+
+    def follow_categories(self, category_data):
+        """Request the first and last listing pages of each selected category tag."""
         # Process each category one by one
-        for category in category_data: 
+        for category in category_data:
             category_title = category['category']
             tag_link = category['tag_link']
 
@@ -39,6 +276,8 @@ class FreelancerSpider(scrapy.Spider):
                 # Ensure category_title is not None and filter correctly
                 if not category_title or not any(category_title.startswith(prefix) for prefix in self.categories_list):
                     continue
+            if self.shard is not None and self.shard_of(category['tag']) != self.shard[0]:
+                continue
 
             # Log the category being processed
             self.logger.info(f"Processing category: {category_title} at {tag_link}")
@@ -48,8 +287,11 @@ class FreelancerSpider(scrapy.Spider):
             full_link_finish = self.format_url(tag_link + "20")  # Skip "1X" pages
 
             # Follow both starting and ending pages
-            yield response.follow(full_link_start, callback=self.parse_job_tag)
-            yield response.follow(full_link_finish, callback=self.parse_job_tag)
+            priority = self.tag_priority(category['tag'])
+            for link in (full_link_start, full_link_finish):
+                request = self.follow_page(link, category['tag'], priority)
+                if request is not None:
+                    yield request
 
     def extract_categories(self, response):
         """Extract links associated with each category and return as a list of dictionaries."""
@@ -76,12 +318,83 @@ class FreelancerSpider(scrapy.Spider):
                         "tag_link": response.urljoin(tag_link.strip())
                     })
 
-        # Save the extracted category data to a JSON file
-        with open('categories.json', 'w', encoding='utf-8') as f:
-            json.dump(category_data, f, ensure_ascii=False, indent=4)
-
         return category_data
     
+    def shard_of(self, tag):
+        """Return the shard crawling a tag; tags added to the site since the plan was made are hashed."""
+        shard = self.shard_run.shard_of(tag) if self.shard_run is not None else None
+        return hash_shard(tag, self.shard[1]) if shard is None else shard
+
+    @property
+    def partial_crawl(self):
+        """Whether some listing pages are skipped, so unseen items must not be marked as ended.
+
+        Tags whose pagination stopped at a known page do not make the crawl
+        partial, the pipeline only spares the jobs listed under them.
+        """
+        # A shard sees only its own tags, the coordinator marks the items no shard saw
+        return self.shard is not None or self.discover_only or bool(self.replay) or self.interrupted
+
+    @property
+    def interrupted(self):
+        """Whether some listing pages of the selected tags were not crawled."""
+        # Pages still pending when the spider closes belong to an interrupted crawl
+        return self.checkpoint is not None and bool(self.checkpoint.pending())
+
+    def follow_page(self, url, tag, priority):
+        """Return the request of a listing page, or None if the checkpoint shows this crawl already requested it."""
+        # Later pages keep the tag, which selects their download slot, and its priority
+        request = scrapy.Request(url, callback=self.parse_job_tag, errback=self.page_failed,
+                                 meta={"tag": tag}, priority=priority)
+        if self.checkpoint is not None and not self.checkpoint.record_request(request.url, tag):
+            return None
+        return request
+
+    def page_failed(self, failure):
+        """Record a listing page that could not be fetched, such as a missing last page, as finished."""
+        self.logger.info(f"Could not fetch {failure.request.url}: {failure.getErrorMessage()}")
+        if self.checkpoint is not None:
+            self.checkpoint.record_page(self.requested_url(failure.request))
+
+    def page_scheduled(self, request, spider):
+        """Record a listing page the offsite filter drops when it is scheduled as finished."""
+        allowed_domains = getattr(self, "allowed_domains", None)
+        if ("tag" in request.meta and allowed_domains and not request.dont_filter
+                and not url_is_from_any_domain(request.url, allowed_domains)):
+            self.checkpoint.record_page(self.requested_url(request))
+
+    def page_dropped(self, request, spider):
+        """Record a listing page the duplicate filter dropped, such as one redirected to a seen page, as finished."""
+        # follow_page never schedules a URL twice, so the page was fetched under another URL or by the redirect target
+        if "tag" in request.meta:
+            self.checkpoint.record_page(self.requested_url(request))
+
+    def requested_url(self, request):
+        """Return the URL a listing page was requested with, before any redirect."""
+        return request.meta.get("redirect_urls", [request.url])[0]
+
+    def is_known_page(self, job_cards):
+        """Check whether enough of the stored jobs on a listing page were already stored before this run."""
+        # The days-left countdown in the status changes daily, so a known job is not required to match its
+        # last stored digest; the pipeline still records the changes of the jobs on this page.
+        stored_ids = [f"{BASE_URL}{card['_id']}" for card in job_cards if not self.normalizer.is_private(card)]
+        if not stored_ids:
+            return False
+
+        known = sum(1 for item_id in stored_ids if self.known_items.get(item_id) is not None)
+        self.crawler.stats.inc_value("gig_finder/incremental/known_cards", known)
+        return known / len(stored_ids) >= self.known_fraction
+
+    def full_crawl_due(self, tag):
+        """Check whether an incremental crawl has to paginate a tag to its end, so its ended jobs are found."""
+        return self.full_crawls is not None and self.full_crawls.is_due(tag, self.today)
+
+    def tag_priority(self, tag):
+        """Return the request priority of a tag from its expected new jobs per page."""
+        if self.tag_yields is None:
+            return 0
+        return int(self.tag_yields.expected_yield(tag) * 10)
+
     def format_url(self, url):
         """Format URL based on historical flag."""
         return url.rstrip('/') + self.suffix if self.historical else url
@@ -94,26 +407,34 @@ class FreelancerSpider(scrapy.Spider):
 
     def parse_job_tag(self, response):
         """Extract all job cards"""
-        job_cards = response.xpath('//div[contains(@class, "JobSearchCard-item-inner")]')
-        
-        for job_card in job_cards:
-            yield {
-                "_id": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-heading-link")]/@href').get(),
-                "title": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-heading-link")]/text()').get(),
-                "description": job_card.xpath('.//p[contains(@class, "JobSearchCard-primary-description")]/text()').get(),
-                "status": job_card.xpath('.//span[contains(@class, "JobSearchCard-primary-heading-days")]/text()').get(),
-                "tag_links": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-tagsLink")]/@href').getall(),
-                "tags": job_card.xpath('.//a[contains(@class, "JobSearchCard-primary-tagsLink")]/text()').getall(),
-                "price": job_card.xpath('.//div[contains(@class, "JobSearchCard-primary-price")]/text()').get(),
-                "offers": job_card.xpath('.//div[contains(@class, "JobSearchCard-secondary-entry")]/text()').get(),
-                "types": job_card.xpath('.//span[contains(@class, "promotion-tag")]/text()').getall(),
-                "verified_payment": bool(job_card.xpath('.//div[contains(@class, "JobSearchCard-primary-heading-status")]')),      
-            }
-
-        next_page = response.xpath('//a[@rel="next" and contains(@class, "Pagination-item")]/@href').get()
-        if next_page:
-            yield response.follow(self.format_url(next_page), callback=self.parse_job_tag)
-        else:
-            last_page = response.xpath('//a[contains(@class, "Pagination-item") and text()="Last"]/@href').get()
-            if last_page:
-                yield response.follow(self.format_url(last_page), callback=self.parse_job_tag)
\ No newline at end of file
+        # Timed apart from the yields, during which the pipelines process the cards
+        with self.metrics.timer("parse", callback="parse_job_tag"):
+            job_cards = extract_job_cards(response.selector.root)
+            # Checked before yielding, since the pipeline normalizes the cards in place
+            tag = response.meta.get("tag")
+            self.crawled_tags.add(tag)
+            known_page = (self.incremental and not self.historical and not self.replay and self.known_items is not None
+                          and not self.full_crawl_due(tag) and self.is_known_page(job_cards))
+            stored_ids = [card['_id'] for card in job_cards if not self.normalizer.is_private(card)]
+        yield from job_cards
+
+        if known_page:
+            self.logger.info(f"Stopping pagination at {response.url}, its jobs are already stored")
+            self.crawler.stats.inc_value("gig_finder/incremental/pagination_stopped")
+            if tag not in self.stopped_tags:
+                self.stopped_tags.add(tag)
+                if self.checkpoint is not None:
+                    self.checkpoint.record_stopped_tag(tag)
+        elif not self.replay:  # A replay queues every cached page from the start
+            next_page = response.xpath('//a[@rel="next" and contains(@class, "Pagination-item")]/@href').get()
+            if not next_page:
+                next_page = response.xpath('//a[contains(@class, "Pagination-item") and text()="Last"]/@href').get()
+            if next_page:
+                request = self.follow_page(response.urljoin(self.format_url(next_page)), tag,
+                                           response.request.priority)
+                if request is not None:
+                    yield request
+
+        # Logged after the next page was requested, so a crash in between fetches this page again
+        if self.checkpoint is not None:
+            self.checkpoint.record_page(self.requested_url(response.request), stored_ids)
\ No newline at end of file
@@ -5,4 +5,4 @@
 
 # Run the spider for specific categories without historical data
 /usr/local/bin/docker-compose -f /home/ec2-user/Gig-finder/docker-compose.yml run gig_finder \
-    scrapy crawl freelancer -a categories='["Websites", "Data", "Artificial"]' -a historical=True
\ No newline at end of file
+    scrapy crawl freelancer -a categories='["Websites", "Data", "Artificial"]' -a historical=True -a resume=True
\ No newline at end of file
@@ -3,6 +3,8 @@
 # Run the update script
 /home/ec2-user/Gig-finder/scripts/update.sh
 
-# Run the spider for specific categories without historical data
+# Run the spider for specific categories without historical data. Incremental crawls stop paginating a tag
+# at a page of stored jobs and crawl each tag to its end once every INCREMENTAL_FULL_CRAWL_DAYS days, so
+# ended jobs are marked up to that many days late.
 /usr/local/bin/docker-compose -f /home/ec2-user/Gig-finder/docker-compose.yml run gig_finder \
-    scrapy crawl freelancer -a categories='["Websites", "Data", "Artificial"]' -a historical=False
\ No newline at end of file
+    scrapy crawl freelancer -a categories='["Websites", "Data", "Artificial"]' -a historical=False -a incremental=True -a resume=True
\ No newline at end of file